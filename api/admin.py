@@ -1,13 +1,91 @@
 
 
+from typing import Optional
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db.models import Count, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 from . import models
 
 
+COUNT_LIMIT = getattr(settings, 'API_ADMIN_COUNT_LIMIT', 10_000)
+
+BEFORE_VAR = 'before'
+AFTER_VAR = 'after'
+
+
+# counting a history table runs through every row, so past the limit the count stops at the limit
+class CappedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return self.object_list[:COUNT_LIMIT].count()
+
+
+def keyset_page(queryset: QuerySet, per_page: int, before: Optional[int] = None,
+                after: Optional[int] = None) -> tuple[list, bool, bool]:
+    # the page of rows right after (older than) or right before (newer than) the given id, newest first, and
+    # whether there are newer and older rows around it
+    if after is not None:
+        rows = list(queryset.filter(pk__gt=after).order_by("pk")[:per_page + 1])
+        return rows[:per_page][::-1], len(rows) > per_page, True
+    if before is not None:
+        queryset = queryset.filter(pk__lt=before)
+    rows = list(queryset.order_by("-pk")[:per_page + 1])
+    return rows[:per_page], before is not None, len(rows) > per_page
+
+
+class KeysetChangeList(ChangeList):
+    # pages through a history table newest first by id: the next page is the rows past the id of the last row
+    # shown, which the primary key index finds at once where OFFSET steps over every row of the pages before it,
+    # so the oldest page costs what the first does. ids follow insertion, which for the rides is the order they
+    # started in: keying on (started_at, id) instead would need an index of its own on every ride table, paid on
+    # every insert. sorted by a column header the list falls back to numbered pages over the capped count
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in (BEFORE_VAR, AFTER_VAR):
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.keyset = ORDER_VAR not in self.params and not self.show_all
+        if not self.keyset:
+            return
+        try:
+            before, after = (
+                int(self.params[name]) if name in self.params else None for name in (BEFORE_VAR, AFTER_VAR)
+            )
+        except ValueError:
+            raise IncorrectLookupParameters
+        rows, newer, older = keyset_page(self.queryset, self.list_per_page, before, after)
+        self.result_list = rows
+        self.multi_page = False
+        self.newer_url = self.get_query_string({AFTER_VAR: rows[0].pk, BEFORE_VAR: None}) if rows and newer else None
+        self.older_url = self.get_query_string({BEFORE_VAR: rows[-1].pk, AFTER_VAR: None}) if rows and older else None
+
+
+class HistoryAdmin(admin.ModelAdmin):
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    ordering = ("-id",)
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
 @admin.register(models.Client)
 class ClientAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("id", "username", "email", "rating", "is_staff")
+    list_filter = ("is_staff",)
+    search_fields = ("=username", "=email")
+    paginator = CappedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(models.TransportType)
@@ -22,17 +100,34 @@ class TransportClassAdmin(admin.ModelAdmin):
 
 @admin.register(models.TransportModel)
 class TransportModelAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("name", "type", "classification", "transports")
+    list_select_related = ("type", "classification")
+    search_fields = ("name",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(transports_count=Count("transport"))
+
+    @admin.display(ordering="transports_count")
+    def transports(self, obj):
+        return obj.transports_count
 
 
 @admin.register(models.Transport)
 class TransportAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("registry_number", "model", "parking", "fuel")
+    list_select_related = ("model", "parking")
+    list_filter = ("model",)
+    search_fields = ("=registry_number",)
+    autocomplete_fields = ("parking",)
+    paginator = CappedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(models.ParkingStation)
 class ParkingStationAdmin(admin.ModelAdmin):
-    pass
+    # occupancy is the counter kept by move_transport, no per-row count is needed
+    list_display = ("short_name", "address", "occupancy", "max_cars", "latitude", "longitude")
+    search_fields = ("short_name", "address")
 
 
 @admin.register(models.Plan)
@@ -41,15 +136,103 @@ class PlansAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.RentPeriod)
-class RentPeriodAdmin(admin.ModelAdmin):
-    pass
+class RentPeriodAdmin(HistoryAdmin):
+    list_display = ("id", "client", "plan", "started_at", "finished_at", "fine_overtime")
+    list_select_related = ("client", "plan")
+    list_filter = (("finished_at", admin.EmptyFieldListFilter), ("updated_at", admin.DateFieldListFilter))
+    raw_id_fields = ("client",)
 
 
 @admin.register(models.RentPeriodCarUsage)
-class RentPeriodCarUsageAdmin(admin.ModelAdmin):
-    pass
+class RentPeriodCarUsageAdmin(HistoryAdmin):
+    list_display = ("id", "period", "transport", "starting_station", "started_at", "finishing_station", "finished_at")
+    list_select_related = ("period", "transport__model", "starting_station", "finishing_station")
+    list_filter = (("finished_at", admin.EmptyFieldListFilter), ("finished_at", admin.DateFieldListFilter))
+    raw_id_fields = ("period", "transport")
+    autocomplete_fields = ("starting_station", "finishing_station")
+
+
+@admin.register(models.ArchivedRentPeriod)
+class ArchivedRentPeriodAdmin(HistoryAdmin):
+    list_display = ("id", "client", "plan", "started_at", "finished_at", "fine_overtime")
+    list_select_related = ("client", "plan")
+    list_filter = (("finished_at", admin.DateFieldListFilter),)
+    raw_id_fields = ("client",)
+
+
+@admin.register(models.ArchivedRentPeriodCarUsage)
+class ArchivedRentPeriodCarUsageAdmin(HistoryAdmin):
+    list_display = ("id", "period", "transport", "starting_station", "started_at", "finishing_station", "finished_at")
+    list_select_related = ("period", "transport__model", "starting_station", "finishing_station")
+    list_filter = (("finished_at", admin.DateFieldListFilter),)
+    raw_id_fields = ("period", "transport")
+    autocomplete_fields = ("starting_station", "finishing_station")
 
 
 @admin.register(models.CompanyAccounting)
-class CompanyAccountingAdmin(admin.ModelAdmin):
-    pass
+class CompanyAccountingAdmin(HistoryAdmin):
+    list_display = ("id", "created_at", "category", "amount", "description", "transport", "parking_station")
+    list_select_related = ("transport__model", "parking_station")
+    list_filter = ("category", ("created_at", admin.DateFieldListFilter))
+    raw_id_fields = ("transport",)
+    autocomplete_fields = ("parking_station",)
+
+    # the rollups only ever add entries up, corrections are booked as new entries
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.BillingRun)
+class BillingRunAdmin(HistoryAdmin):
+    list_display = ("id", "started_at", "finished_at", "fined_periods", "billed_periods")
+
+
+@admin.register(models.ArchiveRun)
+class ArchiveRunAdmin(HistoryAdmin):
+    list_display = ("id", "started_at", "finished_at", "cutoff", "archived_periods", "archived_usages")
+
+
+@admin.register(models.AccountingRollup)
+class AccountingRollupAdmin(HistoryAdmin):
+    list_display = ("period", "period_start", "category", "parking_station", "income", "expense", "net")
+    list_select_related = ("parking_station",)
+    list_filter = ("period", "category")
+
+    # sums of the ledger, rebuilt from it with manage.py rebuild_rollups
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class RebalancingMoveInline(admin.TabularInline):
+    model = models.RebalancingMove
+    raw_id_fields = ("from_station", "to_station")
+    extra = 0
+
+
+@admin.register(models.RebalancingPlan)
+class RebalancingPlanAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "created_by", "moved_transports", "unresolved_overflow", "unresolved_shortage")
+    list_select_related = ("created_by",)
+    inlines = [RebalancingMoveInline]
+
+
+@admin.register(models.RebalancingMove)
+class RebalancingMoveAdmin(admin.ModelAdmin):
+    list_display = ("id", "plan", "from_station", "to_station", "model", "count", "completed_at")
+    list_select_related = ("plan", "from_station", "to_station", "model")
+    list_filter = ("plan",)
+    raw_id_fields = ("from_station", "to_station")
+    actions = ["mark_completed"]
+
+    @admin.action(description="Mark selected moves as completed")
+    def mark_completed(self, request, queryset):
+        queryset.filter(completed_at__isnull=True).update(completed_at=timezone.now())
@@ -0,0 +1,142 @@
+
+
+import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Exists, Max, OuterRef, QuerySet
+from django.utils import timezone
+
+from .models import (ArchivedRentPeriod, ArchivedRentPeriodCarUsage, ArchiveRun, BillingRun, RentPeriod,
+                     RentPeriodCarUsage)
+
+
+ARCHIVE_AFTER = datetime.timedelta(days=getattr(settings, 'API_ARCHIVE_AFTER_DAYS', 90))
+BATCH_SIZE = getattr(settings, 'API_ARCHIVE_BATCH_SIZE', 1000)
+
+
+class HotAndArchived:
+    # the same queryset calls go to a hot table and to its archive, and the rows come back as one UNION ALL.
+    # both tables name their fields and relations alike, so filters may follow relations; the union is meant
+    # for values()/values_list(), ordering and slicing go on it. without an archive only the hot table is read
+    def __init__(self, hot: QuerySet, archived: Optional[QuerySet]):
+        self.hot = hot
+        self.archived = archived
+
+    def _chain(name: str):
+        def method(self, *args, **kwargs):
+            return HotAndArchived(
+                getattr(self.hot, name)(*args, **kwargs),
+                getattr(self.archived, name)(*args, **kwargs) if self.archived is not None else None,
+            )
+        return method
+
+    filter = _chain('filter')
+    exclude = _chain('exclude')
+    annotate = _chain('annotate')
+    alias = _chain('alias')
+    values = _chain('values')
+    values_list = _chain('values_list')
+    del _chain
+
+    def union(self) -> QuerySet:
+        if self.archived is None:
+            return self.hot
+        return self.hot.order_by().union(self.archived.order_by(), all=True)
+
+    def count(self) -> int:
+        return self.hot.count() + (self.archived.count() if self.archived is not None else 0)
+
+    def exists(self) -> bool:
+        return self.hot.exists() or self.archived is not None and self.archived.exists()
+
+
+def archived_before() -> Optional[datetime.datetime]:
+    # every archived rental finished before the cutoff of the run that moved it
+    return ArchiveRun.objects.aggregate(cutoff=Max('cutoff'))['cutoff']
+
+
+def _archive(queryset: QuerySet, finished_since: Optional[datetime.datetime]) -> Optional[QuerySet]:
+    # an archive that cannot hold a rental finished since that moment is left out of the query: a filter it has
+    # no match for would still make every page of a keyset scan read all of it
+    if finished_since is not None:
+        cutoff = archived_before()
+        if cutoff is None or cutoff <= finished_since:
+            return None
+    return queryset
+
+
+def rent_periods(finished_since: Optional[datetime.datetime] = None) -> HotAndArchived:
+    # finished_since only prunes the archive, the caller still filters for what it needs
+    return HotAndArchived(RentPeriod.objects.all(), _archive(ArchivedRentPeriod.objects.all(), finished_since))
+
+
+def rides(finished_since: Optional[datetime.datetime] = None) -> HotAndArchived:
+    return HotAndArchived(
+        RentPeriodCarUsage.objects.all(), _archive(ArchivedRentPeriodCarUsage.objects.all(), finished_since)
+    )
+
+
+def archivable_periods(cutoff: datetime.datetime, billed_before: datetime.datetime) -> QuerySet:
+    # finished before the cutoff, seen by a billing run since their last change and with any fine billed, so
+    # nothing writes to them any more
+    return RentPeriod.objects.filter(
+        finished_at__lt=cutoff, updated_at__lt=billed_before,
+    ).exclude(
+        fine_overtime__gt=0, fine_billed_at__isnull=True,
+    ).exclude(
+        Exists(RentPeriodCarUsage.objects.filter(period=OuterRef('pk'), finished_at__isnull=True)),
+    )
+
+
+def _move(hot: type[models.Model], archive: type[models.Model], column: str, ids: list[int]) -> int:
+    # INSERT ... SELECT, the rows never pass through python; the archive tables have the columns of the hot ones
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in archive._meta.concrete_fields)
+    condition = f'{quote(column)} IN ({", ".join(["%s"] * len(ids))})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(archive._meta.db_table)} ({columns}) '
+            f'SELECT {columns} FROM {quote(hot._meta.db_table)} WHERE {condition}', ids,
+        )
+        cursor.execute(f'DELETE FROM {quote(hot._meta.db_table)} WHERE {condition}', ids)
+        return cursor.rowcount
+
+
+def archive_rentals(older_than: datetime.timedelta = ARCHIVE_AFTER, batch_size: int = BATCH_SIZE,
+                    max_batches: Optional[int] = None, now: Optional[datetime.datetime] = None) -> ArchiveRun:
+    # every batch is its own transaction and records how far the run got, so a run that is stopped, fails or
+    # hits max_batches is picked up by the next call with its original cutoff
+    now = now or timezone.now()
+    run = ArchiveRun.unfinished() or ArchiveRun.objects.create(started_at=now, cutoff=now - older_than)
+    last_billing = BillingRun.last_finished()
+    if last_billing is None:
+        # without a billing run no finished period is known to be billed
+        return run
+
+    periods = archivable_periods(run.cutoff, last_billing.started_at).order_by('id').values_list('id', flat=True)
+    # rides whose period was deleted have nothing left to bill
+    orphans = RentPeriodCarUsage.objects.filter(
+        period__isnull=True, finished_at__lt=run.cutoff
+    ).order_by('id').values_list('id', flat=True)
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            ids = list(periods.filter(id__gt=run.last_period_id)[:batch_size])
+            if ids:
+                run.archived_usages += _move(RentPeriodCarUsage, ArchivedRentPeriodCarUsage, 'period_id', ids)
+                run.archived_periods += _move(RentPeriod, ArchivedRentPeriod, 'id', ids)
+                run.last_period_id = ids[-1]
+            else:
+                ids = list(orphans.filter(id__gt=run.last_usage_id)[:batch_size])
+                if not ids:
+                    run.finished_at = timezone.now()
+                    run.save()
+                    return run
+                run.archived_usages += _move(RentPeriodCarUsage, ArchivedRentPeriodCarUsage, 'id', ids)
+                run.last_usage_id = ids[-1]
+            run.save()
+        batches += 1
+    return run
@@ -0,0 +1,36 @@
+
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.db import transaction
+
+from .cache import get_cache
+
+
+CACHE_TIMEOUT = getattr(settings, 'API_CLIENT_CACHE_TIMEOUT', 300)
+
+
+def _key(client_id) -> str:
+    return f'api:client:{client_id}'
+
+
+def forget(client_id: int):
+    # dropped right away and again after the commit, so a request that read the old row in between does not
+    # leave it cached
+    cache = get_cache()
+    cache.delete(_key(client_id))
+    transaction.on_commit(lambda: cache.delete(_key(client_id)), robust=True)
+
+
+class CachedModelBackend(ModelBackend):
+    # every authenticated request loads its client by the id kept in the session, the row is cached instead;
+    # the cache hands out a fresh copy each time, so per-request state like the ride state is never shared
+    def get_user(self, user_id):
+        cache = get_cache()
+        user = cache.get(_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(_key(user_id), user, CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in getattr(settings, 'API_SQLITE_PRAGMAS', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # a transaction that reads before it writes, like taking a car, cannot wait for the write lock once it
+        # holds a snapshot: sqlite fails it with "database is locked" at once, whatever the busy timeout.
+        # taking the lock up front makes it wait its turn instead
+        self.cursor().execute('BEGIN IMMEDIATE')
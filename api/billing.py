@@ -0,0 +1,87 @@
+
+
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, Func, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BillingRun, CompanyAccounting, Plan, RentPeriod, RentPeriodCarUsage
+
+
+FINE_PER_MINUTE = getattr(settings, 'OVERTIME_FINE_PER_MINUTE', 10)
+
+
+class SecondsBetween(Func):
+    arity = 2
+    output_field = IntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='CAST(ROUND(EXTRACT(EPOCH FROM (%(expressions)s))) AS INTEGER)',
+            arg_joiner=' - ', **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='CAST(ROUND((julianday(%(expressions)s)) * 86400) AS INTEGER)',
+            arg_joiner=') - julianday(', **extra_context
+        )
+
+
+def overtime_seconds(now: datetime):
+    time_min = Subquery(Plan.objects.filter(pk=OuterRef('plan_id')).values('time_min'))
+    ended_at = Coalesce(F('finished_at'), Value(now, output_field=DateTimeField()))
+    return SecondsBetween(ended_at, F('started_at')) - time_min * 60
+
+
+def fine_overdue_periods(now: Optional[datetime] = None, since: Optional[datetime] = None, full: bool = False,
+                         batch_size: int = 1000) -> BillingRun:
+    now = now or timezone.now()
+    run = BillingRun.objects.create(started_at=now)
+    if since is None and not full:
+        last_run = BillingRun.last_finished()
+        since = last_run.started_at if last_run else None
+
+    # open periods keep accruing, so they are always revisited; finished ones only when touched since the last run
+    candidates = Q(finished_at__isnull=True)
+    if since is not None:
+        candidates |= Q(updated_at__gte=since)
+    else:
+        candidates |= Q(finished_at__isnull=False, fine_billed_at__isnull=True)
+
+    # every started minute of overtime is fined
+    fine = (overtime_seconds(now) + 59) / 60 * FINE_PER_MINUTE
+
+    with transaction.atomic():
+        run.fined_periods = RentPeriod.objects.filter(candidates, plan__isnull=False).annotate(
+            overtime=overtime_seconds(now)
+        ).filter(overtime__gt=0).update(fine_overtime=fine)
+
+        finishing_station = Subquery(
+            RentPeriodCarUsage.objects.filter(period=OuterRef('pk')).order_by('-id').values('finishing_station')[:1]
+        )
+        billable = RentPeriod.objects.filter(
+            finished_at__isnull=False, fine_billed_at__isnull=True, fine_overtime__gt=0
+        ).annotate(finishing_station=finishing_station).order_by('id').values_list(
+            'id', 'fine_overtime', 'finishing_station'
+        )
+        last_id = 0
+        while batch := list(billable.filter(id__gt=last_id)[:batch_size]):
+            CompanyAccounting.objects.bulk_create([
+                CompanyAccounting(
+                    amount=fine, description=f"Overtime fine, rent period #{period_id}",
+                    category=CompanyAccounting.CATEGORY_FINE, parking_station_id=parking_station_id,
+                )
+                for period_id, fine, parking_station_id in batch
+            ])
+            RentPeriod.objects.filter(id__in=[period_id for period_id, _, _ in batch]).update(fine_billed_at=now)
+            run.billed_periods += len(batch)
+            last_id = batch[-1][0]
+
+        run.finished_at = timezone.now()
+        run.save()
+    return run
@@ -0,0 +1,272 @@
+
+
+import hashlib
+import time
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from . import serialization
+from .inventory import abuild_station_inventory, build_station_inventory
+from .models import ParkingStation, Transport
+
+
+CACHE_TIMEOUT = getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+STATION_IDS_KEY = 'api:inventory:stations'
+PLANS_VERSION_KEY = 'api:plans:v'
+HITS_KEY = 'api:stats:hits'
+MISSES_KEY = 'api:stats:misses'
+
+
+# caches answered without I/O: a call costs less than the thread the async methods of django's backends run it in
+IN_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+async def _acall(name: str, *args):
+    # any other cache goes over the network, its calls must not hold up the event loop
+    cache = get_cache()
+    if isinstance(cache, IN_PROCESS_CACHES):
+        return getattr(cache, name)(*args)
+    return await getattr(cache, f'a{name}')(*args)
+
+
+def _station_version_key(station_id: int) -> str:
+    return f'api:inventory:station:{station_id}:v'
+
+
+def _new_version() -> int:
+    # versions start from the clock so an evicted version key never resurrects stale payloads
+    return time.time_ns()
+
+
+def _incr(key: str, delta: int = 1):
+    cache = get_cache()
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+async def _aincr(key: str, delta: int = 1):
+    try:
+        await _acall('incr', key, delta)
+    except ValueError:
+        if not await _acall('add', key, delta, None):
+            await _acall('incr', key, delta)
+
+
+def _get_versions(keys: list[str]) -> dict[str, int]:
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            if not cache.add(key, version, None):
+                missing[key] = cache.get(key, version)
+        versions.update(missing)
+    return versions
+
+
+async def _aget_versions(keys: list[str]) -> dict[str, int]:
+    versions = await _acall('get_many', keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            if not await _acall('add', key, version, None):
+                missing[key] = await _acall('get', key, version)
+        versions.update(missing)
+    return versions
+
+
+def _bump_now(keys: list[str]):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def _bump(keys: Iterable[str]):
+    # bumped right away, so the writing transaction reads its own changes, and again after the commit: a read
+    # that ran in between built the rows from before the commit and cached them under the first bump
+    keys = list(keys)
+    _bump_now(keys)
+    transaction.on_commit(lambda: _bump_now(keys), robust=True)
+
+
+def bump_stations(station_ids: Iterable[int]):
+    _bump(_station_version_key(station_id) for station_id in set(station_ids) if station_id is not None)
+
+
+def bump_station_list():
+    cache = get_cache()
+    cache.delete(STATION_IDS_KEY)
+    transaction.on_commit(lambda: cache.delete(STATION_IDS_KEY), robust=True)
+
+
+def bump_stations_with_models(model_ids: Iterable[int]):
+    bump_stations(
+        Transport.objects.filter(model_id__in=list(model_ids), parking__isnull=False)
+        .values_list('parking_id', flat=True).distinct()
+    )
+
+
+def bump_plans():
+    _bump([PLANS_VERSION_KEY])
+
+
+def _station_ids_query():
+    return ParkingStation.objects.order_by('id').values_list('id', flat=True)
+
+
+# the async variants reach the cache through _acall
+
+
+def _get_station_ids() -> list[int]:
+    cache = get_cache()
+    station_ids = cache.get(STATION_IDS_KEY)
+    if station_ids is None:
+        station_ids = list(_station_ids_query())
+        cache.set(STATION_IDS_KEY, station_ids, CACHE_TIMEOUT)
+    return station_ids
+
+
+async def _aget_station_ids() -> list[int]:
+    station_ids = await _acall('get', STATION_IDS_KEY)
+    if station_ids is None:
+        station_ids = [station_id async for station_id in _station_ids_query()]
+        await _acall('set', STATION_IDS_KEY, station_ids, CACHE_TIMEOUT)
+    return station_ids
+
+
+def _station_version_keys(station_ids: list[int]) -> list[str]:
+    return [_station_version_key(station_id) for station_id in station_ids]
+
+
+def _inventory_version(station_ids: list[int], versions: dict[str, int]) -> str:
+    token = ','.join(f'{station_id}:{versions[_station_version_key(station_id)]}' for station_id in station_ids)
+    return hashlib.sha1(token.encode()).hexdigest()
+
+
+def station_inventory_version() -> str:
+    station_ids = _get_station_ids()
+    return _inventory_version(station_ids, _get_versions(_station_version_keys(station_ids)))
+
+
+async def astation_inventory_version() -> str:
+    station_ids = await _aget_station_ids()
+    return _inventory_version(station_ids, await _aget_versions(_station_version_keys(station_ids)))
+
+
+def plans_version() -> str:
+    return str(_get_versions([PLANS_VERSION_KEY])[PLANS_VERSION_KEY])
+
+
+async def aplans_version() -> str:
+    return str((await _aget_versions([PLANS_VERSION_KEY]))[PLANS_VERSION_KEY])
+
+
+def _payload_keys(station_ids: list[int], versions: dict[str, int]) -> dict[int, str]:
+    return {
+        station_id: f'api:inventory:station:{station_id}:{versions[_station_version_key(station_id)]}'
+        for station_id in station_ids
+    }
+
+
+def _cached_inventory(station_ids: list[int]) -> tuple[dict, dict, list[int]]:
+    payload_keys = _payload_keys(station_ids, _get_versions(_station_version_keys(station_ids)))
+    payloads = get_cache().get_many(payload_keys.values())
+    missing = [station_id for station_id in station_ids if payload_keys[station_id] not in payloads]
+
+    _incr(HITS_KEY, len(station_ids) - len(missing))
+    if missing:
+        _incr(MISSES_KEY, len(missing))
+    return payload_keys, payloads, missing
+
+
+async def _acached_inventory(station_ids: list[int]) -> tuple[dict, dict, list[int]]:
+    payload_keys = _payload_keys(station_ids, await _aget_versions(_station_version_keys(station_ids)))
+    payloads = await _acall('get_many', payload_keys.values())
+    missing = [station_id for station_id in station_ids if payload_keys[station_id] not in payloads]
+
+    await _aincr(HITS_KEY, len(station_ids) - len(missing))
+    if missing:
+        await _aincr(MISSES_KEY, len(missing))
+    return payload_keys, payloads, missing
+
+
+def _merge_inventory(station_ids: list[int], payload_keys: dict, payloads: dict, built: dict) -> list[dict]:
+    payloads.update(built)
+    return [payloads[payload_keys[station_id]] for station_id in station_ids if payload_keys[station_id] in payloads]
+
+
+def get_station_inventory(station_ids: Optional[list[int]] = None) -> list[dict]:
+    station_ids = _get_station_ids() if station_ids is None else station_ids
+    payload_keys, payloads, missing = _cached_inventory(station_ids)
+    built = {payload_keys[station["id"]]: station for station in build_station_inventory(missing)} if missing else {}
+    if built:
+        get_cache().set_many(built, CACHE_TIMEOUT)
+    return _merge_inventory(station_ids, payload_keys, payloads, built)
+
+
+async def aget_station_inventory(station_ids: Optional[list[int]] = None) -> list[dict]:
+    station_ids = await _aget_station_ids() if station_ids is None else station_ids
+    payload_keys, payloads, missing = await _acached_inventory(station_ids)
+    built = {
+        payload_keys[station["id"]]: station for station in await abuild_station_inventory(missing)
+    } if missing else {}
+    if built:
+        await _acall('set_many', built, CACHE_TIMEOUT)
+    return _merge_inventory(station_ids, payload_keys, payloads, built)
+
+
+def _plans_key(version: str) -> str:
+    return f'api:plans:{version}'
+
+
+def get_plans() -> list[dict]:
+    key = _plans_key(plans_version())
+    plans = get_cache().get(key)
+    _incr(HITS_KEY if plans is not None else MISSES_KEY)
+    if plans is None:
+        plans = [serialization.plan(row) for row in serialization.plans_queryset()]
+        get_cache().set(key, plans, CACHE_TIMEOUT)
+    return plans
+
+
+async def aget_plans() -> list[dict]:
+    key = _plans_key(await aplans_version())
+    plans = await _acall('get', key)
+    await _aincr(HITS_KEY if plans is not None else MISSES_KEY)
+    if plans is None:
+        plans = [serialization.plan(row) async for row in serialization.plans_queryset()]
+        await _acall('set', key, plans, CACHE_TIMEOUT)
+    return plans
+
+
+def warm():
+    get_station_inventory()
+    get_plans()
+
+
+def get_stats() -> dict:
+    stats = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {
+        "hits": stats.get(HITS_KEY, 0),
+        "misses": stats.get(MISSES_KEY, 0),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
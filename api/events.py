@@ -0,0 +1,148 @@
+
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import ParkingStation
+
+
+HISTORY = getattr(settings, 'API_EVENTS_HISTORY', 1000)
+HEARTBEAT = getattr(settings, 'API_EVENTS_HEARTBEAT', 15)
+
+# tells the client that events were missed and it has to reload available_transport
+RESET_FRAME = 'event: reset\ndata: {}\n\n'
+HEARTBEAT_FRAME = ': keep-alive\n\n'
+
+
+class Event:
+    def __init__(self, id: int, station_id: int, data: dict):
+        self.id = id
+        self.station_id = station_id
+        # encoded once, however many subscribers it is sent to
+        self.frame = f'id: {id}\nevent: station\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class InMemoryBackend:
+    def __init__(self, history: int = HISTORY):
+        self.events = deque(maxlen=history)
+        self.lock = threading.Lock()
+        # ids start from the clock, so ids handed out before a restart are never mistaken for new ones
+        self.last_id = time.time_ns() // 1000
+
+    def append(self, items: Iterable[tuple[int, dict]]) -> list[Event]:
+        with self.lock:
+            events = []
+            for station_id, data in items:
+                self.last_id += 1
+                events.append(Event(self.last_id, station_id, data))
+            self.events.extend(events)
+            return events
+
+    def since(self, last_id: int) -> Optional[list[Event]]:
+        # None when the events after last_id are no longer (or were never) kept
+        with self.lock:
+            if last_id > self.last_id:
+                return None
+            first_id = self.events[0].id if self.events else self.last_id + 1
+            if last_id < first_id - 1:
+                return None
+            return list(itertools.islice(self.events, last_id - first_id + 1, None))
+
+
+class Broadcaster:
+    def __init__(self, backend: Optional[InMemoryBackend] = None):
+        self.backend = backend or InMemoryBackend()
+        self.condition = threading.Condition()
+        self.async_waiters = set()
+
+    @property
+    def last_id(self) -> int:
+        return self.backend.last_id
+
+    def publish(self, items: Iterable[tuple[int, dict]]) -> list[Event]:
+        events = self.backend.append(items)
+        with self.condition:
+            self.condition.notify_all()
+            for loop, wakeup in list(self.async_waiters):
+                loop.call_soon_threadsafe(wakeup.set)
+        return events
+
+    def publish_inventory(self, pairs: Iterable[tuple[int, int]]):
+        items = []
+        for station_id, model_id in sorted(pairs):
+            row = ParkingStation.objects.filter(id=station_id).annotate(
+                count=Count('transport', filter=Q(transport__model_id=model_id))
+            ).values_list('occupancy', 'count').first()
+            if row is not None:
+                occupancy, count = row
+                items.append((station_id, {
+                    "stationId": station_id, "modelId": model_id, "count": count, "occupancy": occupancy,
+                }))
+        if items:
+            self.publish(items)
+
+    def _read(self, last_id: int, station_ids: Optional[set[int]]) -> tuple[str, int]:
+        events = self.backend.since(last_id)
+        if events is None:
+            return RESET_FRAME, self.last_id
+        frames = ''.join(
+            event.frame for event in events if station_ids is None or event.station_id in station_ids
+        )
+        return frames, events[-1].id if events else last_id
+
+    def stream(self, last_id: Optional[int] = None, station_ids: Optional[Iterable[int]] = None,
+               heartbeat: float = HEARTBEAT) -> Iterator[str]:
+        # blocks a thread per subscriber, only meant for WSGI deployments
+        last_id = self.last_id if last_id is None else last_id
+        station_ids = set(station_ids) if station_ids is not None else None
+        yield 'retry: 3000\n\n'
+        while True:
+            with self.condition:
+                frames, last_id = self._read(last_id, station_ids)
+                if not frames and not self.condition.wait(heartbeat):
+                    frames = HEARTBEAT_FRAME
+            if frames:
+                yield frames
+
+    async def astream(self, last_id: Optional[int] = None, station_ids: Optional[Iterable[int]] = None,
+                      heartbeat: float = HEARTBEAT) -> AsyncIterator[str]:
+        last_id = self.last_id if last_id is None else last_id
+        station_ids = set(station_ids) if station_ids is not None else None
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self.condition:
+            self.async_waiters.add(waiter)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                wakeup.clear()
+                frames, last_id = self._read(last_id, station_ids)
+                if not frames:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), heartbeat)
+                        continue
+                    except TimeoutError:
+                        frames = HEARTBEAT_FRAME
+                yield frames
+        finally:
+            with self.condition:
+                self.async_waiters.discard(waiter)
+
+
+broadcaster = Broadcaster()
+
+
+def inventory_changed(pairs: Iterable[tuple[Optional[int], int]]):
+    pairs = {(station_id, model_id) for station_id, model_id in pairs if station_id is not None}
+    if pairs:
+        # rolled back rides must not be announced, and the counts are only final once committed
+        transaction.on_commit(lambda: broadcaster.publish_inventory(pairs), robust=True)
@@ -0,0 +1,106 @@
+
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from . import archive
+
+
+RIDE_FIELDS = {
+    "id": "id",
+    "periodId": "period_id",
+    "clientId": "period__client_id",
+    "clientUsername": "period__client__username",
+    "plan": "period__plan__name",
+    "transportId": "transport_id",
+    "registryNumber": "transport__registry_number",
+    "model": "transport__model__name",
+    "startedAt": "started_at",
+    "finishedAt": "finished_at",
+    "startingStationId": "starting_station_id",
+    "startingStation": "starting_station__short_name",
+    "finishingStationId": "finishing_station_id",
+    "finishingStation": "finishing_station__short_name",
+}
+
+FORMATS = ("ndjson", "csv")
+# a client's own history leaves out who the client is
+HISTORY_FIELDS = {field: path for field, path in RIDE_FIELDS.items() if not field.startswith("client")}
+
+
+def iter_rides(
+        started_from: Optional[datetime] = None,
+        started_to: Optional[datetime] = None,
+        station_ids: Optional[Iterable[int]] = None,
+        chunk_size: int = 2000,
+) -> Iterator[dict]:
+    # a ride that started after a moment finished after it as well
+    rides = archive.rides(finished_since=started_from)
+    if started_from is not None:
+        rides = rides.filter(started_at__gte=started_from)
+    if started_to is not None:
+        rides = rides.filter(started_at__lt=started_to)
+    if station_ids is not None:
+        station_ids = list(station_ids)
+        rides = rides.filter(Q(starting_station_id__in=station_ids) | Q(finishing_station_id__in=station_ids))
+    rides = rides.values_list(*RIDE_FIELDS.values())
+
+    # keyset pagination: every page is a short indexed range scan of both tables, merged in id order, no matter
+    # how deep into the history it is
+    last_id = 0
+    while True:
+        page = 0
+        for row in rides.filter(id__gt=last_id).union().order_by("id")[:chunk_size].iterator(chunk_size=chunk_size):
+            page += 1
+            last_id = row[0]
+            yield dict(zip(RIDE_FIELDS, row))
+        if page < chunk_size:
+            return
+
+
+def client_history(client_id: int, before_id: Optional[int] = None, limit: int = 20) -> list[dict]:
+    # newest first, the next page is the one before the last id of this page
+    rides = archive.rides().filter(period__client_id=client_id)
+    if before_id is not None:
+        rides = rides.filter(id__lt=before_id)
+    rows = rides.values_list(*HISTORY_FIELDS.values()).union().order_by("-id")[:limit]
+    return [dict(zip(HISTORY_FIELDS, row)) for row in rows]
+
+
+def _chunked(lines: Iterable[str], chunk_size: int = 64 * 1024) -> Iterator[str]:
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def _ndjson_lines(rides: Iterable[dict]) -> Iterator[str]:
+    for ride in rides:
+        yield json.dumps(ride, cls=DjangoJSONEncoder) + "\n"
+
+
+def _csv_lines(rides: Iterable[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(RIDE_FIELDS))
+    writer.writeheader()
+    for ride in rides:
+        writer.writerow(ride)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render(rides: Iterable[dict], export_format: str) -> Iterator[str]:
+    return _chunked(_csv_lines(rides) if export_format == "csv" else _ndjson_lines(rides))
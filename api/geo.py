@@ -0,0 +1,222 @@
+
+
+import heapq
+import math
+import threading
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import _acall, aget_station_inventory, get_cache
+from .models import ParkingStation
+
+
+CELL_DEGREES = getattr(settings, 'API_GEO_CELL_DEGREES', 0.02)
+KM_PER_DEGREE = 111.195
+EARTH_RADIUS_KM = 6371.0
+
+VERSION_KEY = 'api:geo:v'
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# a uniform lat/lon grid of the stations that have coordinates
+class StationIndex:
+    def __init__(self, cell_degrees: float = CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.lock = threading.Lock()
+        self.version = None
+        self._replace({}, {})
+
+    def _replace(self, cells: dict, positions: dict):
+        # readers keep iterating the grid they started with, writers swap in a new one
+        bounds = (
+            min((x for x, _ in cells), default=0), max((x for x, _ in cells), default=0),
+            min((y for _, y in cells), default=0), max((y for _, y in cells), default=0),
+        )
+        self.grid = (cells, bounds)
+        self.positions = positions
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def load(self, rows, version=None):
+        cells, positions = {}, {}
+        for station_id, latitude, longitude in rows:
+            positions[station_id] = (latitude, longitude)
+            cells.setdefault(self._cell(latitude, longitude), {})[station_id] = (latitude, longitude)
+        with self.lock:
+            self._replace(cells, positions)
+            self.version = version
+
+    def update(self, station_id: int, latitude: Optional[float], longitude: Optional[float]):
+        with self.lock:
+            cells, positions = dict(self.grid[0]), dict(self.positions)
+            if station_id in positions:
+                cell = self._cell(*positions.pop(station_id))
+                cells[cell] = {key: value for key, value in cells[cell].items() if key != station_id}
+                if not cells[cell]:
+                    del cells[cell]
+            if latitude is not None and longitude is not None:
+                positions[station_id] = (latitude, longitude)
+                cell = self._cell(latitude, longitude)
+                cells[cell] = {**cells.get(cell, {}), station_id: (latitude, longitude)}
+            self._replace(cells, positions)
+
+    def _ring_cells(self, x: int, y: int, ring: int) -> Iterator[tuple[int, int]]:
+        if ring == 0:
+            yield x, y
+            return
+        for dx in range(-ring, ring + 1):
+            yield x + dx, y - ring
+            yield x + dx, y + ring
+        for dy in range(-ring + 1, ring):
+            yield x - ring, y + dy
+            yield x + ring, y + dy
+
+    def _ring_distance_km(self, latitude: float, ring: int) -> float:
+        # no station outside the first `ring` rings is closer than this; a degree of longitude shrinks towards
+        # the poles, so the narrowest latitude that the next ring reaches is used
+        farthest_latitude = min(90.0, abs(latitude) + (ring + 1) * self.cell_degrees)
+        return ring * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(farthest_latitude))
+
+    def iter_nearest(self, latitude: float, longitude: float) -> Iterator[tuple[float, int]]:
+        # (distance in km, station id), nearest first, scanning rings of cells around the point
+        cells, (min_x, max_x, min_y, max_y) = self.grid
+        if not cells:
+            return
+        x, y = self._cell(latitude, longitude)
+        last_ring = max(x - min_x, max_x - x, y - min_y, max_y - y)
+
+        candidates = []
+        for ring in range(last_ring + 1):
+            if 8 * ring > len(cells):
+                # far away from (or in a sparse corner of) the grid, walking empty rings would cost more
+                # than taking every remaining station at once
+                ring_cells = [cell for cell in cells if max(abs(cell[0] - x), abs(cell[1] - y)) >= ring]
+                bound = math.inf
+            else:
+                ring_cells = self._ring_cells(x, y, ring)
+                bound = self._ring_distance_km(latitude, ring)
+            for cell in ring_cells:
+                for station_id, (station_latitude, station_longitude) in cells.get(cell, {}).items():
+                    distance = haversine_km(latitude, longitude, station_latitude, station_longitude)
+                    heapq.heappush(candidates, (distance, station_id))
+            while candidates and candidates[0][0] <= bound:
+                yield heapq.heappop(candidates)
+            if bound == math.inf:
+                return
+        while candidates:
+            yield heapq.heappop(candidates)
+
+
+index = StationIndex()
+
+
+def _version() -> int:
+    return get_cache().get_or_set(VERSION_KEY, 0, None)
+
+
+async def _aversion() -> int:
+    return await _acall('get_or_set', VERSION_KEY, 0, None)
+
+
+def invalidate():
+    # other processes notice the new version on their next search and reload their index
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def station_changed(station_id: int, latitude: Optional[float], longitude: Optional[float]):
+    def apply():
+        version = _version()
+        invalidate()
+        # applied in place only when no other process changed a station in between, otherwise reloaded
+        if index.version == version:
+            index.update(station_id, latitude, longitude)
+            index.version = version + 1
+
+    transaction.on_commit(apply, robust=True)
+
+
+def _located_stations():
+    return ParkingStation.objects.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+        'id', 'latitude', 'longitude'
+    )
+
+
+def refresh():
+    version = _version()
+    if index.version != version:
+        index.load(_located_stations(), version)
+
+
+async def arefresh():
+    version = await _aversion()
+    if index.version != version:
+        index.load([row async for row in _located_stations()], version)
+
+
+def _matches(models: list[dict], model_id, transport_type_id, transport_class_id, minimal_rating) -> list[dict]:
+    return [
+        model for model in models
+        if (model_id is None or model["id"] == model_id)
+        and (transport_type_id is None or model["type"]["id"] == transport_type_id)
+        and (transport_class_id is None or model["classification"]["id"] == transport_class_id)
+        and (minimal_rating is None or model["classification"]["minimalRating"] <= minimal_rating)
+    ]
+
+
+async def anearest_stations(
+        latitude: float,
+        longitude: float,
+        limit: int = 5,
+        max_distance_km: Optional[float] = None,
+        model_id: Optional[int] = None,
+        transport_type_id: Optional[int] = None,
+        transport_class_id: Optional[int] = None,
+        minimal_rating: Optional[int] = None,
+) -> list[dict]:
+    await arefresh()
+    nearest = index.iter_nearest(latitude, longitude)
+    # availability comes from the cached per-station inventory, a few candidates at a time
+    batch_size = max(2 * limit, 16)
+    result = []
+    while len(result) < limit:
+        batch = []
+        for distance, station_id in nearest:
+            if max_distance_km is not None and distance > max_distance_km:
+                break
+            batch.append((distance, station_id))
+            if len(batch) == batch_size:
+                break
+        if not batch:
+            break
+        inventories = {
+            station["id"]: station for station in await aget_station_inventory([station_id for _, station_id in batch])
+        }
+        for distance, station_id in batch:
+            station = inventories.get(station_id)
+            if station is None:
+                continue
+            models = _matches(
+                station["availableModels"], model_id, transport_type_id, transport_class_id, minimal_rating
+            )
+            if models:
+                result.append({**station, "distanceKm": round(distance, 3), "availableModels": models})
+                if len(result) == limit:
+                    break
+        if len(batch) < batch_size:
+            break
+    return result
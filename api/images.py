@@ -0,0 +1,130 @@
+
+
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from . import cache
+
+
+# variant name -> the box its longest side is fitted into, images are never scaled up
+VARIANTS = getattr(settings, 'API_IMAGE_VARIANTS', {'thumbnail': 240, 'medium': 960})
+FORMATS = getattr(settings, 'API_IMAGE_FORMATS', ('webp', 'jpeg'))
+WORKERS = getattr(settings, 'API_IMAGE_WORKERS', 2)
+
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+EXTENSIONS = {'jpeg': 'jpg'}
+VARIANTS_DIRECTORY = 'transport_images/variants'
+
+logger = logging.getLogger('api.images')
+
+# pillow lets go of the GIL while it decodes, resizes and encodes, so a few threads keep up with the uploads
+# of the admin without holding up its requests
+executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='image-variants')
+
+
+def _storage():
+    return apps.get_model('api', 'TransportModel')._meta.get_field('image').storage
+
+
+def _encodable(image: Image.Image, image_format: str) -> Image.Image:
+    has_alpha = image.mode in ('RGBA', 'LA') or image.mode == 'P' and 'transparency' in image.info
+    if image_format == 'jpeg' and has_alpha:
+        # JPEG has no transparency, transparent parts turn white like on the page
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def render(name: str) -> dict:
+    # every variant of one image in every format, saved next to the originals. a JPEG is decoded at the
+    # smallest scale still bigger than the largest variant, and every variant is resized from the one before
+    storage = _storage()
+    largest = max(VARIANTS.values())
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    variants = {}
+    for variant, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        files = {}
+        for image_format in FORMATS:
+            content = io.BytesIO()
+            _encodable(image, image_format).save(content, image_format.upper(), **SAVE_OPTIONS.get(image_format, {}))
+            extension = EXTENSIONS.get(image_format, image_format)
+            files[image_format] = storage.save(
+                f'{VARIANTS_DIRECTORY}/{stem}-{variant}.{extension}', ContentFile(content.getvalue())
+            )
+        variants[variant] = {'width': image.width, 'height': image.height, 'files': files}
+    return variants
+
+
+def delete(variants: dict):
+    storage = _storage()
+    for entry in variants.values():
+        for name in entry['files'].values():
+            storage.delete(name)
+
+
+def generate(model_id: int, name: str) -> Optional[dict]:
+    # None when the file is missing or the model got another image in the meantime; the job of that one
+    # writes its own variants
+    TransportModel = apps.get_model('api', 'TransportModel')
+    if not name or not _storage().exists(name):
+        return None
+    variants = render(name)
+    with transaction.atomic():
+        previous = TransportModel.objects.select_for_update().filter(id=model_id, image=name).values_list(
+            'image_variants', flat=True
+        ).first()
+        if previous is None:
+            delete(variants)
+            return None
+        TransportModel.objects.filter(id=model_id).update(image_variants=variants)
+    delete(previous)
+    cache.bump_stations_with_models([model_id])
+    return variants
+
+
+def _generate_in_background(model_id: int, name: str) -> Optional[dict]:
+    try:
+        return generate(model_id, name)
+    except Exception:
+        logger.exception("Variants of image %s of transport model %s could not be generated", name, model_id)
+        return None
+    finally:
+        # worker threads outlive requests, nothing else closes their connections
+        connection.close()
+
+
+def schedule(model_id: int, name: str):
+    # resized once the save is committed, the admin answers without waiting for it
+    transaction.on_commit(lambda: executor.submit(_generate_in_background, model_id, name))
+
+
+def schedule_delete(variants: dict):
+    if variants:
+        transaction.on_commit(lambda: executor.submit(delete, variants))
+
+
+def backfill(rows: Iterable[tuple[int, str]], workers: int = WORKERS) -> list[Optional[dict]]:
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants') as pool:
+        return list(pool.map(lambda row: _generate_in_background(*row), rows))
@@ -0,0 +1,68 @@
+
+
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from django.db.models import Count
+
+from . import serialization
+from .models import ParkingStation, Transport, TransportModel
+
+
+def _inventory_querysets(
+        station_ids: Optional[Iterable[int]] = None,
+        transport_type_id: Optional[int] = None,
+        transport_class_id: Optional[int] = None,
+        minimal_rating: Optional[int] = None,
+):
+    stations = ParkingStation.objects.order_by('id').values(*serialization.STATION_FIELDS)
+    transports = Transport.objects.filter(parking__isnull=False)
+    if station_ids is not None:
+        station_ids = list(station_ids)
+        stations = stations.filter(id__in=station_ids)
+        transports = transports.filter(parking_id__in=station_ids)
+    if transport_type_id is not None:
+        transports = transports.filter(model__type_id=transport_type_id)
+    if transport_class_id is not None:
+        transports = transports.filter(model__classification_id=transport_class_id)
+    if minimal_rating is not None:
+        transports = transports.filter(model__classification__minimal_rating__lte=minimal_rating)
+
+    # one (station id, model id, count) row per station and model, tuples are much cheaper to fetch than dicts
+    rows = transports.values('parking_id', 'model_id').annotate(count=Count('id')).order_by(
+        'parking_id', 'model_id'
+    ).values_list('parking_id', 'model_id', 'count')
+    return stations, rows
+
+
+def _models(rows: list[tuple]):
+    return TransportModel.objects.filter(
+        id__in={model_id for _, model_id, _ in rows}
+    ).values(*serialization.TRANSPORT_MODEL_FIELDS)
+
+
+def _assemble(stations: Iterable[dict], rows: list[tuple], models: Iterable[dict]) -> list[dict]:
+    counts = defaultdict(list)
+    for station_id, model_id, count in rows:
+        counts[station_id].append((model_id, count))
+    models_by_id = serialization.transport_models(models)
+
+    return [
+        serialization.station(station, [
+            {**models_by_id[model_id], "count": count} for model_id, count in counts[station['id']]
+        ])
+        for station in stations
+    ]
+
+
+def build_station_inventory(*args, **kwargs) -> list[dict]:
+    stations, rows = _inventory_querysets(*args, **kwargs)
+    rows = list(rows)
+    return _assemble(stations, rows, _models(rows))
+
+
+async def abuild_station_inventory(*args, **kwargs) -> list[dict]:
+    stations, rows = _inventory_querysets(*args, **kwargs)
+    rows = [row async for row in rows]
+    models = [model async for model in _models(rows)]
+    return _assemble([station async for station in stations], rows, models)
@@ -0,0 +1,44 @@
+
+
+import threading
+from contextlib import ContextDecorator
+
+from django.apps import apps
+from django.conf import settings
+
+
+MAX_BUFFERED_ENTRIES = getattr(settings, 'LEDGER_MAX_BUFFERED_ENTRIES', 500)
+
+_local = threading.local()
+
+
+class batch(ContextDecorator):
+    def __enter__(self):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        if _local.depth == 1:
+            _local.entries = []
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        _local.depth -= 1
+        if _local.depth == 0:
+            if exc_type is None:
+                flush()
+            else:
+                _local.entries = []
+        return False
+
+
+def record(entry):
+    if not getattr(_local, 'depth', 0):
+        entry.save()
+        return
+    _local.entries.append(entry)
+    if len(_local.entries) >= MAX_BUFFERED_ENTRIES:
+        flush()
+
+
+def flush():
+    entries, _local.entries = getattr(_local, 'entries', []), []
+    if entries:
+        apps.get_model('api', 'CompanyAccounting').objects.bulk_create(entries)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = "Moves finished, billed rent periods and their rides into the archive tables in resumable batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=float, default=archive.ARCHIVE_AFTER.days,
+                            help="Archive rentals finished at least this many days ago, ignored when resuming")
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches, the next run resumes")
+
+    def handle(self, *args, **options):
+        run = archive.archive_rentals(
+            timedelta(days=options["older_than_days"]), options["batch_size"], options["max_batches"]
+        )
+        state = "finished" if run.finished_at else "to be resumed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {run.archived_periods} period(s) and {run.archived_usages} ride(s) finished before "
+            f"{run.cutoff:%Y-%m-%d %H:%M}, run #{run.id} {state}"
+        ))
@@ -0,0 +1,42 @@
+
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api import export
+
+
+def aware_datetime(value: str):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = "Streams ride history (car usages with stations, transport, client and plan) as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=export.FORMATS, default="ndjson", dest="export_format")
+        parser.add_argument("--from", type=aware_datetime, dest="started_from", help="Rides started at or after")
+        parser.add_argument("--to", type=aware_datetime, dest="started_to", help="Rides started before")
+        parser.add_argument("--station", type=int, action="append", dest="stations",
+                            help="Starting or finishing parking station id, can be repeated")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("-o", "--output", help="Output file (stdout by default)")
+
+    def handle(self, *args, **options):
+        rides = export.iter_rides(
+            options["started_from"], options["started_to"], options["stations"], options["chunk_size"]
+        )
+        chunks = export.render(rides, options["export_format"])
+        if not options["output"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        try:
+            with open(options["output"], "w", newline="") as output:
+                output.writelines(chunks)
+        except OSError as e:
+            raise CommandError(e)
@@ -0,0 +1,21 @@
+
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from api.billing import fine_overdue_periods
+
+
+class Command(BaseCommand):
+    help = "Computes overtime fines for overdue rent periods and books them as company income"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=parse_datetime, help="Revisit periods changed since this moment")
+        parser.add_argument("--full", action="store_true", help="Revisit every unbilled period, ignoring previous runs")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        run = fine_overdue_periods(since=options["since"], full=options["full"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Fined {run.fined_periods} period(s), booked {run.billed_periods} fine(s) as income"
+        ))
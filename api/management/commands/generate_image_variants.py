@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api import images
+from api.models import TransportModel
+
+
+class Command(BaseCommand):
+    help = "Generates the resized variants of transport model images that have none yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Regenerate the variants of every image")
+        parser.add_argument("--workers", type=int, default=images.WORKERS)
+
+    def handle(self, *args, **options):
+        models = TransportModel.objects.exclude(image="").order_by("id")
+        if not options["all"]:
+            models = models.filter(image_variants={})
+        rows = list(models.values_list("id", "image"))
+        generated = sum(variants is not None for variants in images.backfill(rows, options["workers"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated the variants of {generated} image(s), {len(rows) - generated} skipped "
+            f"(missing files, replaced images or errors, see the api.images log)"
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.rebalancing import MAX_FILL, MIN_FILL, create_plan
+
+
+class Command(BaseCommand):
+    help = "Plans the transfers that bring every parking station between its minimal and maximal fill"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-fill", type=float, default=MIN_FILL,
+                            help="Share of max_cars under which a station gets transports")
+        parser.add_argument("--max-fill", type=float, default=MAX_FILL,
+                            help="Share of max_cars above which a station may give transports away")
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+        plan = create_plan(min_fill=options["min_fill"], max_fill=options["max_fill"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Plan #{plan.id}: {plan.moves.count()} move(s) of {plan.moved_transports} transport(s) "
+            f"in {time.perf_counter() - started_at:.2f}s"
+        ))
+        if plan.unresolved_overflow or plan.unresolved_shortage:
+            self.stdout.write(self.style.WARNING(
+                f"{plan.unresolved_overflow} transport(s) have nowhere to go, "
+                f"{plan.unresolved_shortage} place(s) stay empty"
+            ))
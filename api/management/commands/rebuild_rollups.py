@@ -0,0 +1,13 @@
+
+
+from django.core.management.base import BaseCommand
+
+from api.models import AccountingRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuilds daily and monthly accounting rollups from the whole CompanyAccounting ledger"
+
+    def handle(self, *args, **options):
+        rollups = AccountingRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rollups} rollup row(s)"))
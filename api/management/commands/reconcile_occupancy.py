@@ -0,0 +1,15 @@
+
+
+from django.core.management.base import BaseCommand
+
+from api import cache
+from api.models import ParkingStation
+
+
+class Command(BaseCommand):
+    help = "Recounts transports at every parking station and fixes drifted occupancy counters"
+
+    def handle(self, *args, **options):
+        drifted_ids = ParkingStation.reconcile_occupancy()
+        cache.bump_stations(drifted_ids)
+        self.stdout.write(self.style.SUCCESS(f"Fixed occupancy of {len(drifted_ids)} parking station(s)"))
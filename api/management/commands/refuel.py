@@ -0,0 +1,19 @@
+
+
+from django.core.management.base import BaseCommand
+
+from api.models import Transport
+
+
+class Command(BaseCommand):
+    help = "Refuels every parked transport below the fuel threshold and books the expenses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--station", type=int, action="append", dest="stations",
+                            help="Parking station id, can be repeated (all stations by default)")
+        parser.add_argument("--threshold", type=int, default=25,
+                            help="Fuel percent below which a transport is refuelled")
+
+    def handle(self, *args, **options):
+        refuelled = Transport.refuel_at_stations(options["stations"], options["threshold"])
+        self.stdout.write(self.style.SUCCESS(f"Refuelled {refuelled} transport(s)"))
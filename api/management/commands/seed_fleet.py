@@ -0,0 +1,27 @@
+
+
+from django.core.management.base import BaseCommand
+
+from api.seeding import SEED_PASSWORD, seed_fleet
+
+
+class Command(BaseCommand):
+    help = "Generates parking stations, transport models, transports, clients and finished ride history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stations", type=int, default=100)
+        parser.add_argument("--models", type=int, default=20)
+        parser.add_argument("--transports", type=int, default=5000)
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--rides", type=int, default=0, help="Finished rides of history to generate")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, the same seed gives the same fleet")
+
+    def handle(self, *args, **options):
+        seeded = seed_fleet(
+            stations=options["stations"], models=options["models"], transports=options["transports"],
+            clients=options["clients"], rides=options["rides"], seed=options["seed"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{count} {name}" for name, count in seeded.items())
+            + f" seeded, client password is {SEED_PASSWORD!r}"
+        ))
@@ -0,0 +1,19 @@
+
+
+from django.core.management.base import BaseCommand
+
+from api import cache
+
+
+class Command(BaseCommand):
+    help = "Builds station inventory and plans payloads into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset-stats", action="store_true", help="Reset hit/miss counters after warming")
+
+    def handle(self, *args, **options):
+        cache.warm()
+        if options["reset_stats"]:
+            cache.reset_stats()
+        stats = cache.get_stats()
+        self.stdout.write(self.style.SUCCESS(f"Cache warmed (hits: {stats['hits']}, misses: {stats['misses']})"))
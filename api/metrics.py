@@ -0,0 +1,202 @@
+
+
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+logger = logging.getLogger('api.slow_requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total, result = 0, []
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class Registry:
+    HISTOGRAMS = {
+        'api_request_duration_seconds': ('Wall time of the request', DURATION_BUCKETS),
+        'api_request_db_duration_seconds': ('Time spent in SQL queries', DURATION_BUCKETS),
+        'api_request_queries': ('Number of SQL queries', QUERY_BUCKETS),
+        'api_response_size_bytes': ('Size of the response body', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name in self.HISTOGRAMS}
+            self.responses = {}
+            self.slowest = {}
+
+    def observe(self, route: str, method: str, status: int, duration: float, db_duration: float, queries: int,
+                size: Optional[int]):
+        labels = (route, method)
+        values = {
+            'api_request_duration_seconds': duration,
+            'api_request_db_duration_seconds': db_duration,
+            'api_request_queries': queries,
+            'api_response_size_bytes': size,
+        }
+        with self.lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+                series = self.histograms[name]
+                if labels not in series:
+                    series[labels] = Histogram(self.HISTOGRAMS[name][1])
+                series[labels].observe(value)
+            key = (route, method, str(status))
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def is_among_slowest(self, route: str, duration: float, keep: int) -> bool:
+        # a min-heap of the slowest durations per route, so only new record holders get logged
+        with self.lock:
+            slowest = self.slowest.setdefault(route, [])
+            if len(slowest) < keep:
+                heapq.heappush(slowest, duration)
+                return True
+            if duration > slowest[0]:
+                heapq.heapreplace(slowest, duration)
+                return True
+            return False
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (route, method), histogram in sorted(self.histograms[name].items()):
+                    labels = f'route="{route}",method="{method}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            lines.append('# HELP api_responses_total Responses by status code')
+            lines.append('# TYPE api_responses_total counter')
+            for (route, method, status), count in sorted(self.responses.items()):
+                lines.append(f'api_responses_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    def __init__(self, keep_sql: bool):
+        self.keep_sql = keep_sql
+        self.count = 0
+        self.duration = 0
+        self.queries = []
+
+    def add(self, duration: float, sql: str):
+        self.count += 1
+        self.duration += duration
+        if self.keep_sql:
+            self.queries.append((duration, sql))
+
+
+# context variables follow a request into the threads its async views hop to, thread-local wrappers would not
+current_recorder = contextvars.ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(time.perf_counter() - started_at, sql)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder, token, started_at = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        self.finish(request, response, recorder, started_at)
+        return response
+
+    async def __acall__(self, request):
+        recorder, token, started_at = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        self.finish(request, response, recorder, started_at)
+        return response
+
+    def start(self):
+        recorder = QueryRecorder(keep_sql=getattr(settings, 'API_SLOW_REQUEST_MS', None) is not None)
+        return recorder, current_recorder.set(recorder), time.perf_counter()
+
+    def finish(self, request, response, recorder: QueryRecorder, started_at: float):
+        duration = time.perf_counter() - started_at
+        match = request.resolver_match
+        route = match.url_name if match and match.url_name else 'unmatched'
+        # streamed bodies are produced after the middleware returns, so their size is unknown here
+        size = None if response.streaming else len(response.content)
+        registry.observe(route, request.method, response.status_code, duration, recorder.duration, recorder.count, size)
+
+        slow_request_ms = getattr(settings, 'API_SLOW_REQUEST_MS', None)
+        if slow_request_ms is not None and duration * 1000 >= slow_request_ms and registry.is_among_slowest(
+                route, duration, getattr(settings, 'API_SLOW_REQUEST_SAMPLES', 10)):
+            log_slow_request(request, route, duration, recorder)
+
+
+def log_slow_request(request, route: str, duration: float, recorder: QueryRecorder):
+    slowest_queries = sorted(recorder.queries, key=lambda query: query[0], reverse=True)[:10]
+    logger.warning(
+        'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s',
+        request.method, request.get_full_path(), route, duration * 1000, recorder.count, recorder.duration * 1000,
+        '\n'.join(f'{query_duration * 1000:8.2f} ms  {sql}' for query_duration, sql in slowest_queries),
+    )
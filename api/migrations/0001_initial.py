@@ -0,0 +1,138 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:24
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyAccounting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('description', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ParkingStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=150)),
+                ('short_name', models.CharField(max_length=32)),
+                ('max_cars', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Plan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('description', models.CharField(max_length=255)),
+                ('time_min', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Time (Minutes)')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransportClass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('minimal_rating', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransportType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Client',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('rating', models.IntegerField(default=50, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)])),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RentPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('fine_overtime', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('plan', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.plan')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Transport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fuel', models.IntegerField(default=100, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)], verbose_name='Fuel (percent)')),
+                ('registry_number', models.CharField(max_length=50, unique=True)),
+                ('parking', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.parkingstation')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RentPeriodCarUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('finishing_station', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='finishing_station', to='api.parkingstation')),
+                ('period', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.rentperiod')),
+                ('starting_station', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='starting_station', to='api.parkingstation')),
+                ('transport', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.transport')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransportModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('description', models.TextField(max_length=256)),
+                ('image', models.ImageField(upload_to=settings.MEDIA_ROOT / 'transport_images')),
+                ('classification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.transportclass')),
+                ('type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.transporttype')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transport',
+            name='model',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.transportmodel'),
+        ),
+    ]
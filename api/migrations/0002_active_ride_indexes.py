@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rentperiod',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True)), fields=['client'], name='rentperiod_active_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentperiodcarusage',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True)), fields=['period'], name='usage_active_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentperiodcarusage',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True), ('finishing_station__isnull', True)), fields=['transport'], name='usage_active_transport_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transport',
+            index=models.Index(fields=['parking', 'model'], name='transport_parking_model_idx'),
+        ),
+    ]
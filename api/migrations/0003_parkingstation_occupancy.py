@@ -0,0 +1,30 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_occupancy(apps, schema_editor):
+    ParkingStation = apps.get_model('api', 'ParkingStation')
+    Transport = apps.get_model('api', 'Transport')
+    ParkingStation.objects.update(occupancy=Coalesce(Subquery(
+        Transport.objects.filter(parking=OuterRef('pk')).order_by().values('parking')
+        .annotate(count=Count('id')).values('count')
+    ), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_active_ride_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkingstation',
+            name='occupancy',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
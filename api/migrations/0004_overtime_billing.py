@@ -0,0 +1,37 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_parkingstation_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('fined_periods', models.IntegerField(default=0)),
+                ('billed_periods', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rentperiod',
+            name='fine_billed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rentperiod',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='rentperiod',
+            index=models.Index(condition=models.Q(('fine_billed_at__isnull', True), ('fine_overtime__gt', 0), ('finished_at__isnull', False)), fields=['id'], name='rentperiod_unbilled_fine_idx'),
+        ),
+    ]
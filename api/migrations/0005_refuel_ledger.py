@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_overtime_billing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companyaccounting',
+            name='parking_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.parkingstation'),
+        ),
+        migrations.AddField(
+            model_name='companyaccounting',
+            name='refuelled_percent',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='companyaccounting',
+            name='transport',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.transport'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_categories(apps, schema_editor):
+    CompanyAccounting = apps.get_model('api', 'CompanyAccounting')
+    CompanyAccounting.objects.filter(refuelled_percent__isnull=False).update(category='refuel')
+    CompanyAccounting.objects.filter(description__startswith='Overtime fine').update(category='fine')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_refuel_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companyaccounting',
+            name='category',
+            field=models.CharField(choices=[('fine', 'Overtime fine'), ('refuel', 'Refuelling'), ('other', 'Other')], default='other', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='companyaccounting',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='AccountingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=8)),
+                ('period_start', models.DateField()),
+                ('category', models.CharField(choices=[('fine', 'Overtime fine'), ('refuel', 'Refuelling'), ('other', 'Other')], max_length=16)),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('net', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('parking_station', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.parkingstation')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='accountingrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('parking_station__isnull', False)), fields=('period', 'period_start', 'category', 'parking_station'), name='accountingrollup_station_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='accountingrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('parking_station__isnull', True)), fields=('period', 'period_start', 'category'), name='accountingrollup_no_station_unique'),
+        ),
+        migrations.RunPython(fill_categories, migrations.RunPython.noop),
+    ]
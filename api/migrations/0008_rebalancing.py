@@ -0,0 +1,39 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:53
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_parkingstation_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RebalancingPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('moved_transports', models.IntegerField(default=0)),
+                ('unresolved_overflow', models.IntegerField(default=0)),
+                ('unresolved_shortage', models.IntegerField(default=0)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RebalancingMove',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('from_station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.parkingstation')),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.transportmodel')),
+                ('to_station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.parkingstation')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='api.rebalancingplan')),
+            ],
+        ),
+    ]
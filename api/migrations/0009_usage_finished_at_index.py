@@ -0,0 +1,17 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_rebalancing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rentperiodcarusage',
+            index=models.Index(fields=['finished_at'], name='usage_finished_at_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:25
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_usage_finished_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transport',
+            name='fuel_reported_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='TelemetryReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('fuel', models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('transport', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.transport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transport', 'recorded_at'], name='telemetry_transport_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:36
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_telemetry'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='client_email_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_client_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('cutoff', models.DateTimeField()),
+                ('last_period_id', models.BigIntegerField(default=0)),
+                ('last_usage_id', models.BigIntegerField(default=0)),
+                ('archived_periods', models.IntegerField(default=0)),
+                ('archived_usages', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedRentPeriod',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('fine_overtime', models.IntegerField(default=0)),
+                ('fine_billed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('client', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('plan', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.plan')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedRentPeriodCarUsage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('finishing_station', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.parkingstation')),
+                ('period', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.archivedrentperiod')),
+                ('starting_station', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.parkingstation')),
+                ('transport', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.transport')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['finished_at'], name='archived_usage_finished_at_idx')],
+            },
+        ),
+    ]
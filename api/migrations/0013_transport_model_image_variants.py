@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_rental_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transportmodel',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='transportmodel',
+            name='image',
+            field=models.ImageField(upload_to='transport_images'),
+        ),
+    ]
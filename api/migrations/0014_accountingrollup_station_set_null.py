@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_transport_model_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accountingrollup',
+            name='parking_station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.parkingstation'),
+        ),
+    ]
@@ -1,19 +1,40 @@
 
 
-import random
-from datetime import datetime
+import datetime
+import operator
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
 from typing import Optional
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models import Count
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, FilteredRelation, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Lower, TruncDay, TruncMonth
 from django.conf import settings
+from django.utils import timezone
+
+from . import ledger, telemetry
+
+
+class ParkingStationIsFull(Exception):
+    pass
 
 
 class Client(AbstractUser):
     rating = models.IntegerField(default=50, validators=[MinValueValidator(1), MaxValueValidator(100)])
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # clients log in with their username or, in any case, their email
+            models.Index(Lower("email"), name="client_email_lower_idx"),
+        ]
+
+    @classmethod
+    def with_login(cls, login: str) -> models.QuerySet:
+        return cls.objects.alias(email_lower=Lower("email")).filter(Q(username=login) | Q(email_lower=login.lower()))
+
     def json(self):
         return {
             "id": self.id,
@@ -22,30 +43,65 @@ class Client(AbstractUser):
             "onRide": self.is_on_ride
         }
 
+    async def ajson(self):
+        await self.aload_ride_state()
+        return self.json()
+
+    def _active_rent_period_query(self):
+        return RentPeriod.objects.filter(client=self, finished_at__isnull=True).annotate(
+            active_usage=FilteredRelation(
+                "rentperiodcarusage", condition=Q(rentperiodcarusage__finished_at__isnull=True)
+            )
+        ).select_related("active_usage__transport")
+
+    def _set_ride_state(self, rent_period: Optional["RentPeriod"]):
+        self._ride_state = (rent_period, rent_period.active_usage if rent_period else None)
+
+    @property
+    def ride_state(self) -> tuple[Optional["RentPeriod"], Optional["RentPeriodCarUsage"]]:
+        # loaded once per instance (request.user lives for one request), kept up to date by the ride methods
+        if not hasattr(self, "_ride_state"):
+            self._set_ride_state(self._active_rent_period_query().first())
+        return self._ride_state
+
+    async def aload_ride_state(self):
+        if not hasattr(self, "_ride_state"):
+            self._set_ride_state(await self._active_rent_period_query().afirst())
+
+    def reset_ride_state(self):
+        self.__dict__.pop("_ride_state", None)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.reset_ride_state()
+        super().refresh_from_db(*args, **kwargs)
+
     @property
     def is_on_ride(self) -> bool:
-        return RentPeriod.objects.filter(client=self, finished_at__isnull=True).exists()
+        return self.ride_state[0] is not None
 
     @property
     def active_rent_period(self) -> "RentPeriod":
-        return RentPeriod.objects.filter(client=self, finished_at__isnull=True).first()
+        return self.ride_state[0]
 
     @property
     def active_car_usage_period(self) -> "RentPeriodCarUsage":
-        return RentPeriodCarUsage.objects.filter(period=self.active_rent_period, finished_at__isnull=True).first()
+        return self.ride_state[1]
 
+    @transaction.atomic
     def end_all_rents(self, parking_station_id: int):
-        self.active_rent_period.end_period(parking_station_id)
+        rent_period, car_usage = self.ride_state
+        rent_period.end_period(parking_station_id, car_usage)
+        self._ride_state = (None, None)
 
     def start_rent_period(self, plan_id: int):
         rent_period = RentPeriod(client=self, plan_id=plan_id)
         rent_period.save()
+        self._ride_state = (rent_period, None)
         return rent_period
 
+    @transaction.atomic
     def take_car(self, parking_station_id: int, transport_id: int):
-        car = Transport.get_car_by_parking_and_model(parking_station_id, transport_id)
-        car.parking = None
-        car.save()
+        car = Transport.claim_car(parking_station_id, transport_id)
 
         rent_period_car_usage = RentPeriodCarUsage(
             period=self.active_rent_period,
@@ -53,10 +109,13 @@ class Client(AbstractUser):
             starting_station_id=parking_station_id
         )
         rent_period_car_usage.save()
+        self._ride_state = (self.active_rent_period, rent_period_car_usage)
         return car
 
+    @transaction.atomic
     def change_car(self, parking_station_id: int, new_transport_id: int):
-        self.active_car_usage_period.end_period(parking_station_id)
+        # the old car is swapped for a new one at the same station, so the station cannot overflow
+        self.active_car_usage_period.end_period(parking_station_id, enforce_capacity=False)
         car = self.take_car(parking_station_id, new_transport_id)
         return car
 
@@ -96,12 +155,48 @@ class TransportModel(models.Model):
     classification = models.ForeignKey("TransportClass", on_delete=models.CASCADE)
     name = models.CharField(max_length=128, unique=True)
     description = models.TextField(max_length=256)
-    image = models.ImageField(upload_to=settings.MEDIA_ROOT / "transport_images")
+    image = models.ImageField(upload_to="transport_images")
+    # variant name -> {"width", "height", "files": {format: file name}}, written by api.images once resized
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     # max_fuel here if need
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_state()
+        return instance
+
+    def remember_loaded_state(self):
+        image = self.__dict__.get("image")
+        self._loaded_image = getattr(image, "name", image)
+
+    def save(self, *args, **kwargs):
+        # the variants are only written by the job that generates them, a model loaded before the job finished
+        # must not put back the ones it was loaded with
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "image_variants"
+            ]
+        super().save(*args, **kwargs)
+        self.remember_loaded_state()
+
+    @staticmethod
+    def image_variant_urls(variants: dict) -> dict:
+        # smallest first, formats in a fixed order: postgres does not keep the key order of a JSON value
+        storage = TransportModel._meta.get_field("image").storage
+        return {
+            variant: {
+                "width": entry["width"],
+                "height": entry["height"],
+                **{image_format: storage.url(name) for image_format, name in sorted(entry["files"].items())},
+            }
+            for variant, entry in sorted(variants.items(), key=lambda item: (item[1]["width"], item[0]))
+        }
+
     @property
     def as_dict(self):
         return {
@@ -111,6 +206,7 @@ class TransportModel(models.Model):
             "name": self.name,
             "description": self.description,
             "imageUrl": self.image.url,
+            "imageVariants": self.image_variant_urls(self.image_variants),
             "count": self.count if hasattr(self, "count") else None,
         }
 
@@ -125,13 +221,30 @@ class Transport(models.Model):
     )
 
     registry_number = models.CharField(max_length=50, unique=True)
+    # time of the telemetry reading the fuel level comes from, older readings never overwrite it
+    fuel_reported_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["parking", "model"], name="transport_parking_model_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_state()
+        return instance
+
+    def remember_loaded_state(self):
+        self._loaded_parking_id = self.__dict__.get("parking_id")
+        self._loaded_model_id = self.__dict__.get("model_id")
 
     @property
     def used_by_client(self) -> Optional[Client]:
         try:
             rent_period_car_usage = RentPeriodCarUsage.objects.filter(
                 transport=self, finished_at__isnull=True, finishing_station__isnull=True
-            ).get()
+            ).select_related("period__client").get()
         except RentPeriodCarUsage.DoesNotExist:
             return None
         return rent_period_car_usage.period.client
@@ -147,32 +260,120 @@ class Transport(models.Model):
     def get_car_by_parking_and_model(cls, parking_station_id, model_id):
         return Transport.objects.filter(model_id=model_id, parking_id=parking_station_id)[:1].get()
 
+    @classmethod
+    def claim_car(cls, parking_station_id, model_id, batch_size=8) -> "Transport":
+        # the conditional UPDATE is the actual claim: a car taken by a concurrent checkout
+        # between selecting candidates and updating matches zero rows and the next one is tried
+        while True:
+            candidates = Transport.objects.filter(model_id=model_id, parking_id=parking_station_id)
+            if connection.features.has_select_for_update_skip_locked and connection.in_atomic_block:
+                # the selected rows stay locked until the checkout commits and every other checkout skips them,
+                # so only the car that is taken may be selected
+                candidates = candidates.select_for_update(skip_locked=True)
+                batch_size = 1
+            candidate_ids = list(candidates.values_list("id", flat=True)[:batch_size])
+            if not candidate_ids:
+                raise Transport.DoesNotExist("No available transport of this model at the parking station")
+
+            for car_id in candidate_ids:
+                if Transport.objects.filter(id=car_id, parking_id=parking_station_id).update(parking=None):
+                    car = Transport.objects.get(id=car_id)
+                    # saved as a move off the station, so the occupancy counter and caches follow
+                    car._loaded_parking_id = parking_station_id
+                    car.save(update_fields=["fuel", "fuel_reported_at"])
+                    return car
+
     @property
     def as_dict(self):
+        used_by_client = self.used_by_client
         return {
             "id": self.id,
             "parking": self.parking.as_dict,
             "model": self.model.as_dict,
-            "usedByClient": self.used_by_client.json() if self.used_by_client else False,
+            "usedByClient": used_by_client.json() if used_by_client else False,
             "fuelPercent": self.fuel,
             "registryNumber": self.registry_number,
             "needFuel": self.need_fuel,
         }
 
-    def save(self, *args, **kwargs):
-        if self.need_fuel:
+    @classmethod
+    def refuel_at_stations(cls, station_ids: Optional[list[int]] = None, threshold: int = 25) -> int:
+        with transaction.atomic():
+            transports = cls.objects.filter(parking__isnull=False, fuel__lt=threshold)
+            if station_ids is not None:
+                transports = transports.filter(parking_id__in=station_ids)
+            refuelled = list(transports.select_for_update().values_list("id", "parking_id", "fuel"))
+            if refuelled:
+                cls.objects.filter(id__in=[transport_id for transport_id, _, _ in refuelled]).update(
+                    fuel=100, fuel_reported_at=timezone.now()
+                )
+                CompanyAccounting.objects.bulk_create([
+                    CompanyAccounting.refuel(transport_id, parking_id, 100 - fuel)
+                    for transport_id, parking_id, fuel in refuelled
+                ])
+        return len(refuelled)
+
+    def save(self, *args, enforce_capacity=False, **kwargs):
+        refuelled_percent = 100 - self.fuel if self.need_fuel else 0
+        if refuelled_percent:
             self.fuel = 100
+            # readings taken before the refuel must not bring the old level back
+            self.fuel_reported_at = timezone.now()
+        loaded_parking_id = getattr(self, "_loaded_parking_id", None)
+        if self.parking_id != loaded_parking_id:
+            ParkingStation.move_transport(loaded_parking_id, self.parking_id, enforce_capacity)
         super().save(*args, **kwargs)
+        self.remember_loaded_state()
+        if refuelled_percent:
+            ledger.record(CompanyAccounting.refuel(self.id, self.parking_id or loaded_parking_id, refuelled_percent))
 
 
 class ParkingStation(models.Model):
     address = models.CharField(max_length=150)
     short_name = models.CharField(max_length=32)
     max_cars = models.IntegerField()
+    occupancy = models.IntegerField(default=0, editable=False)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
 
-    @property
-    def occupancy(self):
-        return Transport.objects.filter(parking=self).count()
+    @classmethod
+    def move_transport(cls, from_station_id: Optional[int], to_station_id: Optional[int], enforce_capacity=False):
+        if to_station_id is not None:
+            stations = cls.objects.filter(id=to_station_id)
+            if enforce_capacity:
+                stations = stations.filter(occupancy__lt=F("max_cars"))
+            if not stations.update(occupancy=F("occupancy") + 1):
+                # the update matches nothing for a station that is not there either, only checked when it failed
+                if not cls.objects.filter(id=to_station_id).exists():
+                    raise cls.DoesNotExist(f"Parking station {to_station_id} does not exist")
+                raise ParkingStationIsFull(f"Parking station {to_station_id} is full")
+        if from_station_id is not None:
+            cls.objects.filter(id=from_station_id).update(occupancy=F("occupancy") - 1)
+
+    @classmethod
+    def reconcile_occupancy(cls) -> list[int]:
+        actual = Coalesce(Subquery(
+            Transport.objects.filter(parking=OuterRef("pk")).order_by().values("parking")
+            .annotate(count=Count("id")).values("count")
+        ), Value(0))
+        drifted_ids = list(
+            cls.objects.annotate(actual=actual).exclude(occupancy=F("actual")).values_list("id", flat=True)
+        )
+        if drifted_ids:
+            cls.objects.filter(id__in=drifted_ids).update(occupancy=actual)
+        return drifted_ids
+
+    def save(self, *args, **kwargs):
+        # occupancy only moves through move_transport and reconcile_occupancy, an update never writes back the
+        # count that was loaded with the station, checkouts committed since would be lost
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "occupancy"
+            ]
+        super().save(*args, **kwargs)
 
     @property
     def available_models(self):
@@ -189,6 +390,8 @@ class ParkingStation(models.Model):
             "shortName": self.short_name,
             "maxCars": self.max_cars,
             "occupancy": self.occupancy,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
             "availableModels": [m.as_dict for m in self.available_models],
         }
 
@@ -218,14 +421,26 @@ class RentPeriod(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     finished_at = models.DateTimeField(null=True, blank=True)
     plan = models.ForeignKey("Plan", on_delete=models.SET_NULL, null=True)
-    fine_overtime = models.IntegerField(default=0)      # todo: pre_save SIGNAL
+    fine_overtime = models.IntegerField(default=0)
+    fine_billed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["client"], condition=Q(finished_at__isnull=True), name="rentperiod_active_client_idx"),
+            models.Index(
+                fields=["id"], condition=Q(finished_at__isnull=False, fine_billed_at__isnull=True, fine_overtime__gt=0),
+                name="rentperiod_unbilled_fine_idx"
+            ),
+        ]
 
     @property
     def active_car_usage_period(self) -> "RentPeriodCarUsage":
         return RentPeriodCarUsage.objects.filter(period=self, finished_at__isnull=True).first()
 
-    def end_period(self, parking_station_id: int):
-        self.finished_at = self.active_car_usage_period.end_period(parking_station_id)
+    def end_period(self, parking_station_id: int, car_usage: Optional["RentPeriodCarUsage"] = None):
+        car_usage = car_usage or self.active_car_usage_period
+        self.finished_at = car_usage.end_period(parking_station_id)
         self.save()
 
 
@@ -243,19 +458,153 @@ class RentPeriodCarUsage(models.Model):
         null=True, related_name='finishing_station'
     )
 
-    def end_period(self, parking_station_id: int):
-        self.finished_at = datetime.now()
+    class Meta:
+        indexes = [
+            models.Index(fields=["period"], condition=Q(finished_at__isnull=True), name="usage_active_period_idx"),
+            models.Index(
+                fields=["transport"], condition=Q(finished_at__isnull=True, finishing_station__isnull=True),
+                name="usage_active_transport_idx"
+            ),
+            # utilization analytics look up the rides that were still going on at the start of a window
+            models.Index(fields=["finished_at"], name="usage_finished_at_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_state()
+        return instance
+
+    def utilization_state(self) -> tuple:
+        # what the utilization analytics count of a ride
+        return (self.__dict__.get("started_at"), self.__dict__.get("finished_at"), self.__dict__.get("transport_id"),
+                self.__dict__.get("starting_station_id"), self.__dict__.get("finishing_station_id"))
+
+    def remember_loaded_state(self):
+        self._loaded_utilization_state = self.utilization_state()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.remember_loaded_state()
+
+    def end_period(self, parking_station_id: int, enforce_capacity=True):
+        self.finished_at = timezone.now()
         self.finishing_station_id = parking_station_id
-        self.transport.fuel -= random.randint(5, 25)
+        # the flushed readings are already in the row, one may still be waiting in this process's buffer
+        reported_fuel = telemetry.buffer.latest_fuel(self.transport_id)
+        if reported_fuel is not None:
+            self.transport.fuel = reported_fuel
         self.transport.parking_id = parking_station_id
-        self.transport.save()
+        self.transport.save(enforce_capacity=enforce_capacity)
         self.save()
         return self.finished_at
 
 
+# finished rentals are moved here by api.archive once they are old and billed, keeping their ids; the hot tables
+# above then hold little more than the rides of the last weeks. api.archive reads both as one
+class ArchivedRentPeriod(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    client = models.ForeignKey("Client", on_delete=models.SET_NULL, null=True, related_name="+")
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    plan = models.ForeignKey("Plan", on_delete=models.SET_NULL, null=True, related_name="+")
+    fine_overtime = models.IntegerField(default=0)
+    fine_billed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField()
+
+
+class ArchivedRentPeriodCarUsage(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    period = models.ForeignKey("ArchivedRentPeriod", on_delete=models.SET_NULL, null=True)
+    transport = models.ForeignKey("Transport", on_delete=models.SET_NULL, null=True, related_name="+")
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    starting_station = models.ForeignKey("ParkingStation", on_delete=models.SET_NULL, null=True, related_name="+")
+    finishing_station = models.ForeignKey("ParkingStation", on_delete=models.SET_NULL, null=True, related_name="+")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["finished_at"], name="archived_usage_finished_at_idx"),
+        ]
+
+
+class TelemetryReading(models.Model):
+    transport = models.ForeignKey("Transport", on_delete=models.CASCADE, db_index=False)
+    recorded_at = models.DateTimeField()
+    fuel = models.IntegerField(validators=[MinValueValidator(0), MaxValueValidator(100)])
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["transport", "recorded_at"], name="telemetry_transport_time_idx"),
+        ]
+
+
+class BillingRun(models.Model):
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    fined_periods = models.IntegerField(default=0)
+    billed_periods = models.IntegerField(default=0)
+
+    @classmethod
+    def last_finished(cls) -> Optional["BillingRun"]:
+        return cls.objects.filter(finished_at__isnull=False).order_by("-started_at").first()
+
+
+class ArchiveRun(models.Model):
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # rentals finished before this moment are archived; an interrupted run is resumed with the same cutoff
+    cutoff = models.DateTimeField()
+    last_period_id = models.BigIntegerField(default=0)
+    last_usage_id = models.BigIntegerField(default=0)
+    archived_periods = models.IntegerField(default=0)
+    archived_usages = models.IntegerField(default=0)
+
+    @classmethod
+    def unfinished(cls) -> Optional["ArchiveRun"]:
+        return cls.objects.filter(finished_at__isnull=True).order_by("-started_at").first()
+
+
+class CompanyAccountingQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            AccountingRollup.apply(objs)
+        return objs
+
+
 class CompanyAccounting(models.Model):
+    CATEGORY_FINE = "fine"
+    CATEGORY_REFUEL = "refuel"
+    CATEGORY_OTHER = "other"
+    CATEGORIES = [
+        (CATEGORY_FINE, "Overtime fine"),
+        (CATEGORY_REFUEL, "Refuelling"),
+        (CATEGORY_OTHER, "Other"),
+    ]
+
     amount = models.DecimalField(max_digits=20, decimal_places=2)
     description = models.CharField(max_length=64)
+    category = models.CharField(max_length=16, choices=CATEGORIES, default=CATEGORY_OTHER)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    transport = models.ForeignKey("Transport", on_delete=models.SET_NULL, null=True, blank=True)
+    parking_station = models.ForeignKey("ParkingStation", on_delete=models.SET_NULL, null=True, blank=True)
+    refuelled_percent = models.IntegerField(null=True, blank=True)
+
+    objects = CompanyAccountingQuerySet.as_manager()
+
+    @classmethod
+    def refuel(cls, transport_id: int, parking_station_id: Optional[int], percent: int) -> "CompanyAccounting":
+        return cls(
+            amount=-percent * settings.REFUEL_COST_PER_PERCENT,
+            description=f"Refuel +{percent}%, transport #{transport_id}",
+            category=cls.CATEGORY_REFUEL,
+            transport_id=transport_id,
+            parking_station_id=parking_station_id,
+            refuelled_percent=percent,
+        )
 
     @property
     def is_income(self):
@@ -264,3 +613,177 @@ class CompanyAccounting(models.Model):
     @property
     def is_expense(self):
         return not self.is_income
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                AccountingRollup.apply([self])
+
+
+class AccountingRollup(models.Model):
+    PERIOD_DAY = "day"
+    PERIOD_MONTH = "month"
+    PERIODS = [
+        (PERIOD_DAY, "Day"),
+        (PERIOD_MONTH, "Month"),
+    ]
+
+    period = models.CharField(max_length=8, choices=PERIODS)
+    period_start = models.DateField()
+    category = models.CharField(max_length=16, choices=CompanyAccounting.CATEGORIES)
+    # the totals of a deleted station are folded into those without a station first, see fold_station
+    parking_station = models.ForeignKey("ParkingStation", on_delete=models.SET_NULL, null=True, blank=True)
+    income = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    expense = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "period_start", "category", "parking_station"],
+                condition=Q(parking_station__isnull=False), name="accountingrollup_station_unique"
+            ),
+            models.UniqueConstraint(
+                fields=["period", "period_start", "category"],
+                condition=Q(parking_station__isnull=True), name="accountingrollup_no_station_unique"
+            ),
+        ]
+
+    @staticmethod
+    def period_starts(moment: datetime.datetime) -> dict[str, datetime.date]:
+        day = timezone.localdate(moment)
+        return {AccountingRollup.PERIOD_DAY: day, AccountingRollup.PERIOD_MONTH: day.replace(day=1)}
+
+    @classmethod
+    def apply(cls, entries: list[CompanyAccounting]):
+        totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+        for entry in entries:
+            amount = Decimal(entry.amount)
+            for period, period_start in cls.period_starts(entry.created_at).items():
+                key = (period, period_start, entry.category, entry.parking_station_id)
+                totals[key][0 if amount > 0 else 1] += abs(amount)
+
+        if not totals:
+            return
+        existing = set(cls.objects.filter(
+            reduce(operator.or_, (
+                Q(period=period, period_start=period_start, category=category, parking_station_id=parking_station_id)
+                for period, period_start, category, parking_station_id in totals
+            ))
+        ).values_list("period", "period_start", "category", "parking_station_id"))
+
+        created = {
+            key: cls(
+                period=key[0], period_start=key[1], category=key[2], parking_station_id=key[3],
+                income=income, expense=expense, net=income - expense,
+            )
+            for key, (income, expense) in totals.items()
+            if key not in existing
+        }
+        if created:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create(created.values())
+            except IntegrityError:
+                # a concurrent writer created some of these rows first, fall back to incrementing them one by one
+                created = {}
+
+        for key, (income, expense) in totals.items():
+            if key not in created:
+                cls._increment(key, income, expense)
+
+    @classmethod
+    def _increment(cls, key: tuple, income: Decimal, expense: Decimal):
+        period, period_start, category, parking_station_id = key
+        rollup = cls.objects.filter(
+            period=period, period_start=period_start, category=category, parking_station_id=parking_station_id
+        )
+        if not rollup.update(income=F("income") + income, expense=F("expense") + expense,
+                             net=F("net") + income - expense):
+            cls.objects.create(
+                period=period, period_start=period_start, category=category, parking_station_id=parking_station_id,
+                income=income, expense=expense, net=income - expense,
+            )
+
+    @classmethod
+    def fold_station(cls, parking_station_id: int):
+        # the ledger keeps the entries of a deleted station without one, so its totals move where rebuild()
+        # would count them
+        with transaction.atomic():
+            rollups = cls.objects.filter(parking_station_id=parking_station_id)
+            for rollup in rollups.select_for_update():
+                cls._increment((rollup.period, rollup.period_start, rollup.category, None), rollup.income,
+                               rollup.expense)
+            rollups.delete()
+
+    @classmethod
+    def rebuild(cls) -> int:
+        with transaction.atomic():
+            cls.objects.all().delete()
+            totals = defaultdict(lambda: [Decimal(0), Decimal(0)])
+            for period, trunc in ((cls.PERIOD_DAY, TruncDay), (cls.PERIOD_MONTH, TruncMonth)):
+                rows = CompanyAccounting.objects.annotate(period_start=trunc("created_at")).values(
+                    "period_start", "category", "parking_station_id"
+                ).annotate(
+                    income=Coalesce(Sum("amount", filter=Q(amount__gt=0)), Value(Decimal(0))),
+                    expense=Coalesce(Sum("amount", filter=Q(amount__lte=0)), Value(Decimal(0))),
+                ).order_by()
+                for row in rows:
+                    key = (period, row["period_start"].date(), row["category"], row["parking_station_id"])
+                    totals[key][0] += row["income"]
+                    totals[key][1] -= row["expense"]
+            cls.objects.bulk_create([
+                cls(
+                    period=period, period_start=period_start, category=category, parking_station_id=parking_station_id,
+                    income=income, expense=expense, net=income - expense,
+                )
+                for (period, period_start, category, parking_station_id), (income, expense) in totals.items()
+            ], batch_size=1000)
+        return len(totals)
+
+
+class RebalancingPlan(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey("Client", on_delete=models.SET_NULL, null=True, blank=True)
+    moved_transports = models.IntegerField(default=0)
+    # cars that could not be placed anywhere and places that could not be filled
+    unresolved_overflow = models.IntegerField(default=0)
+    unresolved_shortage = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Rebalancing plan #{self.id} ({self.created_at:%Y-%m-%d %H:%M})"
+
+    @property
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "createdAt": self.created_at,
+            "movedTransports": self.moved_transports,
+            "unresolvedOverflow": self.unresolved_overflow,
+            "unresolvedShortage": self.unresolved_shortage,
+        }
+
+
+class RebalancingMove(models.Model):
+    plan = models.ForeignKey("RebalancingPlan", on_delete=models.CASCADE, related_name="moves")
+    from_station = models.ForeignKey("ParkingStation", on_delete=models.CASCADE, related_name="+")
+    to_station = models.ForeignKey("ParkingStation", on_delete=models.CASCADE, related_name="+")
+    model = models.ForeignKey("TransportModel", on_delete=models.CASCADE)
+    count = models.IntegerField(validators=[MinValueValidator(1)])
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.count} x {self.model_id}: {self.from_station_id} -> {self.to_station_id}"
+
+    @property
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "fromStationId": self.from_station_id,
+            "toStationId": self.to_station_id,
+            "modelId": self.model_id,
+            "count": self.count,
+            "completedAt": self.completed_at,
+        }
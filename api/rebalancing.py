@@ -0,0 +1,154 @@
+
+
+import math
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Client, ParkingStation, RebalancingMove, RebalancingPlan, Transport
+
+
+MIN_FILL = getattr(settings, 'REBALANCE_MIN_FILL', 0.2)
+MAX_FILL = getattr(settings, 'REBALANCE_MAX_FILL', 0.8)
+# stations are paired along a serpentine through latitude bands of this height, so moves stay short
+BAND_DEGREES = 0.05
+
+
+def _take(values: np.ndarray, amount: int, priority: np.ndarray) -> np.ndarray:
+    # up to `amount` in total, taken from the highest priority first without exceeding any value
+    order = np.argsort(-priority, kind='stable')
+    ordered = values[order]
+    before = np.cumsum(ordered) - ordered
+    taken = np.zeros_like(values)
+    taken[order] = np.clip(amount - before, 0, ordered)
+    return taken
+
+
+def _spatial_rank(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    located = ~np.isnan(latitude) & ~np.isnan(longitude)
+    band = np.floor(np.where(located, latitude, 0) / BAND_DEGREES)
+    along = np.where(band % 2 == 0, 1, -1) * np.where(located, longitude, 0)
+    order = np.lexsort((np.arange(len(latitude)), along, band, ~located))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank
+
+
+def station_targets(occupancy: np.ndarray, max_cars: np.ndarray, min_fill: float = MIN_FILL,
+                    max_fill: float = MAX_FILL) -> tuple[np.ndarray, np.ndarray, int, int]:
+    # how many cars every station gives away and receives, and what cannot be resolved
+    low = np.ceil(max_cars * min_fill).astype(np.int64)
+    high = np.maximum(low, np.floor(max_cars * max_fill).astype(np.int64))
+
+    # cars past max_cars always leave, stations under `low` always get some; stations above `high`
+    # may give cars to the ones in need and stations under `high` may take the overflow
+    overflow = np.maximum(occupancy - max_cars, 0)
+    shortage = np.maximum(low - occupancy, 0)
+    spare = np.maximum(np.minimum(occupancy, max_cars) - high, 0)
+    room = np.maximum(high - np.maximum(occupancy, low), 0)
+
+    if overflow.sum() >= shortage.sum():
+        demand = shortage + _take(room, overflow.sum() - shortage.sum(), room)
+        supply = _take(overflow, demand.sum(), overflow)
+    else:
+        supply = overflow + _take(spare, shortage.sum() - overflow.sum(), spare)
+        demand = _take(shortage, supply.sum(), shortage)
+    return supply, demand, max(int(overflow.sum() - supply.sum()), 0), int(np.maximum(shortage - demand, 0).sum())
+
+
+def pick_models(supply: np.ndarray, pair_station: np.ndarray, pair_count: np.ndarray) -> np.ndarray:
+    # every station gives away its most plentiful models first
+    order = np.lexsort((-pair_count, pair_station))
+    stations, counts = pair_station[order], pair_count[order]
+    before = np.cumsum(counts) - counts
+    first = np.r_[True, stations[1:] != stations[:-1]]
+    before -= np.maximum.accumulate(np.where(first, before, 0))
+    taken = np.zeros_like(pair_count)
+    taken[order] = np.clip(supply[stations] - before, 0, counts)
+    return taken
+
+
+def match(supply_amounts: np.ndarray, demand_amounts: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # north-west corner rule: walking both lists in order gives at most len(supply) + len(demand) - 1 moves
+    supplied, demanded = np.cumsum(supply_amounts), np.cumsum(demand_amounts)
+    bounds = np.union1d(supplied, demanded)
+    starts = np.r_[0, bounds[:-1]]
+    return (
+        np.searchsorted(supplied, starts, side='right'),
+        np.searchsorted(demanded, starts, side='right'),
+        bounds - starts,
+    )
+
+
+def plan_moves(
+        occupancy: np.ndarray,
+        max_cars: np.ndarray,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        pair_station: np.ndarray,
+        pair_model: np.ndarray,
+        pair_count: np.ndarray,
+        min_fill: float = MIN_FILL,
+        max_fill: float = MAX_FILL,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int, int]:
+    # stations are array positions, pairs hold the number of transports of a model at a station
+    supply, demand, unresolved_overflow, unresolved_shortage = station_targets(
+        occupancy, max_cars, min_fill, max_fill
+    )
+    taken = pick_models(supply, pair_station, pair_count)
+    rank = _spatial_rank(latitude, longitude)
+
+    givers = np.flatnonzero(taken)
+    givers = givers[np.lexsort((pair_model[givers], rank[pair_station[givers]]))]
+    receivers = np.flatnonzero(demand)
+    receivers = receivers[np.argsort(rank[receivers], kind='stable')]
+    if not len(givers) or not len(receivers):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, unresolved_overflow, unresolved_shortage
+
+    giver, receiver, count = match(taken[givers], demand[receivers])
+    return (
+        pair_station[givers[giver]], receivers[receiver], pair_model[givers[giver]], count,
+        unresolved_overflow, unresolved_shortage,
+    )
+
+
+def create_plan(created_by: Optional[Client] = None, min_fill: float = MIN_FILL,
+                max_fill: float = MAX_FILL) -> RebalancingPlan:
+    stations = list(ParkingStation.objects.order_by('id').values_list('id', 'max_cars', 'latitude', 'longitude'))
+    station_ids = np.array([row[0] for row in stations], dtype=np.int64)
+    max_cars = np.array([row[1] for row in stations], dtype=np.int64)
+    latitude = np.array([math.nan if row[2] is None else row[2] for row in stations], dtype=np.float64)
+    longitude = np.array([math.nan if row[3] is None else row[3] for row in stations], dtype=np.float64)
+
+    pairs = np.array(
+        Transport.objects.filter(parking__isnull=False).values('parking_id', 'model_id')
+        .annotate(count=Count('id')).order_by().values_list('parking_id', 'model_id', 'count'),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    pair_station = np.searchsorted(station_ids, pairs[:, 0])
+    # counted from the transports themselves, so the plan never moves cars that are not there
+    occupancy = np.bincount(pair_station, weights=pairs[:, 2], minlength=len(station_ids)).astype(np.int64)
+
+    from_station, to_station, model, count, unresolved_overflow, unresolved_shortage = plan_moves(
+        occupancy, max_cars, latitude, longitude, pair_station, pairs[:, 1], pairs[:, 2], min_fill, max_fill
+    )
+
+    with transaction.atomic():
+        plan = RebalancingPlan.objects.create(
+            created_by=created_by, moved_transports=int(count.sum()),
+            unresolved_overflow=unresolved_overflow, unresolved_shortage=unresolved_shortage,
+        )
+        RebalancingMove.objects.bulk_create([
+            RebalancingMove(
+                plan=plan, from_station_id=from_station_id, to_station_id=to_station_id, model_id=model_id,
+                count=move_count,
+            )
+            for from_station_id, to_station_id, model_id, move_count in zip(
+                station_ids[from_station].tolist(), station_ids[to_station].tolist(), model.tolist(), count.tolist()
+            )
+        ], batch_size=5000)
+    return plan
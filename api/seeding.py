@@ -0,0 +1,153 @@
+
+
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import cache, geo, utilization
+from .models import (Client, ParkingStation, Plan, RentPeriod, RentPeriodCarUsage, Transport, TransportClass,
+                     TransportModel, TransportType)
+
+
+TRANSPORT_TYPES = ["Car", "Bicycle", "Gyroscooter", "Motorcycle"]
+TRANSPORT_CLASSES = [("Economy", 1), ("Comfort", 40), ("Business", 70)]
+PLANS = [("Hour", "300.00", 60), ("Three hours", "750.00", 180), ("Day", "2500.00", 1440)]
+SEED_PASSWORD = "seed-password"
+# stations are scattered around the centre of Moscow, a degree of longitude is about half as long there
+CENTER = (55.7558, 37.6173)
+SPREAD_DEGREES = 0.25
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    # bulk_create honours auto_now/auto_now_add, which would stamp seeded history with the current time
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in flags:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _get_or_create_catalogue(rng: random.Random, models: int):
+    types = [TransportType.objects.get_or_create(name=name)[0] for name in TRANSPORT_TYPES]
+    classes = [
+        TransportClass.objects.get_or_create(name=name, defaults={"minimal_rating": rating})[0]
+        for name, rating in TRANSPORT_CLASSES
+    ]
+    for name, price, time_min in PLANS:
+        Plan.objects.get_or_create(
+            name=name, defaults={"price": Decimal(price), "description": name, "time_min": time_min}
+        )
+
+    offset = TransportModel.objects.count()
+    TransportModel.objects.bulk_create([
+        TransportModel(
+            type=rng.choice(types), classification=rng.choice(classes),
+            name=f"Model {offset + i}", description=f"Seeded model {offset + i}",
+            image="transport_images/seed.png",
+        )
+        for i in range(models)
+    ])
+    return list(TransportModel.objects.values_list("id", flat=True))
+
+
+def seed_fleet(stations: int = 100, models: int = 20, transports: int = 5000, clients: int = 1000,
+               rides: int = 0, seed: int = 0, batch_size: int = 5000) -> dict:
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        model_ids = _get_or_create_catalogue(rng, models)
+        plans = list(Plan.objects.values_list("id", "time_min"))
+
+        offset = ParkingStation.objects.count()
+        max_cars = max(1, transports * 3 // max(stations, 1) // 2)
+        ParkingStation.objects.bulk_create([
+            ParkingStation(
+                address=f"Seeded street, {offset + i}", short_name=f"Station {offset + i}", max_cars=max_cars,
+                latitude=CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                longitude=CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES) * 2,
+            )
+            for i in range(stations)
+        ], batch_size=batch_size)
+        station_ids = list(ParkingStation.objects.values_list("id", flat=True))
+
+        ParkingStation.reconcile_occupancy()
+        free_places = dict(ParkingStation.objects.values_list("id", F("max_cars") - F("occupancy")))
+        open_ids = [station_id for station_id in station_ids if free_places[station_id] > 0]
+        offset = Transport.objects.count()
+        parked = []
+        for i in range(transports):
+            if not open_ids:
+                parking_id = rng.choice(station_ids)
+            else:
+                position = rng.randrange(len(open_ids))
+                parking_id = open_ids[position]
+                free_places[parking_id] -= 1
+                if free_places[parking_id] <= 0:
+                    open_ids[position] = open_ids[-1]
+                    open_ids.pop()
+            parked.append(Transport(
+                model_id=rng.choice(model_ids), parking_id=parking_id,
+                fuel=rng.randint(25, 100), registry_number=f"SEED{offset + i:08}",
+            ))
+        Transport.objects.bulk_create(parked, batch_size=batch_size)
+        transport_ids = list(Transport.objects.values_list("id", flat=True))
+        ParkingStation.reconcile_occupancy()
+
+        password = make_password(SEED_PASSWORD)
+        offset = Client.objects.count()
+        Client.objects.bulk_create([
+            Client(
+                username=f"seed{offset + i}", email=f"seed{offset + i}@example.com",
+                password=password, rating=rng.randint(1, 100),
+            )
+            for i in range(clients)
+        ], batch_size=batch_size)
+        client_ids = list(Client.objects.values_list("id", flat=True))
+
+        created_rides = 0
+        timestamp_fields = (
+            RentPeriod._meta.get_field("started_at"), RentPeriod._meta.get_field("updated_at"),
+            RentPeriodCarUsage._meta.get_field("started_at"),
+        )
+        with explicit_timestamps(*timestamp_fields):
+            while created_rides < rides:
+                count = min(batch_size, rides - created_rides)
+                periods = []
+                for _ in range(count):
+                    plan_id, time_min = rng.choice(plans)
+                    started_at = now - timedelta(minutes=rng.randint(time_min, 365 * 24 * 60))
+                    finished_at = started_at + timedelta(minutes=rng.randint(5, int(time_min * 1.2)))
+                    periods.append(RentPeriod(
+                        client_id=rng.choice(client_ids), plan_id=plan_id,
+                        started_at=started_at, finished_at=finished_at, updated_at=finished_at,
+                    ))
+                periods = RentPeriod.objects.bulk_create(periods)
+                RentPeriodCarUsage.objects.bulk_create([
+                    RentPeriodCarUsage(
+                        period=period, transport_id=rng.choice(transport_ids),
+                        started_at=period.started_at, finished_at=period.finished_at,
+                        starting_station_id=rng.choice(station_ids), finishing_station_id=rng.choice(station_ids),
+                    )
+                    for period in periods
+                ])
+                created_rides += count
+
+    # bulk inserts bypass the model signals that keep cached inventory in step
+    cache.bump_station_list()
+    cache.bump_stations(station_ids)
+    geo.invalidate()
+    utilization.invalidate()
+    return {
+        "stations": stations, "models": models, "transports": transports, "clients": clients, "rides": rides,
+    }
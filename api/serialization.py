@@ -0,0 +1,90 @@
+
+
+from typing import Iterable
+
+from .models import Plan, RebalancingMove, TransportModel
+
+
+# payloads built from .values() rows, key for key the same as the as_dict properties of the models
+
+TRANSPORT_MODEL_FIELDS = (
+    'id', 'name', 'description', 'image', 'image_variants', 'type_id', 'type__name',
+    'classification_id', 'classification__name', 'classification__minimal_rating',
+)
+STATION_FIELDS = ('id', 'address', 'short_name', 'max_cars', 'occupancy', 'latitude', 'longitude')
+PLAN_FIELDS = ('id', 'name', 'price', 'description', 'time_min')
+REBALANCING_MOVE_FIELDS = ('id', 'from_station_id', 'to_station_id', 'model_id', 'count', 'completed_at')
+
+
+def transport_models(rows: Iterable[dict]) -> dict[int, dict]:
+    # a type or class is built once and shared by every model that has it
+    storage = TransportModel._meta.get_field('image').storage
+    types, classes, models = {}, {}, {}
+    for row in rows:
+        transport_type = types.get(row['type_id'])
+        if transport_type is None:
+            transport_type = types[row['type_id']] = {"id": row['type_id'], "name": row['type__name']}
+        transport_class = classes.get(row['classification_id'])
+        if transport_class is None:
+            transport_class = classes[row['classification_id']] = {
+                "id": row['classification_id'],
+                "name": row['classification__name'],
+                "minimalRating": row['classification__minimal_rating'],
+            }
+        models[row['id']] = {
+            "id": row['id'],
+            "type": transport_type,
+            "classification": transport_class,
+            "name": row['name'],
+            "description": row['description'],
+            "imageUrl": storage.url(row['image']),
+            "imageVariants": TransportModel.image_variant_urls(row['image_variants']),
+            "count": None,
+        }
+    return models
+
+
+def station(row: dict, available_models: list[dict]) -> dict:
+    return {
+        "id": row['id'],
+        "address": row['address'],
+        "shortName": row['short_name'],
+        "maxCars": row['max_cars'],
+        "occupancy": row['occupancy'],
+        "latitude": row['latitude'],
+        "longitude": row['longitude'],
+        "availableModels": available_models,
+    }
+
+
+def plan(row: dict) -> dict:
+    return {
+        "id": row['id'],
+        "name": row['name'],
+        # the JSON encoder writes decimals as floats anyway, converting here spares it the fallback call
+        "price": float(row['price']),
+        "description": row['description'],
+        "timeMin": row['time_min'],
+    }
+
+
+def plans_queryset():
+    return Plan.objects.order_by('id').values(*PLAN_FIELDS)
+
+
+def rebalancing_move(row: dict) -> dict:
+    return {
+        "id": row['id'],
+        "fromStationId": row['from_station_id'],
+        "toStationId": row['to_station_id'],
+        "modelId": row['model_id'],
+        "count": row['count'],
+        "completedAt": row['completed_at'],
+    }
+
+
+def rebalancing_moves(plan_id: int) -> list[dict]:
+    return [
+        rebalancing_move(row)
+        for row in RebalancingMove.objects.filter(plan_id=plan_id).order_by('id').values(*REBALANCING_MOVE_FIELDS)
+    ]
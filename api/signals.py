@@ -0,0 +1,97 @@
+
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import auth, cache, events, geo, images, metrics, utilization
+from .models import (AccountingRollup, Client, ParkingStation, Plan, RentPeriodCarUsage, Transport, TransportClass,
+                     TransportModel, TransportType)
+
+
+@receiver(post_save, sender=Transport)
+def transport_saved(sender, instance: Transport, created: bool, **kwargs):
+    loaded_parking_id = getattr(instance, "_loaded_parking_id", None)
+    loaded_model_id = getattr(instance, "_loaded_model_id", None)
+    if created or instance.parking_id != loaded_parking_id or instance.model_id != loaded_model_id:
+        cache.bump_stations([instance.parking_id, loaded_parking_id])
+        events.inventory_changed([(instance.parking_id, instance.model_id), (loaded_parking_id, loaded_model_id)])
+
+
+@receiver(post_delete, sender=Transport)
+def transport_deleted(sender, instance: Transport, **kwargs):
+    ParkingStation.move_transport(instance.parking_id, None)
+    cache.bump_stations([instance.parking_id])
+    events.inventory_changed([(instance.parking_id, instance.model_id)])
+
+
+@receiver(post_save, sender=ParkingStation)
+def parking_station_saved(sender, instance: ParkingStation, created: bool, **kwargs):
+    if created:
+        cache.bump_station_list()
+    cache.bump_stations([instance.id])
+    geo.station_changed(instance.id, instance.latitude, instance.longitude)
+
+
+@receiver(pre_delete, sender=ParkingStation)
+def parking_station_deleting(sender, instance: ParkingStation, **kwargs):
+    AccountingRollup.fold_station(instance.id)
+
+
+@receiver(post_delete, sender=ParkingStation)
+def parking_station_deleted(sender, instance: ParkingStation, **kwargs):
+    cache.bump_station_list()
+    cache.bump_stations([instance.id])
+    geo.station_changed(instance.id, None, None)
+
+
+@receiver([post_save, post_delete], sender=TransportModel)
+def transport_model_changed(sender, instance: TransportModel, **kwargs):
+    cache.bump_stations_with_models([instance.id])
+
+
+@receiver(post_save, sender=TransportModel)
+def transport_model_saved(sender, instance: TransportModel, created: bool, **kwargs):
+    if instance.image and (created or instance.image.name != getattr(instance, "_loaded_image", None)):
+        images.schedule(instance.id, instance.image.name)
+
+
+@receiver(post_delete, sender=TransportModel)
+def transport_model_deleted(sender, instance: TransportModel, **kwargs):
+    images.schedule_delete(instance.image_variants)
+
+
+@receiver([post_save, post_delete], sender=TransportType)
+def transport_type_changed(sender, instance: TransportType, **kwargs):
+    cache.bump_stations_with_models(instance.transportmodel_set.values_list("id", flat=True))
+
+
+@receiver([post_save, post_delete], sender=TransportClass)
+def transport_class_changed(sender, instance: TransportClass, **kwargs):
+    cache.bump_stations_with_models(instance.transportmodel_set.values_list("id", flat=True))
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def plan_changed(sender, instance: Plan, **kwargs):
+    cache.bump_plans()
+
+
+@receiver(post_save, sender=RentPeriodCarUsage)
+def ride_saved(sender, instance: RentPeriodCarUsage, created: bool, **kwargs):
+    before = None if created else getattr(instance, "_loaded_utilization_state", None)
+    utilization.ride_changed(before, instance.utilization_state())
+
+
+@receiver(post_delete, sender=RentPeriodCarUsage)
+def ride_deleted(sender, instance: RentPeriodCarUsage, **kwargs):
+    utilization.ride_changed(instance.utilization_state(), None)
+
+
+@receiver([post_save, post_delete], sender=Client)
+def client_changed(sender, instance: Client, **kwargs):
+    auth.forget(instance.id)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.install_query_recorder(connection)
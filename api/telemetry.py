@@ -0,0 +1,214 @@
+
+
+import datetime
+import logging
+import threading
+import time
+from typing import Optional
+
+import orjson
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+
+
+BUFFER_SIZE = getattr(settings, 'API_TELEMETRY_BUFFER_SIZE', 5000)
+FLUSH_SECONDS = getattr(settings, 'API_TELEMETRY_FLUSH_SECONDS', 1.0)
+MAX_BATCH = getattr(settings, 'API_TELEMETRY_MAX_BATCH', 10_000)
+# while writes keep failing the readings pile up in memory, past this many new ones are turned away
+MAX_BUFFERED = getattr(settings, 'API_TELEMETRY_MAX_BUFFERED', 50_000)
+# a reading from the future would hold the fuel level until that moment, clocks may only be this far ahead
+MAX_CLOCK_SKEW = 300
+
+READING_FIELDS = ('transportId', 'recordedAt', 'fuel', 'latitude', 'longitude')
+
+logger = logging.getLogger('api.telemetry')
+
+
+class TelemetryBufferFull(Exception):
+    pass
+
+
+def _number(value, low: float, high: float) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and low <= value <= high
+
+
+def _reading(item, now: float) -> tuple:
+    # an object with READING_FIELDS or the same values as a compact array, the position is optional
+    if isinstance(item, dict):
+        item = [item.get(field) for field in READING_FIELDS]
+    if not isinstance(item, list) or len(item) not in (3, 5):
+        raise ValueError("A reading must be an object or an array of 3 or 5 values")
+    transport_id, recorded_at, fuel, latitude, longitude = item if len(item) == 5 else [*item, None, None]
+
+    if not isinstance(transport_id, int) or isinstance(transport_id, bool):
+        raise ValueError("transportId must be an integer")
+    if not _number(recorded_at, 0, now + MAX_CLOCK_SKEW):
+        raise ValueError("recordedAt must be a unix timestamp that is not in the future")
+    if not isinstance(fuel, int) or not _number(fuel, 0, 100):
+        raise ValueError("fuel must be an integer percent")
+    if (latitude is None) != (longitude is None) or latitude is not None and not (
+            _number(latitude, -90, 90) and _number(longitude, -180, 180)):
+        raise ValueError("latitude and longitude must be given together and be valid coordinates")
+    return transport_id, recorded_at, fuel, latitude, longitude
+
+
+def parse(body: bytes, content_type: str) -> list[tuple]:
+    # newline delimited JSON, or a JSON array of readings
+    if content_type.split(';')[0].strip() == 'application/x-ndjson':
+        items = [orjson.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = orjson.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("Readings must be sent as a JSON array")
+    if len(items) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} readings can be sent at once")
+    now = time.time()
+    return [_reading(item, now) for item in items]
+
+
+def _moment(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def _execute_many(sql: str, rows: list[tuple]):
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def write(readings: list[tuple], latest: dict[int, tuple[float, int]]):
+    # every reading is kept, only the newest fuel level per transport goes to the transport row. both are
+    # plain executemany statements: bulk_create spends most of a flush preparing values field by field, and
+    # bulk_update builds a CASE over thousands of ids
+    Transport = apps.get_model('api', 'Transport')
+    TelemetryReading = apps.get_model('api', 'TelemetryReading')
+    quote = connection.ops.quote_name
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic():
+        # readings of transports that do not exist are dropped
+        known = set(Transport.objects.filter(id__in=list(latest)).values_list('id', flat=True))
+        moments = {recorded_at: adapt(_moment(recorded_at)) for _, recorded_at, _, _, _ in readings}
+
+        columns = ('transport_id', 'recorded_at', 'fuel', 'latitude', 'longitude')
+        _execute_many(
+            f'INSERT INTO {quote(TelemetryReading._meta.db_table)} ({", ".join(map(quote, columns))}) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            [
+                (transport_id, moments[recorded_at], fuel, latitude, longitude)
+                for transport_id, recorded_at, fuel, latitude, longitude in readings
+                if transport_id in known
+            ],
+        )
+
+        fuel, reported_at = quote('fuel'), quote('fuel_reported_at')
+        _execute_many(
+            f'UPDATE {quote(Transport._meta.db_table)} SET {fuel} = %s, {reported_at} = %s '
+            f'WHERE {quote("id")} = %s AND ({reported_at} IS NULL OR {reported_at} < %s)',
+            [
+                (fuel_level, moments[recorded_at], transport_id, moments[recorded_at])
+                for transport_id, (recorded_at, fuel_level) in latest.items()
+                if transport_id in known
+            ],
+        )
+
+
+# readings wait here until BUFFER_SIZE of them or FLUSH_SECONDS have gathered, then go out in one write, by a
+# timer when no more readings come; what a process holds when it stops is lost, at most FLUSH_SECONDS worth
+class TelemetryBuffer:
+    def __init__(self, size: int = BUFFER_SIZE, flush_seconds: float = FLUSH_SECONDS,
+                 max_buffered: int = MAX_BUFFERED):
+        self.size = size
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.readings = []
+        # transport id -> (recorded at, fuel) of its newest reading, pending and being written
+        self.latest = {}
+        self.writing = {}
+        self.started_at = None
+        self.timer = None
+
+    def __len__(self):
+        return len(self.readings)
+
+    def _start(self):
+        # under self.lock, when the first reading of a batch comes in
+        self.started_at = time.monotonic()
+        self.timer = threading.Timer(self.flush_seconds, self._flush_on_timer)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _flush_on_timer(self):
+        try:
+            self.try_flush()
+        finally:
+            # the timer thread is gone after this, nothing else would close its connection
+            connection.close()
+
+    def add(self, readings: list[tuple]):
+        with self.lock:
+            if len(self.readings) + len(readings) > self.max_buffered:
+                raise TelemetryBufferFull(f"{len(self.readings)} reading(s) are still waiting to be written")
+            self.readings.extend(readings)
+            for transport_id, recorded_at, fuel, _, _ in readings:
+                current = self.latest.get(transport_id)
+                if current is None or current[0] <= recorded_at:
+                    self.latest[transport_id] = (recorded_at, fuel)
+            if self.started_at is None:
+                self._start()
+            due = len(self.readings) >= self.size or time.monotonic() - self.started_at >= self.flush_seconds
+        if due:
+            self.try_flush()
+
+    def try_flush(self):
+        # the readings of a failed write stay buffered for the next flush, the devices that sent them are done
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Buffered telemetry could not be written, %s reading(s) kept for the next flush",
+                             len(self))
+
+    def latest_fuel(self, transport_id: int) -> Optional[int]:
+        with self.lock:
+            reading = self.latest.get(transport_id) or self.writing.get(transport_id)
+        return reading[1] if reading is not None else None
+
+    def flush(self) -> int:
+        with self.flush_lock:
+            with self.lock:
+                readings, self.readings = self.readings, []
+                self.writing, self.latest = self.latest, {}
+                self.started_at = None
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            try:
+                if readings:
+                    write(readings, self.writing)
+            except Exception:
+                # kept for the next flush rather than lost with a failed write
+                self.add_back(readings)
+                raise
+            finally:
+                with self.lock:
+                    self.writing = {}
+        return len(readings)
+
+    def add_back(self, readings: list[tuple]):
+        with self.lock:
+            self.readings[:0] = readings
+            # readings that came in during the failed write count against the cap too, the oldest give way
+            dropped = len(self.readings) - self.max_buffered
+            if dropped > 0:
+                del self.readings[:dropped]
+                logger.warning("Telemetry buffer is full, %s oldest reading(s) dropped", dropped)
+            for transport_id, reading in self.writing.items():
+                current = self.latest.get(transport_id)
+                if current is None or current[0] < reading[0]:
+                    self.latest[transport_id] = reading
+            if self.started_at is None:
+                self._start()
+
+
+buffer = TelemetryBuffer()
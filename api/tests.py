@@ -1,3 +1,1548 @@
 
 
-from django.test import TestCase
+import asyncio
+import io
+import itertools
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Optional
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import (archive, cache, events, export, geo, images, ledger, metrics, rebalancing, serialization, telemetry,
+               utilization)
+from .billing import FINE_PER_MINUTE, fine_overdue_periods
+from .cache import get_cache
+from .inventory import build_station_inventory
+from .models import (AccountingRollup, ArchivedRentPeriod, ArchivedRentPeriodCarUsage, ArchiveRun, BillingRun,
+                     Client, CompanyAccounting, ParkingStation, ParkingStationIsFull, Plan, RentPeriod,
+                     RentPeriodCarUsage, TelemetryReading, Transport, TransportClass, TransportModel, TransportType)
+from .admin import RentPeriodCarUsageAdmin
+from .auth import CachedModelBackend
+from .renderers import FastJSONRenderer
+from .seeding import explicit_timestamps, seed_fleet
+
+
+# as deployed with a shared cache, sessions and clients read from it. the tests run in one process, so the
+# local memory cache stands in for it
+SHARED_CACHE = {
+    "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+    "AUTHENTICATION_BACKENDS": ["api.auth.CachedModelBackend"],
+}
+
+
+def create_fleet(stations=1, cars_per_station=10):
+    transport_type = TransportType.objects.create(name="Car")
+    transport_class = TransportClass.objects.create(name="Economy", minimal_rating=1)
+    model = TransportModel.objects.create(
+        type=transport_type, classification=transport_class,
+        name="Dacia Sandero", description="Dacia Sandero", image="transport_images/sandero.png"
+    )
+    parking_stations = [
+        ParkingStation.objects.create(address=f"Station {i}", short_name=f"S{i}", max_cars=cars_per_station * 2)
+        for i in range(stations)
+    ]
+    Transport.objects.bulk_create([
+        Transport(model=model, parking=station, registry_number=f"A{station.id:03}{i:04}")
+        for station in parking_stations
+        for i in range(cars_per_station)
+    ])
+    ParkingStation.reconcile_occupancy()
+    plan = Plan.objects.create(name="Hour", price="300.00", description="One hour", time_min=60)
+    return parking_stations, model, plan
+
+
+class CheckoutTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=1)
+        self.client_ = Client.objects.create(username="client")
+
+    def test_take_car_claims_car(self):
+        self.client_.start_rent_period(self.plan.id)
+        car = self.client_.take_car(self.station.id, self.model.id)
+
+        car.refresh_from_db()
+        self.assertIsNone(car.parking_id)
+        self.assertEqual(car.used_by_client, self.client_)
+
+    def test_take_car_without_available_transport(self):
+        Transport.objects.update(parking=None)
+        self.client_.start_rent_period(self.plan.id)
+
+        with self.assertRaises(Transport.DoesNotExist):
+            self.client_.take_car(self.station.id, self.model.id)
+
+
+class OccupancyTestCase(TestCase):
+    def setUp(self):
+        (self.station, self.other_station), self.model, self.plan = create_fleet(stations=2, cars_per_station=2)
+        self.client_ = Client.objects.create(username="client")
+
+    def assertOccupancy(self, station: ParkingStation, occupancy: int):
+        station.refresh_from_db()
+        self.assertEqual(station.occupancy, occupancy)
+        self.assertEqual(station.transport_set.count(), occupancy)
+
+    def test_ride_moves_counters(self):
+        self.client_.start_rent_period(self.plan.id)
+        self.client_.take_car(self.station.id, self.model.id)
+        self.assertOccupancy(self.station, 1)
+
+        self.client_.end_all_rents(self.other_station.id)
+        self.assertOccupancy(self.station, 1)
+        self.assertOccupancy(self.other_station, 3)
+
+    def test_return_to_full_station(self):
+        ParkingStation.objects.filter(id=self.other_station.id).update(max_cars=2)
+        self.client_.start_rent_period(self.plan.id)
+        self.client_.take_car(self.station.id, self.model.id)
+
+        with self.assertRaises(ParkingStationIsFull):
+            self.client_.end_all_rents(self.other_station.id)
+        self.assertOccupancy(self.other_station, 2)
+        self.assertTrue(Client.objects.get(id=self.client_.id).is_on_ride)
+
+    def test_return_to_missing_station(self):
+        self.client_.start_rent_period(self.plan.id)
+        self.client_.take_car(self.station.id, self.model.id)
+
+        with self.assertRaises(ParkingStation.DoesNotExist):
+            self.client_.end_all_rents(self.other_station.id + 100)
+        self.assertTrue(Client.objects.get(id=self.client_.id).is_on_ride)
+
+        self.client.force_login(self.client_)
+        response = self.client.post("/api/end_ride", {"parkingStationId": self.other_station.id + 100},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "There is no such parking station")
+
+    def test_saving_a_station_keeps_occupancy(self):
+        station = ParkingStation.objects.get(id=self.station.id)
+        self.client_.start_rent_period(self.plan.id)
+        self.client_.take_car(self.station.id, self.model.id)
+        station.address = "Renamed"
+        station.save()
+        self.assertOccupancy(self.station, 1)
+        self.assertEqual(self.station.address, "Renamed")
+
+    def test_reconcile_occupancy(self):
+        ParkingStation.objects.update(occupancy=0)
+        self.assertCountEqual(ParkingStation.reconcile_occupancy(), [self.station.id, self.other_station.id])
+        self.assertOccupancy(self.station, 2)
+        self.assertEqual(ParkingStation.reconcile_occupancy(), [])
+
+
+class InventoryTestCase(TestCase):
+    def test_queries_do_not_grow_with_stations(self):
+        create_fleet(stations=1, cars_per_station=3)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(build_station_inventory()), 1)
+
+        seed_fleet(stations=30, models=5, transports=300, clients=1, seed=2)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(build_station_inventory()), 31)
+
+    def test_filters(self):
+        (station, other_station), model, _ = create_fleet(stations=2, cars_per_station=2)
+        premium = TransportClass.objects.create(name="Premium", minimal_rating=80)
+        van = TransportModel.objects.create(
+            type=TransportType.objects.create(name="Van"), classification=premium,
+            name="Dacia Dokker", description="Dacia Dokker", image="transport_images/dokker.png",
+        )
+        Transport.objects.create(model=van, parking=station, registry_number="V0001")
+
+        def available(**filters) -> dict:
+            return {
+                item["id"]: {entry["id"]: entry["count"] for entry in item["availableModels"]}
+                for item in build_station_inventory(**filters)
+            }
+
+        self.assertEqual(available(), {station.id: {model.id: 2, van.id: 1}, other_station.id: {model.id: 2}})
+        self.assertEqual(available(station_ids=[other_station.id]), {other_station.id: {model.id: 2}})
+        self.assertEqual(available(transport_type_id=van.type_id), {station.id: {van.id: 1}, other_station.id: {}})
+        self.assertEqual(available(transport_class_id=premium.id), {station.id: {van.id: 1}, other_station.id: {}})
+        self.assertEqual(available(minimal_rating=50), {station.id: {model.id: 2}, other_station.id: {model.id: 2}})
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        (self.station, self.other_station), self.model, self.plan = create_fleet(stations=2, cars_per_station=2)
+
+    def versions(self) -> dict:
+        keys = [cache._station_version_key(self.station.id), cache._station_version_key(self.other_station.id)]
+        versions = cache._get_versions(keys)
+        return {"station": versions[keys[0]], "other": versions[keys[1]], "plans": cache.plans_version()}
+
+    def test_changes_bump_only_their_keys(self):
+        before = self.versions()
+        car = Transport.objects.create(model=self.model, parking=self.station, registry_number="B0001")
+        after = self.versions()
+        self.assertNotEqual(after["station"], before["station"])
+        self.assertEqual((after["other"], after["plans"]), (before["other"], before["plans"]))
+
+        # saving a car that stays where it is changes nothing a station lists
+        car.registry_number = "B0002"
+        car.save()
+        self.assertEqual(self.versions(), after)
+
+        car.parking = self.other_station
+        car.save()
+        moved = self.versions()
+        self.assertNotEqual(moved["station"], after["station"])
+        self.assertNotEqual(moved["other"], after["other"])
+        self.assertEqual(moved["plans"], after["plans"])
+
+        self.plan.price = "350.00"
+        self.plan.save()
+        repriced = self.versions()
+        self.assertNotEqual(repriced["plans"], moved["plans"])
+        self.assertEqual((repriced["station"], repriced["other"]), (moved["station"], moved["other"]))
+
+    def test_stats_count_hits_and_misses(self):
+        cache.reset_stats()
+        cache.get_station_inventory()
+        self.assertEqual(cache.get_stats(), {"hits": 0, "misses": 2})
+        cache.get_station_inventory()
+        self.assertEqual(cache.get_stats(), {"hits": 2, "misses": 2})
+
+        Transport.objects.create(model=self.model, parking=self.station, registry_number="B0001")
+        inventory = cache.get_station_inventory()
+        self.assertEqual(cache.get_stats(), {"hits": 3, "misses": 3})
+        self.assertEqual(inventory[0]["availableModels"][0]["count"], 3)
+
+        cache.get_plans()
+        cache.get_plans()
+        self.assertEqual(cache.get_stats(), {"hits": 4, "misses": 4})
+
+
+class CacheCommitTestCase(TransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=2)
+        self.client_ = Client.objects.create(username="client")
+        self.client_.start_rent_period(self.plan.id)
+
+    def count(self, inventory: list[dict]) -> int:
+        return inventory[0]["availableModels"][0]["count"]
+
+    def checkout_while(self, read):
+        # read runs while the checkout is written but not committed yet, and sees the rows from before it,
+        # like every other connection does until the commit
+        before = build_station_inventory([self.station.id])
+        written, committed = threading.Event(), threading.Event()
+
+        def checkout():
+            try:
+                with transaction.atomic():
+                    self.client_.take_car(self.station.id, self.model.id)
+                    written.set()
+                    committed.wait()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        written.wait()
+        try:
+            with (
+                mock.patch.object(cache, "build_station_inventory", return_value=before),
+                mock.patch.object(cache, "abuild_station_inventory", mock.AsyncMock(return_value=before)),
+            ):
+                read()
+        finally:
+            committed.set()
+            thread.join()
+
+    def test_read_during_checkout_is_not_cached_past_the_commit(self):
+        self.assertEqual(self.count(cache.get_station_inventory()), 2)
+        self.checkout_while(lambda: self.assertEqual(self.count(cache.get_station_inventory()), 2))
+        self.assertEqual(self.count(cache.get_station_inventory()), 1)
+
+    def test_etag_read_during_checkout_is_not_confirmed_after_the_commit(self):
+        self.client.get("/api/available_transport")
+        responses = []
+        self.checkout_while(lambda: responses.append(self.client.get("/api/available_transport")))
+        self.assertEqual(self.count(responses[0].json()["data"]), 2)
+
+        response = self.client.get("/api/available_transport", headers={"If-None-Match": responses[0]["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.count(response.json()["data"]), 1)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        (self.station,), _, self.plan = create_fleet(cars_per_station=2)
+
+    def assertRevalidates(self, path: str, change) -> str:
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertEqual(self.client.get(path, headers={"If-None-Match": etag}).status_code, 304)
+
+        change()
+        response = self.client.get(path, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        return response.json()["data"]
+
+    def test_station_change_makes_new_etag(self):
+        def rename():
+            self.station.address = "Renamed"
+            self.station.save()
+        data = self.assertRevalidates("/api/available_transport", rename)
+        self.assertEqual(data[0]["address"], "Renamed")
+
+    def test_plan_change_makes_new_etag(self):
+        def reprice():
+            self.plan.price = "350.00"
+            self.plan.save()
+        data = self.assertRevalidates("/api/available_plans", reprice)
+        self.assertEqual(data[0]["price"], 350.0)
+
+
+class ActiveRideIndexTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=2)
+        self.client_ = Client.objects.create(username="client")
+        self.client_.start_rent_period(self.plan.id)
+        self.car = self.client_.take_car(self.station.id, self.model.id)
+
+    def test_ride_lookups_use_their_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("postgres rightly scans tables this small")
+        period = self.client_.active_rent_period
+        lookups = {
+            "rentperiod_active_client_idx": self.client_._active_rent_period_query(),
+            "usage_active_period_idx": RentPeriodCarUsage.objects.filter(period=period, finished_at__isnull=True),
+            "usage_active_transport_idx": RentPeriodCarUsage.objects.filter(
+                transport=self.car, finished_at__isnull=True, finishing_station__isnull=True
+            ),
+            "transport_parking_model_idx": Transport.objects.filter(model=self.model, parking=self.station),
+        }
+        for index, queryset in lookups.items():
+            with self.subTest(index=index):
+                self.assertIn(index, queryset.explain())
+
+
+class SqlitePragmasTestCase(TestCase):
+    def test_connections_apply_the_setting(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("pragmas are sqlite only")
+        for synchronous, expected in (("NORMAL", 1), ("OFF", 0)):
+            with self.subTest(synchronous=synchronous), self.settings(API_SQLITE_PRAGMAS={"synchronous": synchronous}):
+                new_connection = connections.create_connection("default")
+                try:
+                    with new_connection.cursor() as cursor:
+                        cursor.execute("PRAGMA synchronous")
+                        self.assertEqual(cursor.fetchone()[0], expected)
+                finally:
+                    new_connection.close()
+
+
+class ConcurrentCheckoutTestCase(TransactionTestCase):
+    threads = 16
+    cars = 10
+
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=self.cars)
+        self.clients = [
+            Client.objects.create(username=f"client{i}")
+            for i in range(self.threads)
+        ]
+
+    def checkout(self, client: Client, barrier: threading.Barrier, results: list):
+        barrier.wait()
+        try:
+            for _ in range(100):
+                try:
+                    with transaction.atomic():
+                        client.start_rent_period(self.plan.id)
+                        car = client.take_car(self.station.id, self.model.id)
+                    results.append(car.id)
+                    return
+                except OperationalError:
+                    # sqlite reports lock contention instead of blocking, retry like a client would
+                    time.sleep(0.005)
+                except Transport.DoesNotExist:
+                    return
+        finally:
+            connection.close()
+
+    def test_no_double_allocation(self):
+        barrier = threading.Barrier(self.threads)
+        results = []
+        threads = [
+            threading.Thread(target=self.checkout, args=(client, barrier, results))
+            for client in self.clients
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.cars)
+        self.assertFalse([car_id for car_id, n in Counter(results).items() if n > 1])
+        self.assertFalse(Transport.objects.filter(parking=self.station).exists())
+        self.assertEqual(RentPeriod.objects.count(), self.cars)
+        self.assertEqual(RentPeriodCarUsage.objects.count(), self.cars)
+
+
+class RideStateTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=2)
+        Client.objects.create(username="client")
+        self.client_ = Client.objects.get(username="client")
+
+    def test_ride_state_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(self.client_.is_on_ride)
+            self.assertIsNone(self.client_.active_car_usage_period)
+            self.client_.json()
+
+    def test_ride_state_follows_ride_methods(self):
+        self.client_.start_rent_period(self.plan.id)
+        car = self.client_.take_car(self.station.id, self.model.id)
+        self.assertEqual(self.client_.active_car_usage_period.transport, car)
+
+        client = Client.objects.get(id=self.client_.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(client.active_rent_period, self.client_.active_rent_period)
+            self.assertEqual(client.active_car_usage_period.transport, car)
+
+        self.client_.end_all_rents(self.station.id)
+        self.assertFalse(self.client_.is_on_ride)
+        self.assertFalse(Client.objects.get(id=self.client_.id).is_on_ride)
+
+
+class OvertimeFineTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=3)
+        self.client_ = Client.objects.create(username="client")
+        self.now = timezone.now()
+
+    def start_period(self, minutes_ago: int, finished_minutes_ago: Optional[int] = None) -> RentPeriod:
+        now = self.now
+        period = RentPeriod.objects.create(client=self.client_, plan=self.plan)
+        RentPeriod.objects.filter(id=period.id).update(
+            started_at=now - timedelta(minutes=minutes_ago),
+            finished_at=now - timedelta(minutes=finished_minutes_ago) if finished_minutes_ago is not None else None,
+        )
+        return period
+
+    def test_fines_overdue_periods(self):
+        in_time = self.start_period(30, finished_minutes_ago=0)
+        late = self.start_period(90, finished_minutes_ago=10)
+        open_late = self.start_period(75)
+
+        run = fine_overdue_periods(now=self.now)
+
+        fines = dict(RentPeriod.objects.values_list("id", "fine_overtime"))
+        self.assertEqual(fines[in_time.id], 0)
+        self.assertEqual(fines[late.id], 20 * FINE_PER_MINUTE)
+        self.assertEqual(fines[open_late.id], 15 * FINE_PER_MINUTE)
+        self.assertEqual((run.fined_periods, run.billed_periods), (2, 1))
+        self.assertEqual(CompanyAccounting.objects.get().amount, 20 * FINE_PER_MINUTE)
+
+    def test_incremental_run_books_fine_once(self):
+        self.start_period(90, finished_minutes_ago=10)
+        fine_overdue_periods()
+
+        run = fine_overdue_periods()
+        self.assertEqual((run.fined_periods, run.billed_periods), (0, 0))
+        self.assertEqual(CompanyAccounting.objects.count(), 1)
+
+
+class RefuelTestCase(TestCase):
+    def setUp(self):
+        (self.station, self.other_station), self.model, self.plan = create_fleet(stations=2, cars_per_station=3)
+
+    def test_save_books_refuel(self):
+        transport = Transport.objects.filter(parking=self.station).first()
+        transport.fuel = 20
+        transport.save()
+
+        entry = CompanyAccounting.objects.get()
+        self.assertEqual(entry.refuelled_percent, 80)
+        self.assertEqual((entry.transport, entry.parking_station), (transport, self.station))
+        self.assertTrue(entry.is_expense)
+
+    def test_batched_refuels_are_inserted_at_once(self):
+        transports = list(Transport.objects.all())
+        for transport in transports:
+            transport.fuel = 10
+        with CaptureQueriesContext(connection) as queries, ledger.batch():
+            for transport in transports:
+                transport.save()
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "api_companyaccounting"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(CompanyAccounting.objects.count(), len(transports))
+
+    def test_refuel_at_stations(self):
+        Transport.objects.update(fuel=10)
+        Transport.objects.filter(parking=self.station).update(fuel=50)
+
+        self.assertEqual(Transport.refuel_at_stations([self.other_station.id]), 3)
+        self.assertEqual(Transport.refuel_at_stations(threshold=60), 3)
+        self.assertFalse(Transport.objects.exclude(fuel=100).exists())
+        refuels = CompanyAccounting.objects.filter(parking_station=self.station)
+        self.assertEqual(list(refuels.values_list("refuelled_percent", flat=True)), [50] * 3)
+
+
+class AccountingRollupTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=2)
+
+    def test_entries_update_rollups(self):
+        CompanyAccounting.objects.create(amount=100, description="Fine", category=CompanyAccounting.CATEGORY_FINE)
+        CompanyAccounting.objects.bulk_create([
+            CompanyAccounting.refuel(transport.id, self.station.id, 50) for transport in Transport.objects.all()
+        ])
+
+        day = AccountingRollup.objects.get(
+            period=AccountingRollup.PERIOD_DAY, category=CompanyAccounting.CATEGORY_REFUEL, parking_station=self.station
+        )
+        self.assertEqual((day.income, day.expense, day.net), (0, 500, -500))
+        month = AccountingRollup.objects.get(
+            period=AccountingRollup.PERIOD_MONTH, category=CompanyAccounting.CATEGORY_FINE
+        )
+        self.assertEqual((month.income, month.net), (100, 100))
+
+        fields = ("period", "period_start", "category", "parking_station", "income", "expense", "net")
+        rollups = set(AccountingRollup.objects.values_list(*fields))
+        AccountingRollup.rebuild()
+        self.assertEqual(set(AccountingRollup.objects.values_list(*fields)), rollups)
+
+    def test_deleted_station_folds_into_no_station(self):
+        CompanyAccounting.objects.create(amount=100, description="Fine", category=CompanyAccounting.CATEGORY_FINE)
+        CompanyAccounting.objects.bulk_create([
+            CompanyAccounting.refuel(transport.id, self.station.id, 50) for transport in Transport.objects.all()
+        ])
+        CompanyAccounting.objects.create(amount=-20, description="Refuel", category=CompanyAccounting.CATEGORY_REFUEL)
+        self.station.delete()
+
+        fields = ("period", "period_start", "category", "parking_station", "income", "expense", "net")
+        rollups = set(AccountingRollup.objects.values_list(*fields))
+        self.assertIn(Decimal(-520), {net for *_, net in rollups})
+        AccountingRollup.rebuild()
+        self.assertEqual(set(AccountingRollup.objects.values_list(*fields)), rollups)
+
+    def test_admin_cannot_edit_the_ledger(self):
+        self.client.force_login(Client.objects.create(username="admin", is_staff=True, is_superuser=True))
+        entry = CompanyAccounting.objects.create(
+            amount=100, description="Fine", category=CompanyAccounting.CATEGORY_FINE
+        )
+        rollup = AccountingRollup.objects.first()
+        for path in (f"/admin/api/companyaccounting/{entry.id}/delete/", "/admin/api/accountingrollup/add/",
+                     f"/admin/api/accountingrollup/{rollup.id}/delete/"):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.post(path, {"post": "yes"}).status_code, 403)
+        response = self.client.post(f"/admin/api/companyaccounting/{entry.id}/change/", {"amount": "5"})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(CompanyAccounting.objects.get(id=entry.id).amount, 100)
+        self.assertEqual(self.client.get("/admin/api/companyaccounting/add/").status_code, 200)
+
+    @override_settings(**SHARED_CACHE)
+    def test_report_reads_rollups(self):
+        staff = Client.objects.create(username="finance", is_staff=True)
+        CompanyAccounting.objects.create(amount=100, description="Fine", category=CompanyAccounting.CATEGORY_FINE)
+        self.client.force_login(staff)
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/accounting/report", {"period": "month"})
+        self.assertEqual([row["category"] for row in response.json()["data"]], [CompanyAccounting.CATEGORY_FINE])
+
+
+class ExportRidesTestCase(TestCase):
+    def setUp(self):
+        (self.station, self.other_station), self.model, self.plan = create_fleet(stations=2, cars_per_station=3)
+        for i in range(5):
+            client = Client.objects.create(username=f"client{i}")
+            client.start_rent_period(self.plan.id)
+            client.take_car(self.station.id if i % 2 else self.other_station.id, self.model.id)
+            client.end_all_rents(self.station.id)
+
+    def test_keyset_pages(self):
+        with CaptureQueriesContext(connection) as queries:
+            rides = list(export.iter_rides(chunk_size=2))
+        ride_ids = sorted(RentPeriodCarUsage.objects.values_list("id", flat=True))
+        self.assertEqual([ride["id"] for ride in rides], ride_ids)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(rides[0]["clientUsername"], "client0")
+
+    def test_export_endpoint(self):
+        self.client.force_login(Client.objects.create(username="staff", is_staff=True))
+
+        response = self.client.get("/api/export/rides", {"stationId": self.other_station.id})
+        rides = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rides), 3)
+
+        response = self.client.get("/api/export/rides", {"exportFormat": "csv"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(","), list(export.RIDE_FIELDS))
+        self.assertEqual(len(lines), 6)
+
+
+class EndRideLedgerTestCase(TransactionTestCase):
+    def test_refuel_expenses_commit_with_the_ride(self):
+        (station,), model, plan = create_fleet(cars_per_station=1)
+        Transport.objects.update(fuel=10)
+        user = Client.objects.create(username="client")
+        self.client.force_login(user)
+        self.client.post("/api/start_ride", {"carId": model.id, "planId": plan.id, "parkingStationId": station.id},
+                         content_type="application/json")
+        entries = CompanyAccounting.objects.count()
+
+        with mock.patch.object(ledger, "flush", side_effect=OperationalError("disk I/O error")):
+            with self.assertRaises(OperationalError):
+                self.client.post("/api/end_ride", {"parkingStationId": station.id}, content_type="application/json")
+        # the ride is not ended without the expense of its refuel
+        self.assertTrue(RentPeriodCarUsage.objects.filter(finished_at__isnull=True).exists())
+        self.assertEqual(CompanyAccounting.objects.count(), entries)
+
+
+# counted as deployed with a shared cache, which keeps the session and the client out of the database
+@override_settings(**SHARED_CACHE)
+class QueryBudgetTestCase(TestCase):
+    # the number of queries of the hot endpoints must not grow with the fleet
+    AVAILABLE_TRANSPORT_QUERIES = 4
+    FILTERED_AVAILABLE_TRANSPORT_QUERIES = 3
+    START_RIDE_QUERIES = 13
+    # the ride and its refuel expenses commit together, end_all_rents runs in a savepoint of that transaction
+    END_RIDE_QUERIES = 9
+
+    def setUp(self):
+        get_cache().clear()
+
+    def assertQueryBudget(self, fleets: list[dict]):
+        for fleet in fleets:
+            with self.subTest(**fleet):
+                seed_fleet(**fleet, clients=2, rides=fleet["transports"])
+                get_cache().clear()
+                user = Client.objects.order_by("-id").first()
+                self.client.force_login(user)
+                station = ParkingStation.objects.order_by("-occupancy").first()
+                model_id = station.transport_set.values_list("model_id", flat=True).first()
+                plan_id = Plan.objects.values_list("id", flat=True).first()
+                # a full tank keeps the return from refuelling, which would add ledger writes
+                Transport.objects.update(fuel=100)
+
+                with self.assertNumQueries(self.AVAILABLE_TRANSPORT_QUERIES):
+                    self.client.get("/api/available_transport")
+                with self.assertNumQueries(self.FILTERED_AVAILABLE_TRANSPORT_QUERIES):
+                    self.client.get("/api/available_transport", {"minimalRating": 50})
+                with self.assertNumQueries(self.START_RIDE_QUERIES):
+                    response = self.client.post("/api/start_ride", {
+                        "carId": model_id, "planId": plan_id, "parkingStationId": station.id,
+                    }, content_type="application/json")
+                self.assertTrue(response.json()["success"])
+                with self.assertNumQueries(self.END_RIDE_QUERIES):
+                    self.client.post("/api/end_ride", {"parkingStationId": station.id}, content_type="application/json")
+
+    def test_hot_endpoints_do_not_scale_with_fleet(self):
+        self.assertQueryBudget([
+            {"stations": 3, "models": 2, "transports": 20},
+            {"stations": 60, "models": 15, "transports": 600},
+        ])
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        metrics.registry.reset()
+
+    def test_requests_are_recorded_per_route(self):
+        create_fleet()
+        self.client.get("/api/available_transport")
+        self.client.get("/api/available_plans")
+        staff = Client.objects.create(username="staff", is_staff=True)
+        self.client.force_login(staff)
+
+        response = self.client.get("/api/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('api_request_duration_seconds_count{route="available_transport",method="GET"} 1', body)
+        self.assertIn('api_responses_total{route="available_plans",method="GET",status="200"} 1', body)
+        self.assertIn('api_request_queries_bucket{route="available_transport",method="GET",le="+Inf"} 1', body)
+
+    def test_metrics_require_staff_or_token(self):
+        self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+        with self.settings(API_METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/api/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get("/api/metrics", HTTP_AUTHORIZATION="Bearer secrét").status_code, 403)
+            self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/api/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        create_fleet()
+        with self.settings(API_SLOW_REQUEST_MS=0, API_SLOW_REQUEST_SAMPLES=1), \
+                self.assertLogs("api.slow_requests", level="WARNING") as logs:
+            self.client.get("/api/available_transport")
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("SELECT", logs.output[0])
+
+
+class AsyncReadEndpointsTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=2)
+        self.client_ = Client.objects.create(username="client")
+
+    async def test_get_me(self):
+        response = await self.async_client.get("/api/auth/get_me")
+        self.assertEqual(response.json(), {"success": False, "message": "You are not logged in"})
+
+        await self.async_client.aforce_login(self.client_)
+        response = await self.async_client.get("/api/auth/get_me")
+        self.assertEqual(response.json()["data"], {
+            "id": self.client_.id, "username": "client", "rating": self.client_.rating, "onRide": False,
+        })
+
+    async def test_available_transport_honours_etag(self):
+        response = await self.async_client.get("/api/available_transport")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"][0]["availableModels"][0]["count"], 2)
+
+        etag = response.headers["ETag"]
+        response = await self.async_client.get("/api/available_transport", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        # saving a car without moving it keeps the inventory, and so the etag, unchanged
+        car = await Transport.objects.filter(parking=self.station).afirst()
+        await sync_to_async(car.save)()
+        response = await self.async_client.get("/api/available_transport", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        await sync_to_async(Transport.objects.create)(model=self.model, parking=self.station, registry_number="B001")
+        response = await self.async_client.get("/api/available_transport", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"][0]["availableModels"][0]["count"], 3)
+
+    async def test_network_cache_is_not_called_on_the_event_loop(self):
+        blocking = []
+
+        def record(name: str, method):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    blocking.append(name)
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+            return wrapper
+
+        cache_ = get_cache()
+        await sync_to_async(cache_.clear)()
+        # the local memory cache of the tests stands in for a network one
+        in_process = mock.patch.object(cache, "IN_PROCESS_CACHES", ())
+        in_process.start()
+        self.addCleanup(in_process.stop)
+        for name in ("get", "set", "add", "incr", "get_many", "set_many", "get_or_set"):
+            patcher = mock.patch.object(cache_, name, record(name, getattr(cache_, name)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        nearest = {"latitude": 55.75, "longitude": 37.61}
+        for _ in range(2):
+            self.assertEqual((await self.async_client.get("/api/available_transport")).status_code, 200)
+            self.assertEqual((await self.async_client.get("/api/available_plans")).status_code, 200)
+            self.assertEqual((await self.async_client.get("/api/nearest_stations", nearest)).status_code, 200)
+        self.assertEqual(blocking, [])
+
+    async def test_invalid_filter(self):
+        response = await self.async_client.get("/api/available_transport", {"typeId": "car"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_plans_render_like_drf(self):
+        response = self.client.get("/api/available_plans")
+        self.assertEqual(response["Content-Type"], "application/json")
+        expected = JSONRenderer().render({"success": True, "data": [Plan.objects.get().as_dict]})
+        self.assertEqual(response.content, expected)
+
+
+class StationEventsTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(cars_per_station=2)
+        self.client_ = Client.objects.create(username="client")
+
+    def test_resume_from_last_event_id(self):
+        broadcaster = events.Broadcaster(events.InMemoryBackend(history=3))
+        first_id = broadcaster.last_id
+        broadcaster.publish([(1, {"count": 1}), (2, {"count": 2})])
+
+        frames = broadcaster.stream(first_id + 1)
+        self.assertEqual(next(frames), "retry: 3000\n\n")
+        self.assertEqual(next(frames), f'id: {first_id + 2}\nevent: station\ndata: {{"count":2}}\n\n')
+
+        broadcaster.publish([(1, {"count": 3}), (1, {"count": 4})])
+        self.assertEqual([event.id for event in broadcaster.backend.since(first_id + 1)], [
+            first_id + 2, first_id + 3, first_id + 4,
+        ])
+        # the first event has been dropped from the history, the client has to reload
+        self.assertIsNone(broadcaster.backend.since(first_id))
+        frames = broadcaster.stream(first_id, station_ids=[2])
+        next(frames)
+        self.assertEqual(next(frames), events.RESET_FRAME)
+
+    def test_rides_publish_station_deltas(self):
+        last_id = events.broadcaster.last_id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_.start_rent_period(self.plan.id)
+            self.client_.take_car(self.station.id, self.model.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_.end_all_rents(self.station.id)
+
+        published = [json.loads(event.frame.split("data: ")[1]) for event in events.broadcaster.backend.since(last_id)]
+        self.assertEqual([(event["stationId"], event["modelId"]) for event in published], [
+            (self.station.id, self.model.id), (self.station.id, self.model.id),
+        ])
+        self.assertEqual([event["count"] for event in published], [1, 2])
+        self.assertEqual([event["occupancy"] for event in published], [1, 2])
+
+    async def test_stream_resumes_missed_events(self):
+        last_id = events.broadcaster.last_id
+        events.broadcaster.publish([(self.station.id, {"stationId": self.station.id, "count": 5})])
+
+        response = await self.async_client.get(
+            "/api/events/stations", {"stationId": self.station.id}, headers={"Last-Event-ID": str(last_id)}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b"retry: 3000\n\n")
+        self.assertIn(b'data: {"stationId":%d,"count":5}' % self.station.id, await anext(chunks))
+        await chunks.aclose()
+
+
+class NearestStationsTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        geo.index.load([], None)
+
+    def test_index_matches_brute_force(self):
+        rng = random.Random(1)
+        stations = [(i, rng.uniform(55.5, 56.0), rng.uniform(37.0, 38.2)) for i in range(2000)]
+        index = geo.StationIndex(cell_degrees=0.02)
+        index.load(stations)
+        index.update(0, None, None)
+        index.update(1, 55.75, 37.6)
+        positions = {station_id: (latitude, longitude) for station_id, latitude, longitude in stations[2:]}
+        positions[1] = (55.75, 37.6)
+
+        for latitude, longitude in [(55.75, 37.62), (55.5, 37.0), (60.0, 30.0), (55.99, 38.19)]:
+            expected = sorted(
+                (geo.haversine_km(latitude, longitude, *position), station_id)
+                for station_id, position in positions.items()
+            )[:20]
+            self.assertEqual(list(itertools.islice(index.iter_nearest(latitude, longitude), 20)), expected)
+        self.assertEqual(len(list(index.iter_nearest(55.75, 37.62))), len(positions))
+
+    def test_nearest_stations_with_available_model(self):
+        stations, model, plan = create_fleet(stations=3, cars_per_station=1)
+        other_model = TransportModel.objects.create(
+            type=model.type, classification=model.classification, name="Logan", description="Logan",
+            image="transport_images/logan.png",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            for station, (latitude, longitude) in zip(stations, [(55.75, 37.62), (55.76, 37.62), (55.80, 37.62)]):
+                station.latitude, station.longitude = latitude, longitude
+                station.save()
+            Transport.objects.create(model=other_model, parking=stations[2], registry_number="L001")
+
+        response = self.client.get("/api/nearest_stations", {"latitude": 55.761, "longitude": 37.62, "limit": 2})
+        self.assertEqual([station["id"] for station in response.json()["data"]], [stations[1].id, stations[0].id])
+
+        response = self.client.get("/api/nearest_stations", {
+            "latitude": 55.761, "longitude": 37.62, "modelId": other_model.id,
+        })
+        data = response.json()["data"]
+        self.assertEqual([station["id"] for station in data], [stations[2].id])
+        self.assertEqual([model["name"] for model in data[0]["availableModels"]], ["Logan"])
+        self.assertAlmostEqual(data[0]["distanceKm"], 4.337, places=2)
+
+        # moving a station is applied to the index in place
+        with self.captureOnCommitCallbacks(execute=True):
+            stations[2].latitude = 55.7605
+            stations[2].save()
+        version = geo.index.version
+        response = self.client.get("/api/nearest_stations", {"latitude": 55.761, "longitude": 37.62, "limit": 1})
+        self.assertEqual([station["id"] for station in response.json()["data"]], [stations[2].id])
+        self.assertEqual(geo.index.version, version)
+
+    def test_invalid_coordinates(self):
+        self.assertEqual(self.client.get("/api/nearest_stations", {"latitude": 95, "longitude": 0}).status_code, 400)
+        self.assertEqual(self.client.get("/api/nearest_stations", {"latitude": 55}).status_code, 400)
+
+
+class RebalancingTestCase(TestCase):
+    def test_plan_moves(self):
+        occupancy, max_cars = np.array([12, 0, 5, 1, 10]), np.array([10, 10, 10, 10, 10])
+        latitude = np.array([55.0, 55.0, 55.0, np.nan, 55.0])
+        longitude = np.array([37.0, 37.1, 37.2, np.nan, 37.3])
+        pair_station, pair_model = np.array([0, 0, 2, 3, 4, 4]), np.array([1, 2, 1, 2, 1, 2])
+        pair_count = np.array([8, 4, 5, 1, 3, 7])
+
+        from_station, to_station, model, count, unresolved_overflow, unresolved_shortage = rebalancing.plan_moves(
+            occupancy, max_cars, latitude, longitude, pair_station, pair_model, pair_count
+        )
+        # the overflow of station 0 covers most of the shortage, one spare car of its most plentiful model the rest
+        self.assertEqual(list(zip(from_station, to_station, model, count)), [(0, 1, 1, 2), (0, 3, 1, 1)])
+        self.assertEqual((unresolved_overflow, unresolved_shortage), (0, 0))
+
+    def test_overflow_without_room_stays(self):
+        supply, demand, unresolved_overflow, unresolved_shortage = rebalancing.station_targets(
+            np.array([15, 8, 7]), np.array([10, 10, 10])
+        )
+        self.assertEqual((list(supply), list(demand)), ([1, 0, 0], [0, 0, 1]))
+        self.assertEqual((unresolved_overflow, unresolved_shortage), (4, 0))
+
+    def test_plan_resolves_seeded_imbalance(self):
+        seed_fleet(stations=40, models=5, transports=300, clients=1, seed=3)
+        rng = random.Random(3)
+        stations = list(ParkingStation.objects.all())
+        for station in stations:
+            station.max_cars = rng.randint(4, 12)
+        ParkingStation.objects.bulk_update(stations, ["max_cars"])
+
+        plan = rebalancing.create_plan()
+        counts = Counter(dict(((row["parking_id"], row["model_id"]), row["count"]) for row in (
+            Transport.objects.values("parking_id", "model_id").annotate(count=Count("id")).order_by()
+        )))
+        for move in plan.moves.all():
+            counts[move.from_station_id, move.model_id] -= move.count
+            counts[move.to_station_id, move.model_id] += move.count
+        self.assertFalse([key for key, count in counts.items() if count < 0])
+
+        occupancy = Counter()
+        for (station_id, _), count in counts.items():
+            occupancy[station_id] += count
+        self.assertEqual(
+            sum(max(occupancy[station.id] - station.max_cars, 0) for station in stations), plan.unresolved_overflow
+        )
+        self.assertEqual(
+            sum(max(math.ceil(station.max_cars * 0.2) - occupancy[station.id], 0) for station in stations),
+            plan.unresolved_shortage,
+        )
+        self.assertEqual(sum(move.count for move in plan.moves.all()), plan.moved_transports)
+        self.assertGreater(plan.moved_transports, 0)
+
+    def test_endpoint_is_staff_only(self):
+        create_fleet()
+        self.assertEqual(self.client.post("/api/rebalancing/plan").status_code, 403)
+        self.client.force_login(Client.objects.create(username="staff", is_staff=True))
+        self.assertEqual(self.client.get("/api/rebalancing/plan").status_code, 404)
+        self.assertEqual(self.client.post("/api/rebalancing/plan", {"minFill": 2}).status_code, 400)
+
+        response = self.client.post("/api/rebalancing/plan", {"minFill": 0.5, "maxFill": 0.5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["unresolvedOverflow"], 0)
+        self.assertEqual(self.client.get("/api/rebalancing/plan").json()["data"]["id"], response.json()["data"]["id"])
+
+
+class UtilizationTestCase(TestCase):
+    def setUp(self):
+        (self.station, self.other_station), self.model, _ = create_fleet(stations=2, cars_per_station=2)
+        self.transports = list(Transport.objects.order_by("id"))
+        self.now = datetime(2026, 1, 10, 12, 30, tzinfo=dt_timezone.utc)
+        utilization.invalidate()
+
+    def at(self, hour: int, minute: int) -> datetime:
+        return self.now.replace(hour=hour, minute=minute)
+
+    def add_ride(self, transport: Transport, started_at: datetime, finished_at: Optional[datetime],
+                 starting_station: ParkingStation, finishing_station: Optional[ParkingStation] = None):
+        with explicit_timestamps(RentPeriodCarUsage._meta.get_field("started_at")):
+            RentPeriodCarUsage.objects.bulk_create([RentPeriodCarUsage(
+                transport=transport, started_at=started_at, finished_at=finished_at,
+                starting_station=starting_station, finishing_station=finishing_station,
+            )])
+
+    def add_rides(self):
+        self.add_ride(self.transports[0], self.at(7, 0), self.at(8, 0), self.station, self.station)
+        self.add_ride(self.transports[0], self.at(9, 30), self.at(10, 30), self.station, self.other_station)
+        self.add_ride(self.transports[1], self.at(10, 15), self.at(10, 45), self.other_station, self.other_station)
+        self.add_ride(self.transports[2], self.at(11, 50), None, self.station)
+
+    def test_hourly_series(self):
+        self.add_rides()
+        data = utilization.utilization(self.at(9, 0), self.at(12, 30), self.now)
+
+        self.assertEqual(data["fleetSize"], 4)
+        self.assertEqual([bucket["start"] for bucket in data["series"]], [self.at(hour, 0) for hour in (9, 10, 11, 12)])
+        self.assertEqual([bucket["departures"] for bucket in data["series"]], [1, 1, 1, 0])
+        self.assertEqual([bucket["arrivals"] for bucket in data["series"]], [0, 2, 0, 0])
+        # 30, 60, 10 and 30 minutes of rides against 4 transports
+        self.assertEqual([bucket["fleetInUse"] for bucket in data["series"]], [0.125, 0.25, 0.0417, 0.125])
+
+        self.assertEqual(data["stations"], [
+            {"stationId": self.station.id, "departures": 2, "arrivals": 0, "averageRideMinutes": None},
+            {"stationId": self.other_station.id, "departures": 1, "arrivals": 2, "averageRideMinutes": 45.0},
+        ])
+        self.assertEqual(data["models"], [
+            {"modelId": self.model.id, "departures": 3, "arrivals": 2, "averageRideMinutes": 45.0},
+        ])
+
+    def test_only_open_buckets_are_recomputed(self):
+        self.add_rides()
+        utilization.utilization(self.at(9, 0), self.at(12, 30), self.now)
+
+        # a late write to a settled hour is not seen until invalidated, the current hour is always fresh
+        self.add_ride(self.transports[3], self.at(10, 0), self.at(10, 10), self.station, self.station)
+        self.add_ride(self.transports[3], self.at(12, 10), self.at(12, 20), self.station, self.station)
+        data = utilization.utilization(self.at(9, 0), self.at(12, 30), self.now)
+        self.assertEqual([bucket["departures"] for bucket in data["series"]], [1, 1, 1, 1])
+
+        utilization.invalidate()
+        data = utilization.utilization(self.at(9, 0), self.at(12, 30), self.now)
+        self.assertEqual([bucket["departures"] for bucket in data["series"]], [1, 2, 1, 1])
+
+    def test_edits_of_settled_rides_invalidate(self):
+        self.add_rides()
+
+        def version() -> int:
+            return get_cache().get(utilization.VERSION_KEY)
+
+        before = version()
+
+        # riding now only touches the open buckets, even a ride that started hours ago
+        client = Client.objects.create(username="client")
+        client.start_rent_period(Plan.objects.get().id)
+        client.take_car(self.station.id, self.model.id)
+        usage = client.active_car_usage_period
+        RentPeriodCarUsage.objects.filter(id=usage.id).update(started_at=timezone.now() - timedelta(hours=3))
+        client = Client.objects.get(id=client.id)
+        client.end_all_rents(self.other_station.id)
+        self.assertEqual(version(), before)
+
+        ride = RentPeriodCarUsage.objects.get(started_at=self.at(9, 30))
+        ride.finishing_station = self.station
+        with self.captureOnCommitCallbacks(execute=True):
+            ride.save()
+            self.assertEqual(version(), before + 1)
+        # and again once committed
+        self.assertEqual(version(), before + 2)
+        edited = version()
+        ride.delete()
+        self.assertNotEqual(version(), edited)
+
+    def test_endpoint_is_staff_only(self):
+        self.add_rides()
+        self.assertEqual(self.client.get("/api/analytics/utilization").status_code, 403)
+        self.client.force_login(Client.objects.create(username="staff", is_staff=True))
+        self.assertEqual(
+            self.client.get("/api/analytics/utilization", {"from": "2026-01-10T12:00", "to": "2026-01-10T09:00"})
+            .status_code, 400
+        )
+
+        response = self.client.get("/api/analytics/utilization")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["data"]["series"]), 25)
+
+
+class AdminChangelistTestCase(TestCase):
+    CHANGELISTS = (
+        "client", "transportmodel", "transport", "parkingstation", "rentperiod", "rentperiodcarusage",
+        "archivedrentperiod", "archivedrentperiodcarusage", "companyaccounting", "accountingrollup",
+    )
+
+    def setUp(self):
+        self.client.force_login(Client.objects.create(username="admin", is_staff=True, is_superuser=True))
+
+    def changelist_queries(self) -> dict[str, list[str]]:
+        result = {}
+        for name in self.CHANGELISTS:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f"/admin/api/{name}/")
+            self.assertEqual(response.status_code, 200, name)
+            result[name] = [query["sql"] for query in queries]
+        return result
+
+    def test_queries_do_not_grow_with_rows(self):
+        seed_fleet(stations=5, models=3, transports=20, clients=5, rides=20, seed=1)
+        # the first request loads the admin into the client cache
+        self.changelist_queries()
+        small = self.changelist_queries()
+        seed_fleet(stations=20, models=6, transports=150, clients=20, rides=200, seed=2)
+        large = self.changelist_queries()
+        self.assertEqual({name: len(queries) for name, queries in large.items()},
+                         {name: len(queries) for name, queries in small.items()})
+
+    def test_history_counts_are_capped(self):
+        seed_fleet(stations=5, models=3, transports=20, clients=5, rides=20, seed=1)
+        for name in ("rentperiod", "rentperiodcarusage", "companyaccounting"):
+            counts = [sql for sql in self.changelist_queries()[name] if "COUNT(" in sql]
+            self.assertTrue(counts)
+            self.assertTrue(all("LIMIT" in sql for sql in counts), counts)
+
+
+    def test_history_pages_by_keyset(self):
+        seed_fleet(stations=5, models=3, transports=20, clients=5, rides=25, seed=1)
+        ids = list(RentPeriodCarUsage.objects.order_by("-id").values_list("id", flat=True))
+        url, seen, pages = "/admin/api/rentperiodcarusage/", [], []
+        with mock.patch.object(RentPeriodCarUsageAdmin, "list_per_page", 10):
+            while url:
+                with CaptureQueriesContext(connection) as queries:
+                    cl = self.client.get(url).context["cl"]
+                self.assertFalse([query["sql"] for query in queries if "OFFSET" in query["sql"]])
+                seen += [row.id for row in cl.result_list]
+                pages.append(cl.newer_url)
+                url = cl.older_url and f"/admin/api/rentperiodcarusage/{cl.older_url}"
+            self.assertEqual(seen, ids)
+            self.assertEqual(len(pages), 3)
+
+            # and back from the oldest page
+            response = self.client.get(f"/admin/api/rentperiodcarusage/{pages[-1]}")
+            self.assertEqual([row.id for row in response.context["cl"].result_list], ids[10:20])
+            self.assertContains(response, f'href="{response.context["cl"].older_url}"')
+
+            # sorted by a column the pages are numbered again
+            cl = self.client.get("/admin/api/rentperiodcarusage/", {"o": "5"}).context["cl"]
+            self.assertFalse(cl.keyset)
+            self.assertTrue(cl.multi_page)
+        self.assertEqual(self.client.get("/admin/api/rentperiodcarusage/", {"before": "x"}).status_code, 302)
+
+
+class SerializationTestCase(TestCase):
+    def assertSameJSON(self, first, second):
+        self.assertEqual(FastJSONRenderer().render(first), JSONRenderer().render(second))
+
+    def test_renderer_matches_drf(self):
+        moments = [
+            datetime(2026, 1, 10, 12, 30, 0, 123, tzinfo=dt_timezone.utc),
+            datetime(2026, 1, 10, 12, 30, tzinfo=dt_timezone(timedelta(hours=3))),
+            datetime(2026, 1, 10, 12, 30), date(2026, 1, 10), timedelta(minutes=90),
+        ]
+        floats = [55.7558, 0.1 + 0.2, 1e-7, 2.5e-5, 1e16, 1.5e300, -0.0, 100.0]
+        data = {
+            "moments": moments, "floats": floats, "price": Decimal("300.00"), "tiny": Decimal("0.00001"),
+            "text": "Škoda \u2028 \u2029 \"quoted\" \x01 / \\", "uuid": uuid.UUID(int=1),
+            "nested": [[{}], None, True],
+            "ids": {3, 1}, "numbers": np.arange(3),
+        }
+        for value in (data, {1: "non-string key"}, [2 ** 70], "1e5 in a string", None):
+            self.assertSameJSON(value, value)
+        indented = "application/json; indent=2"
+        self.assertEqual(FastJSONRenderer().render(data, indented), JSONRenderer().render(data, indented))
+
+    def test_values_payloads_match_as_dict(self):
+        (station, _), model, _ = create_fleet(stations=2, cars_per_station=3)
+        models = TransportModel.objects.values(*serialization.TRANSPORT_MODEL_FIELDS)
+        self.assertSameJSON(serialization.transport_models(models)[model.id], model.as_dict)
+        self.assertSameJSON(serialization.plan(serialization.plans_queryset().get()), Plan.objects.get().as_dict)
+
+        ParkingStation.objects.filter(id=station.id).update(latitude=55.7558, longitude=37.6173)
+        inventory = cache.get_station_inventory([station.id])[0]
+        station.refresh_from_db()
+        self.assertSameJSON(inventory, {**station.as_dict, "availableModels": [{**model.as_dict, "count": 3}]})
+
+    def test_rebalancing_moves_match_as_dict(self):
+        seed_fleet(stations=10, models=2, transports=60, clients=1, seed=5)
+        ParkingStation.objects.filter(id__in=ParkingStation.objects.order_by("id").values("id")[:5]).update(max_cars=2)
+        plan = rebalancing.create_plan()
+        plan.moves.filter(id=plan.moves.order_by("id").values("id")[:1]).update(completed_at=timezone.now())
+        moves = [move.as_dict for move in plan.moves.order_by("id")]
+        self.assertTrue(moves)
+        self.assertSameJSON(serialization.rebalancing_moves(plan.id), moves)
+
+
+class TelemetryTestCase(TestCase):
+    def setUp(self):
+        (self.station,), self.model, self.plan = create_fleet(stations=1, cars_per_station=3)
+        self.transports = list(Transport.objects.order_by("id"))
+        self.now = time.time()
+        self.buffer = telemetry.TelemetryBuffer(size=1000, flush_seconds=3600)
+        patcher = mock.patch.object(telemetry, "buffer", self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_formats(self):
+        transport_id = self.transports[0].id
+        expected = [(transport_id, self.now, 80, 55.75, 37.61), (transport_id, self.now, 79, None, None)]
+        ndjson = "\n".join(json.dumps(item) for item in (
+            {"transportId": transport_id, "recordedAt": self.now, "fuel": 80, "latitude": 55.75, "longitude": 37.61},
+            {"transportId": transport_id, "recordedAt": self.now, "fuel": 79},
+        )).encode()
+        self.assertEqual(telemetry.parse(ndjson, "application/x-ndjson; charset=utf-8"), expected)
+        compact = json.dumps([[transport_id, self.now, 80, 55.75, 37.61], [transport_id, self.now, 79]]).encode()
+        self.assertEqual(telemetry.parse(compact, "application/json"), expected)
+
+        for invalid in ([[transport_id, self.now, 101]], [[transport_id, self.now + 3600, 50]],
+                        [[transport_id, self.now, 50, 55.75]], [{"transportId": "1", "recordedAt": 0, "fuel": 5}]):
+            with self.assertRaises(ValueError):
+                telemetry.parse(json.dumps(invalid).encode(), "application/json")
+        with self.assertRaises(ValueError):
+            telemetry.parse(b"{not json", "application/json")
+
+    def test_flush_keeps_readings_and_latest_fuel(self):
+        first, second, _ = self.transports
+        self.buffer.add([
+            (first.id, self.now - 10, 70, None, None), (first.id, self.now - 5, 60, None, None),
+            (second.id, self.now - 1, 50, 55.75, 37.61), (first.id, self.now - 20, 90, None, None),
+            (0, self.now, 10, None, None),
+        ])
+        with self.assertNumQueries(5):
+            self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(TelemetryReading.objects.count(), 4)
+        self.assertEqual(
+            dict(Transport.objects.values_list("id", "fuel")), {first.id: 60, second.id: 50, self.transports[2].id: 100}
+        )
+
+        # a late reading is kept but does not roll the fuel level back
+        self.buffer.add([(first.id, self.now - 30, 99, None, None)])
+        self.buffer.flush()
+        self.assertEqual(Transport.objects.get(id=first.id).fuel, 60)
+        self.assertEqual(TelemetryReading.objects.count(), 5)
+
+    def test_buffer_flushes_when_full(self):
+        self.buffer.size = 10
+        self.buffer.add([(self.transports[0].id, self.now - i, 50, None, None) for i in range(9)])
+        self.assertEqual(TelemetryReading.objects.count(), 0)
+        self.buffer.add([(self.transports[1].id, self.now, 50, None, None)])
+        self.assertEqual((TelemetryReading.objects.count(), len(self.buffer)), (10, 0))
+
+    def test_buffer_is_capped_while_writes_fail(self):
+        transport_id = self.transports[0].id
+        self.buffer.max_buffered = 10
+        self.buffer.add([(transport_id, self.now - 100 + i, 50, None, None) for i in range(6)])
+
+        def failing_write(readings, latest):
+            # six more come in while the write is running, the buffer cannot take back all twelve
+            self.buffer.add([(transport_id, self.now - 10 + i, 40, None, None) for i in range(6)])
+            raise OperationalError("database is gone")
+
+        with mock.patch.object(telemetry, "write", failing_write), self.assertLogs("api.telemetry") as logs:
+            self.buffer.try_flush()
+        self.assertIn("2 oldest reading(s) dropped", "\n".join(logs.output))
+        self.assertEqual([reading[1] for reading in self.buffer.readings][:2], [self.now - 98, self.now - 97])
+        self.assertEqual(len(self.buffer), 10)
+
+        with self.settings(API_TELEMETRY_TOKEN="secret"):
+            body = json.dumps([[transport_id, self.now, 42]])
+            headers = {"Authorization": "Bearer secret"}
+            response = self.client.post("/api/telemetry", body, content_type="application/json", headers=headers)
+            self.assertEqual((response.status_code, response["Retry-After"]), (503, "5"))
+            self.assertEqual(len(self.buffer), 10)
+
+            self.assertEqual(self.buffer.flush(), 10)
+            response = self.client.post("/api/telemetry", body, content_type="application/json", headers=headers)
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(TelemetryReading.objects.count(), 10)
+
+    def test_end_ride_takes_last_reading(self):
+        client = Client.objects.create(username="driver")
+        client.start_rent_period(self.plan.id)
+        transport = client.take_car(self.station.id, self.model.id)
+        self.buffer.add([(transport.id, self.now - 60, 70, None, None)])
+        self.buffer.flush()
+        self.buffer.add([(transport.id, self.now - 1, 40, None, None)])
+        client.end_all_rents(self.station.id)
+        self.assertEqual(Transport.objects.get(id=transport.id).fuel, 40)
+
+        # a ride that ends under a quarter of a tank is refuelled, and the buffered reading cannot undo that
+        client.start_rent_period(self.plan.id)
+        transport = client.take_car(self.station.id, self.model.id)
+        self.buffer.add([(transport.id, self.now, 10, None, None)])
+        client.end_all_rents(self.station.id)
+        self.buffer.flush()
+        self.assertEqual(Transport.objects.get(id=transport.id).fuel, 100)
+        self.assertEqual(CompanyAccounting.objects.get(transport=transport).refuelled_percent, 90)
+
+    def test_endpoint(self):
+        body = json.dumps([[self.transports[0].id, self.now, 42]])
+        self.assertEqual(self.client.post("/api/telemetry", body, content_type="application/json").status_code, 403)
+        with self.settings(API_TELEMETRY_TOKEN="secret"):
+            headers = {"Authorization": "Bearer secret"}
+            response = self.client.post("/api/telemetry", body, content_type="application/json", headers=headers)
+            self.assertEqual((response.status_code, response.json()["data"]["accepted"]), (202, 1))
+            response = self.client.post("/api/telemetry", "[1]", content_type="application/json", headers=headers)
+            self.assertEqual(response.status_code, 400)
+        self.buffer.flush()
+        self.assertEqual(Transport.objects.get(id=self.transports[0].id).fuel, 42)
+
+    def test_idle_buffer_is_flushed_by_timer(self):
+        written = threading.Event()
+        self.buffer.flush_seconds = 0.05
+        with mock.patch.object(telemetry, "write", side_effect=lambda *args: written.set()) as write:
+            self.buffer.add([(self.transports[0].id, self.now, 42, None, None)])
+            self.assertTrue(written.wait(5))
+        self.assertEqual(write.call_args.args[0], [(self.transports[0].id, self.now, 42, None, None)])
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_failed_write_is_still_accepted(self):
+        self.buffer.size = 1
+        body = json.dumps([[self.transports[0].id, self.now, 42]])
+        with (
+            self.settings(API_TELEMETRY_TOKEN="secret"), self.assertLogs("api.telemetry", "ERROR"),
+            mock.patch.object(telemetry, "write", side_effect=OperationalError("database is locked")),
+        ):
+            response = self.client.post("/api/telemetry", body, content_type="application/json",
+                                        headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 202)
+        # kept for the next flush, and written once
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(TelemetryReading.objects.count(), 1)
+
+
+class AuthTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = Client(username="driver", email="Driver@Example.com")
+        self.user.set_password("long-password")
+        self.user.save()
+
+    def login(self, login_: str):
+        return self.client.post("/api/auth/login", {"login": login_, "password": "long-password"},
+                                content_type="application/json")
+
+    def test_login_by_username_or_email_in_any_case(self):
+        for login_ in ("driver", "driver@example.com", "DRIVER@EXAMPLE.COM"):
+            with self.subTest(login=login_):
+                self.assertTrue(self.login(login_).json()["success"])
+                self.client.get("/api/auth/logout")
+        self.assertFalse(self.login("Driver").json()["success"])
+        if connection.vendor == "sqlite":
+            # postgres rightly scans a table this small
+            self.assertIn("client_email_lower_idx", Client.with_login("driver@example.com").explain())
+
+    def test_register_rejects_email_in_other_case(self):
+        response = self.client.post("/api/auth/register", {
+            "username": "other", "email": "DRIVER@example.com",
+            "password": "x7!kq-long", "passwordCheck": "x7!kq-long",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_username_matching_another_email(self):
+        other = Client(username="driver@example.com", email="someone@example.com")
+        other.set_password("long-password")
+        other.save()
+        response = self.login("driver@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()["success"])
+
+        # registering it the other way round is refused
+        response = self.client.post("/api/auth/register", {
+            "username": "Someone@Example.com", "email": "new@example.com",
+            "password": "x7!kq-long", "passwordCheck": "x7!kq-long",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(**SHARED_CACHE)
+    def test_client_is_cached_until_saved(self):
+        backend = CachedModelBackend()
+        with self.assertNumQueries(1):
+            backend.get_user(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.user.id).rating, 50)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/auth/get_me").json()["data"]["rating"], 50)
+        self.user.rating = 80
+        self.user.save()
+        self.assertEqual(self.client.get("/api/auth/get_me").json()["data"]["rating"], 80)
+
+        # a changed password logs the other sessions out even though the client was cached
+        self.user.set_password("another-password")
+        self.user.save()
+        self.assertFalse(self.client.get("/api/auth/get_me").json()["success"])
+
+    def test_session_modes(self):
+        for engine in ("db", "cached_db", "signed_cookies"):
+            session_engine = f"django.contrib.sessions.backends.{engine}"
+            with self.subTest(engine=engine), self.settings(SESSION_ENGINE=session_engine):
+                self.client.cookies.clear()
+                self.assertTrue(self.login("driver").json()["success"])
+                self.assertEqual(self.client.get("/api/auth/get_me").json()["data"]["username"], "driver")
+                self.client.get("/api/auth/logout")
+                self.assertFalse(self.client.get("/api/auth/get_me").json()["success"])
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        seed_fleet(stations=4, models=2, transports=20, clients=5, rides=300, seed=1)
+        fine_overdue_periods(full=True)
+        self.cutoff = timezone.now() - timedelta(days=90)
+        self.archivable = RentPeriod.objects.filter(finished_at__lt=self.cutoff)
+
+    def readers(self) -> tuple:
+        client_id = Client.objects.order_by("id").values_list("id", flat=True).first()
+        window_end = timezone.now().replace(minute=0, second=0, microsecond=0)
+        return (
+            list(export.iter_rides(chunk_size=50)),
+            list(export.iter_rides(started_to=self.cutoff, station_ids=[ParkingStation.objects.first().id])),
+            export.client_history(client_id, limit=1000),
+            utilization.compute_buckets(
+                int((window_end - utilization.EPOCH).total_seconds()) // 3600 - 24 * 120,
+                int((window_end - utilization.EPOCH).total_seconds()) // 3600,
+                int(time.time()),
+            ),
+        )
+
+    def test_readers_see_archived_rides(self):
+        before = self.readers()
+        expected = self.archivable.count()
+        run = archive.archive_rentals(timedelta(days=90))
+
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.archived_periods, run.archived_usages), (expected, expected))
+        self.assertEqual(ArchivedRentPeriod.objects.count(), expected)
+        self.assertFalse(RentPeriodCarUsage.objects.filter(finished_at__lt=self.cutoff).exists())
+        self.assertTrue(RentPeriodCarUsage.objects.exists())
+        after = self.readers()
+        self.assertEqual(after[:3], before[:3])
+        for records_after, records_before in zip(after[3], before[3]):
+            self.assertEqual(records_after[:3], records_before[:3])
+        self.assertEqual(archive.rides().count(), 300)
+
+    def test_recent_reads_skip_the_archive(self):
+        self.assertIsNone(archive.rides(finished_since=self.cutoff).archived)
+        archive.archive_rentals(timedelta(days=90), now=self.cutoff + timedelta(days=90))
+        self.assertIsNone(archive.rides(finished_since=self.cutoff).archived)
+        self.assertIsNotNone(archive.rides(finished_since=self.cutoff - timedelta(days=1)).archived)
+        self.assertIsNotNone(archive.rent_periods().archived)
+
+    def test_batches_resume(self):
+        run = archive.archive_rentals(timedelta(days=90), batch_size=40, max_batches=2)
+        self.assertIsNone(run.finished_at)
+        self.assertEqual(run.archived_periods, 80)
+        # a later call keeps the cutoff of the interrupted run
+        resumed = archive.archive_rentals(timedelta(days=1), batch_size=40)
+        self.assertEqual(resumed.id, run.id)
+        self.assertEqual((resumed.cutoff, resumed.archived_periods), (run.cutoff, ArchivedRentPeriod.objects.count()))
+        self.assertFalse(self.archivable.exists())
+        self.assertEqual(ArchiveRun.objects.count(), 1)
+
+    def test_only_settled_rentals_are_archived(self):
+        unbilled = self.archivable.order_by("id").first()
+        RentPeriod.objects.filter(id=unbilled.id).update(fine_overtime=100, fine_billed_at=None)
+        riding = self.archivable.order_by("id").last()
+        RentPeriodCarUsage.objects.filter(period=riding).update(finished_at=None, finishing_station=None)
+        archive.archive_rentals(timedelta(days=90))
+        self.assertEqual(set(RentPeriod.objects.filter(finished_at__lt=self.cutoff).values_list("id", flat=True)),
+                         {unbilled.id, riding.id})
+
+        # nothing is known to be billed before the first billing run
+        BillingRun.objects.all().delete()
+        RentPeriod.objects.filter(id=unbilled.id).update(fine_overtime=0)
+        run = archive.archive_rentals(timedelta(days=90))
+        self.assertEqual(run.archived_periods, 0)
+
+    def test_history_endpoint(self):
+        user = Client.objects.order_by("id").first()
+        archive.archive_rentals(timedelta(days=90), batch_size=25)
+        expected = [ride["id"] for ride in export.client_history(user.id, limit=100)]
+        self.assertTrue(ArchivedRentPeriodCarUsage.objects.filter(id__in=expected).exists())
+        self.assertTrue(RentPeriodCarUsage.objects.filter(id__in=expected).exists())
+
+        self.assertEqual(self.client.get("/api/rides/history").status_code, 400)
+        self.client.force_login(user)
+        pages, params = [], {"limit": 7}
+        while data := self.client.get("/api/rides/history", params).json()["data"]:
+            pages.extend(ride["id"] for ride in data)
+            params["beforeId"] = data[-1]["id"]
+        self.assertEqual(pages, expected)
+        self.assertEqual(set(self.client.get("/api/rides/history").json()["data"][0]), set(export.HISTORY_FIELDS))
+        self.assertEqual(self.client.get("/api/rides/history", {"limit": 0}).status_code, 400)
+
+
+class ImageVariantsTestCase(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # one worker, so the test can wait for the jobs by shutting it down
+        executor = mock.patch.object(images, "executor", ThreadPoolExecutor(max_workers=1))
+        executor.start()
+        self.addCleanup(executor.stop)
+        _, self.model, _ = create_fleet()
+        self.storage = TransportModel._meta.get_field("image").storage
+
+    def upload(self, size: tuple, mode="RGB") -> ContentFile:
+        content = io.BytesIO()
+        Image.linear_gradient("L").resize(size).convert(mode).save(content, "PNG")
+        return ContentFile(content.getvalue(), name="photo.png")
+
+    def wait(self) -> TransportModel:
+        images.executor.shutdown(wait=True)
+        images.executor = ThreadPoolExecutor(max_workers=1)
+        return TransportModel.objects.get(id=self.model.id)
+
+    def test_saving_an_image_generates_variants(self):
+        self.model.image = self.upload((1800, 1200), "RGBA")
+        self.model.save()
+        model = self.wait()
+
+        self.assertEqual(
+            {variant: (entry["width"], entry["height"]) for variant, entry in model.image_variants.items()},
+            {"thumbnail": (240, 160), "medium": (960, 640)},
+        )
+        for entry in model.image_variants.values():
+            for image_format, name in entry["files"].items():
+                with self.storage.open(name) as file, Image.open(file) as image:
+                    self.assertEqual(image.format.lower(), image_format)
+                    self.assertEqual(image.size, (entry["width"], entry["height"]))
+        payload = model.as_dict["imageVariants"]
+        self.assertEqual(list(payload), ["thumbnail", "medium"])
+        self.assertEqual(list(payload["thumbnail"]), ["width", "height", "jpeg", "webp"])
+        self.assertTrue(payload["medium"]["webp"].startswith("/media/transport_images/variants/"))
+        rows = TransportModel.objects.values(*serialization.TRANSPORT_MODEL_FIELDS)
+        self.assertEqual(serialization.transport_models(rows)[model.id], model.as_dict)
+
+        # a new image replaces the variants and their files, saving anything else keeps them
+        model.image = self.upload((100, 50))
+        model.save()
+        replaced = self.wait()
+        self.assertEqual(replaced.image_variants["medium"]["width"], 100)
+        self.assertFalse(self.storage.exists(model.image_variants["medium"]["files"]["webp"]))
+        replaced.name = "Renamed"
+        replaced.save()
+        self.assertEqual(self.wait().image_variants, replaced.image_variants)
+
+    def test_stale_model_keeps_generated_variants(self):
+        stale = TransportModel.objects.get(id=self.model.id)
+        self.model.image = self.upload((640, 480))
+        self.model.save()
+        variants = self.wait().image_variants
+        self.assertEqual(variants["medium"]["width"], 640)
+
+        stale.description = "Edited while the variants were generated"
+        stale.save()
+        self.assertEqual(TransportModel.objects.get(id=self.model.id).image_variants, variants)
+
+    def test_backfill_command(self):
+        name = self.storage.save("transport_images/old.png", self.upload((640, 480)))
+        TransportModel.objects.filter(id=self.model.id).update(image=name)
+        missing = TransportModel.objects.create(
+            type=self.model.type, classification=self.model.classification,
+            name="Missing", description="Missing", image="transport_images/missing.png",
+        )
+        self.wait()
+
+        call_command("generate_image_variants", stdout=io.StringIO())
+        self.assertEqual(TransportModel.objects.get(id=self.model.id).image_variants["thumbnail"]["height"], 180)
+        self.assertEqual(TransportModel.objects.get(id=missing.id).image_variants, {})
+        output = io.StringIO()
+        call_command("generate_image_variants", stdout=output)
+        self.assertIn("of 0 image(s), 1 skipped", output.getvalue())
@@ -13,6 +13,17 @@ urlpatterns = [
 
     path('available_transport', views.AvailableTransport.as_view(), name='available_transport'),
     path('available_plans', views.AvailablePlans.as_view(), name='available_plans'),
+    path('nearest_stations', views.NearestStations.as_view(), name='nearest_stations'),
     path('start_ride', views.StartRide.as_view(), name='start_ride'),
     path('end_ride', views.EndRide.as_view(), name='end_ride'),
+    path('rides/history', views.RideHistory.as_view(), name='ride_history'),
+    path('events/stations', views.StationEvents.as_view(), name='station_events'),
+    path('telemetry', views.Telemetry.as_view(), name='telemetry'),
+
+    path('accounting/report', views.AccountingReport.as_view(), name='accounting_report'),
+    path('export/rides', views.ExportRides.as_view(), name='export_rides'),
+    path('rebalancing/plan', views.Rebalancing.as_view(), name='rebalancing_plan'),
+    path('analytics/utilization', views.Utilization.as_view(), name='utilization'),
+
+    path('metrics', views.Metrics.as_view(), name='metrics'),
 ]
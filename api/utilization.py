@@ -0,0 +1,190 @@
+
+
+import datetime
+import time
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import archive
+from .billing import SecondsBetween
+from .cache import get_cache
+from .models import Transport
+
+
+BUCKET_SECONDS = 3600
+# a ride is stamped with the current time when it ends, so an hour is final shortly after it is over
+SETTLE_SECONDS = 60
+CACHE_TIMEOUT = getattr(settings, 'API_UTILIZATION_CACHE_TIMEOUT', 24 * 3600)
+MAX_WINDOW = datetime.timedelta(days=92)
+
+VERSION_KEY = 'api:utilization:v'
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _epoch_seconds(expression):
+    return SecondsBetween(expression, Value(EPOCH, output_field=DateTimeField()))
+
+
+def _fetch_rides(start: int, end: int) -> np.ndarray:
+    # (started, finished or -1, starting station, finishing station, model) of the rides overlapping [start, end)
+    window_start = EPOCH + datetime.timedelta(seconds=start)
+    rows = archive.rides(finished_since=window_start).filter(
+        Q(finished_at__gte=window_start) | Q(finished_at__isnull=True),
+        started_at__lt=EPOCH + datetime.timedelta(seconds=end),
+    ).annotate(
+        started=_epoch_seconds(F('started_at')),
+        finished=Coalesce(_epoch_seconds(F('finished_at')), -1),
+        starting=Coalesce(F('starting_station_id'), 0),
+        finishing=Coalesce(F('finishing_station_id'), 0),
+        model=Coalesce(F('transport__model_id'), 0),
+    ).values_list('started', 'finished', 'starting', 'finishing', 'model').union()
+    return np.array(list(rows), dtype=np.int64).reshape(-1, 5)
+
+
+def _group(buckets: int, departure_bucket, departure_ids, arrival_bucket, arrival_ids, durations) -> list[tuple]:
+    # per bucket: (ids, departures, arrivals, summed ride seconds of the arrivals), rides without an id are left out
+    departed, arrived = departure_ids > 0, arrival_ids > 0
+    span = int(max(departure_ids.max(initial=0), arrival_ids.max(initial=0))) + 1
+    keys = np.concatenate([
+        departure_bucket[departed] * span + departure_ids[departed],
+        arrival_bucket[arrived] * span + arrival_ids[arrived],
+    ])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    split = int(departed.sum())
+    departures = np.bincount(inverse[:split], minlength=len(unique))
+    arrivals = np.bincount(inverse[split:], minlength=len(unique))
+    seconds = np.bincount(inverse[split:], weights=durations[arrived], minlength=len(unique))
+
+    bounds = np.searchsorted(unique // span, np.arange(buckets + 1))
+    ids = unique % span
+    return [
+        (ids[start:end], departures[start:end], arrivals[start:end], seconds[start:end])
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def compute_buckets(first: int, last: int, now: int) -> list[tuple]:
+    # one record per bucket of [first, last): (departures, arrivals, seconds in use, by station, by model)
+    start, end = first * BUCKET_SECONDS, last * BUCKET_SECONDS
+    started, finished, starting, finishing, model = _fetch_rides(start, end).T
+    ended = np.where(finished < 0, now, finished)
+
+    departed = (started >= start) & (started < end)
+    departure_bucket = started[departed] // BUCKET_SECONDS - first
+    arrived = (finished >= start) & (finished < end)
+    arrival_bucket = finished[arrived] // BUCKET_SECONDS - first
+    durations = (finished - started)[arrived]
+
+    # seconds in use up to T are the sum over rides of clip(T - started, 0, ended - started), evaluated for every
+    # bucket boundary at once from sorted starts and ends and their prefix sums
+    boundaries = np.arange(first, last + 1, dtype=np.int64) * BUCKET_SECONDS
+    starts, ends = np.sort(started), np.sort(ended)
+    started_before, ended_before = np.searchsorted(starts, boundaries), np.searchsorted(ends, boundaries)
+    in_use = (
+        started_before * boundaries - np.r_[0, np.cumsum(starts)][started_before]
+        - ended_before * boundaries + np.r_[0, np.cumsum(ends)][ended_before]
+    )
+
+    buckets = last - first
+    by_station = _group(buckets, departure_bucket, starting[departed], arrival_bucket, finishing[arrived], durations)
+    by_model = _group(buckets, departure_bucket, model[departed], arrival_bucket, model[arrived], durations)
+    departures = np.bincount(departure_bucket, minlength=buckets)
+    arrivals = np.bincount(arrival_bucket, minlength=buckets)
+    return [
+        (int(departures[i]), int(arrivals[i]), int(in_use[i + 1] - in_use[i]), by_station[i], by_model[i])
+        for i in range(buckets)
+    ]
+
+
+def invalidate():
+    # for writes that change the past, like seeding or edited rides; new rides only touch the open buckets
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def _settled_part(ride: Optional[tuple], settled: datetime.datetime) -> Optional[tuple]:
+    # what of a ride (started_at, finished_at, transport, starting station, finishing station) the settled buckets
+    # count: nothing of a ride started since, and only the start of a ride not finished before then
+    if ride is None or ride[0] is None or ride[0] >= settled:
+        return None
+    if ride[1] is None or ride[1] >= settled:
+        return ride[0], ride[2], ride[3]
+    return ride
+
+
+def ride_changed(before: Optional[tuple], after: Optional[tuple]):
+    # starting and ending a ride only touch the open buckets, an edit or delete of a ride in a settled hour
+    # drops the cached ones
+    now = int(time.time())
+    settled = EPOCH + datetime.timedelta(seconds=(now - SETTLE_SECONDS) // BUCKET_SECONDS * BUCKET_SECONDS)
+    if _settled_part(before, settled) != _settled_part(after, settled):
+        # again once committed: a read in between computed the buckets from the rows before the edit
+        invalidate()
+        transaction.on_commit(invalidate, robust=True)
+
+
+def get_buckets(first: int, last: int, now: int) -> list[tuple]:
+    cache = get_cache()
+    version = cache.get_or_set(VERSION_KEY, 0, None)
+    keys = [f'api:utilization:{version}:{bucket}' for bucket in range(first, last)]
+    cached = cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        # misses are normally only the newest buckets, so they are recomputed as one range
+        computed = compute_buckets(first + missing[0], last, now)
+        settled = (now - SETTLE_SECONDS) // BUCKET_SECONDS
+        cache.set_many({
+            keys[missing[0] + i]: record for i, record in enumerate(computed) if first + missing[0] + i < settled
+        }, CACHE_TIMEOUT)
+        cached.update({keys[missing[0] + i]: record for i, record in enumerate(computed)})
+    return [cached[key] for key in keys]
+
+
+def _totals(groups: list[tuple], key: str) -> list[dict]:
+    ids, departures, arrivals, seconds = (np.concatenate(column) for column in zip(*groups))
+    unique, inverse = np.unique(ids, return_inverse=True)
+    departures = np.bincount(inverse, weights=departures, minlength=len(unique))
+    arrivals = np.bincount(inverse, weights=arrivals, minlength=len(unique))
+    seconds = np.bincount(inverse, weights=seconds, minlength=len(unique))
+    return [
+        {
+            key: int(entity_id),
+            "departures": int(departed),
+            "arrivals": int(arrived),
+            "averageRideMinutes": round(total / arrived / 60, 1) if arrived else None,
+        }
+        for entity_id, departed, arrived, total in zip(unique.tolist(), departures, arrivals, seconds)
+    ]
+
+
+def utilization(started_from: datetime.datetime, started_to: datetime.datetime,
+                now: Optional[datetime.datetime] = None) -> dict:
+    now = int(((now or timezone.now()) - EPOCH).total_seconds())
+    first = int((started_from - EPOCH).total_seconds()) // BUCKET_SECONDS
+    last = min(-(-int((started_to - EPOCH).total_seconds()) // BUCKET_SECONDS), now // BUCKET_SECONDS + 1)
+    records = get_buckets(first, last, now) if first < last else []
+    fleet_size = Transport.objects.count()
+
+    return {
+        "fleetSize": fleet_size,
+        "series": [
+            {
+                "start": EPOCH + datetime.timedelta(seconds=(first + i) * BUCKET_SECONDS),
+                "departures": departures,
+                "arrivals": arrivals,
+                "fleetInUse": round(in_use / BUCKET_SECONDS / fleet_size, 4) if fleet_size else None,
+            }
+            for i, (departures, arrivals, in_use, _, _) in enumerate(records)
+        ],
+        "stations": _totals([record[3] for record in records], "stationId") if records else [],
+        "models": _totals([record[4] for record in records], "modelId") if records else [],
+    }
@@ -1,27 +1,41 @@
 import datetime
+import hashlib
+import hmac
 
+from django.conf import settings
 from django.contrib.auth import login, logout
 from django.contrib.auth.password_validation import (UserAttributeSimilarityValidator, MinimumLengthValidator,
                                                      CommonPasswordValidator, NumericPasswordValidator)
 from django.core.validators import EmailValidator
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Sum
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views import View
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Client, ParkingStation, Plan, Transport, RentPeriod, RentPeriodCarUsage
+from . import cache, events, export, geo, ledger, metrics, rebalancing, serialization, telemetry, utilization
+from .inventory import abuild_station_inventory
+from .models import AccountingRollup, Client, ParkingStation, ParkingStationIsFull, RebalancingPlan, Transport
+from .renderers import FastJSONRenderer
 
 
 # region auth
 
 
-class GetMeView(APIView):
-    def get(self, request: Request):
-        if request.user.is_authenticated:
-            return Response({"success": True, "data": request.user.json()})
-        return Response({"success": False, "message": "You are not logged in"})
+class GetMeView(View):
+    async def get(self, request: HttpRequest):
+        user = await request.auser()
+        if user.is_authenticated:
+            return render_json({"success": True, "data": await user.ajson()})
+        return render_json({"success": False, "message": "You are not logged in"})
 
 
 class LoginView(APIView):
@@ -42,11 +56,11 @@ class LoginView(APIView):
         try:
             if len(password) < 8:
                 raise Client.DoesNotExist()
-            user = Client.objects.filter(Q(username=login_) | Q(email=login_.lower())).get()
+            user = Client.with_login(login_).get()
             if not user.check_password(password):
                 raise Client.DoesNotExist()
 
-        except Client.DoesNotExist:
+        except (Client.DoesNotExist, Client.MultipleObjectsReturned):
             return Response({
                 "success": False,
                 "message": "Invalid Credentials",
@@ -82,7 +96,8 @@ class RegisterView(APIView):
                 "message": "Email address is not valid",
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if Client.objects.filter(Q(username=username) | Q(email=email.lower())).exists():
+        # a username may not be someone's email either, or logging in with it would match both clients
+        if (Client.with_login(username) | Client.with_login(email)).exists():
             return Response({
                 "success": "error",
                 "message": "User with this email address or username already exists",
@@ -123,24 +138,118 @@ class LogoutView(APIView):
 # endregion
 
 
-class AvailableTransport(APIView):
-    def get(self, request: Request):
-        stations = ParkingStation.objects.all()
-        return Response({
-            "success": True,
-            "data": [station.as_dict for station in stations]
-        })
+def render_json(data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    # async views bypass DRF's APIView, but render through the configured renderer so the bytes stay the same
+    return HttpResponse(FastJSONRenderer().render(data), status=status_code, content_type='application/json')
 
 
-class AvailablePlans(APIView):
-    def get(self, request: Request):
-        plans = Plan.objects.all()
-        return Response({
+async def conditional_response(request: HttpRequest, etag: str, get_response) -> HttpResponse:
+    # django's etag decorator calls its etag function synchronously, which the async views cannot afford
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await get_response()
+    if request.method in ('GET', 'HEAD'):
+        response.headers.setdefault('ETag', etag)
+    return response
+
+
+class AvailableTransport(View):
+    async def get(self, request: HttpRequest):
+        try:
+            station_ids = [int(i) for i in request.GET.getlist('stationId')] or None
+            filters = {
+                key: int(request.GET[param]) if param in request.GET else None
+                for key, param in (
+                    ('transport_type_id', 'typeId'),
+                    ('transport_class_id', 'classId'),
+                    ('minimal_rating', 'minimalRating'),
+                )
+            }
+        except ValueError:
+            return render_json({
+                "success": False,
+                "message": "Invalid filter value",
+            }, status.HTTP_400_BAD_REQUEST)
+
+        async def get_response():
+            if station_ids is None and all(value is None for value in filters.values()):
+                data = await cache.aget_station_inventory()
+            else:
+                data = await abuild_station_inventory(station_ids, **filters)
+            return render_json({
+                "success": True,
+                "data": data
+            })
+
+        # a write bumps the versions again once it commits, so a tag handed out while it was in flight, with
+        # the rows from before it, is not confirmed by a 304 afterwards
+        token = f'{await cache.astation_inventory_version()}?{request.META.get("QUERY_STRING", "")}'
+        return await conditional_response(request, hashlib.sha1(token.encode()).hexdigest(), get_response)
+
+
+class AvailablePlans(View):
+    async def get(self, request: HttpRequest):
+        async def get_response():
+            return render_json({
+                "success": True,
+                "data": await cache.aget_plans()
+            })
+
+        return await conditional_response(request, await cache.aplans_version(), get_response)
+
+
+class NearestStations(View):
+    MAX_LIMIT = 50
+
+    async def get(self, request: HttpRequest):
+        try:
+            latitude, longitude = float(request.GET['latitude']), float(request.GET['longitude'])
+            limit = int(request.GET.get('limit', 5))
+            if not -90 <= latitude <= 90 or not -180 <= longitude <= 180 or not 1 <= limit <= self.MAX_LIMIT:
+                raise ValueError()
+            max_distance_km = float(request.GET['maxDistanceKm']) if 'maxDistanceKm' in request.GET else None
+            filters = {
+                key: int(request.GET[param]) if param in request.GET else None
+                for key, param in (
+                    ('model_id', 'modelId'),
+                    ('transport_type_id', 'typeId'),
+                    ('transport_class_id', 'classId'),
+                    ('minimal_rating', 'minimalRating'),
+                )
+            }
+        except (KeyError, ValueError):
+            return render_json({
+                "success": False,
+                "message": "Invalid coordinates or filter value",
+            }, status.HTTP_400_BAD_REQUEST)
+
+        return render_json({
             "success": True,
-            "data": [plan.as_dict for plan in plans]
+            "data": await geo.anearest_stations(latitude, longitude, limit, max_distance_km, **filters)
         })
 
 
+class StationEvents(View):
+    async def get(self, request: HttpRequest):
+        try:
+            last_event_id = request.headers.get('Last-Event-ID', request.GET.get('lastEventId'))
+            last_event_id = int(last_event_id) if last_event_id else None
+            station_ids = [int(i) for i in request.GET.getlist('stationId')] or None
+        except ValueError:
+            return render_json({
+                "success": False,
+                "message": "Invalid filter value",
+            }, status.HTTP_400_BAD_REQUEST)
+
+        # an async iterator served over WSGI would be buffered in full, which never ends for this stream
+        stream = events.broadcaster.astream if isinstance(request, ASGIRequest) else events.broadcaster.stream
+        response = StreamingHttpResponse(stream(last_event_id, station_ids), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class StartRide(APIView):
     def post(self, request: Request):
         if not request.user.is_authenticated:
@@ -153,11 +262,19 @@ class StartRide(APIView):
         plan_id = request.data.get('planId')
         parking_station_id = request.data.get('parkingStationId')
 
-        if request.user.is_on_ride:
-            car = request.user.change_car(parking_station_id, car_id)
-        else:
-            request.user.start_rent_period(plan_id)
-            car = request.user.take_car(parking_station_id, car_id)
+        try:
+            with transaction.atomic(), ledger.batch():
+                if request.user.is_on_ride:
+                    car = request.user.change_car(parking_station_id, car_id)
+                else:
+                    request.user.start_rent_period(plan_id)
+                    car = request.user.take_car(parking_station_id, car_id)
+        except (Transport.DoesNotExist, ParkingStation.DoesNotExist):
+            request.user.reset_ride_state()
+            return Response({
+                "success": False,
+                "message": "There is no available transport of this model at the parking station",
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             "success": True,
@@ -175,9 +292,268 @@ class EndRide(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         parking_station_id = request.data.get('parkingStationId')
-        request.user.end_all_rents(parking_station_id)
+        try:
+            with transaction.atomic(), ledger.batch():
+                request.user.end_all_rents(parking_station_id)
+        except ParkingStationIsFull:
+            request.user.reset_ride_state()
+            return Response({
+                "success": False,
+                "message": "This parking station is full, please return the transport to another one",
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except ParkingStation.DoesNotExist:
+            request.user.reset_ride_state()
+            return Response({
+                "success": False,
+                "message": "There is no such parking station",
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
             "success": True,
             "data": request.user.json()
         })
+
+
+class AccountingReport(APIView):
+    def get(self, request: Request):
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return Response({
+                "success": False,
+                "message": "You do not have access to the accounting reports",
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        period = request.query_params.get('period', AccountingRollup.PERIOD_DAY)
+        if period not in dict(AccountingRollup.PERIODS):
+            return Response({
+                "success": False,
+                "message": "Period must be either day or month",
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = AccountingRollup.objects.filter(period=period)
+        try:
+            if 'from' in request.query_params:
+                rollups = rollups.filter(period_start__gte=datetime.date.fromisoformat(request.query_params['from']))
+            if 'to' in request.query_params:
+                rollups = rollups.filter(period_start__lte=datetime.date.fromisoformat(request.query_params['to']))
+            if 'stationId' in request.query_params:
+                rollups = rollups.filter(parking_station_id=int(request.query_params['stationId']))
+        except ValueError:
+            return Response({
+                "success": False,
+                "message": "Invalid filter value",
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if 'category' in request.query_params:
+            rollups = rollups.filter(category=request.query_params['category'])
+
+        group_by = ['period_start', 'category']
+        if request.query_params.get('byStation') == 'true':
+            group_by.append('parking_station_id')
+        rows = rollups.values(*group_by).annotate(
+            income_sum=Sum('income'), expense_sum=Sum('expense'), net_sum=Sum('net')
+        ).order_by(*group_by)
+
+        return Response({
+            "success": True,
+            "data": [
+                {
+                    "periodStart": row['period_start'],
+                    "category": row['category'],
+                    **({"stationId": row['parking_station_id']} if 'parking_station_id' in row else {}),
+                    "income": row['income_sum'],
+                    "expense": row['expense_sum'],
+                    "net": row['net_sum'],
+                }
+                for row in rows
+            ]
+        })
+
+
+class ExportRides(APIView):
+    def get(self, request: Request):
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return Response({
+                "success": False,
+                "message": "You do not have access to the ride history",
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        export_format = request.query_params.get('exportFormat', 'ndjson')
+        try:
+            if export_format not in export.FORMATS:
+                raise ValueError(export_format)
+            started_from, started_to = (
+                parse_aware_datetime(request.query_params[param]) if param in request.query_params else None
+                for param in ('from', 'to')
+            )
+            station_ids = [int(i) for i in request.query_params.getlist('stationId')] or None
+        except ValueError:
+            return Response({
+                "success": False,
+                "message": "Invalid filter value",
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        rides = export.iter_rides(started_from, started_to, station_ids)
+        response = StreamingHttpResponse(
+            export.render(rides, export_format),
+            content_type='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="rides.{export_format}"'
+        return response
+
+
+class RideHistory(APIView):
+    max_limit = 100
+
+    def get(self, request: Request):
+        if not request.user.is_authenticated:
+            return Response({
+                "success": False,
+                "message": "You are not authenticated",
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            before_id = int(request.query_params['beforeId']) if 'beforeId' in request.query_params else None
+            limit = int(request.query_params.get('limit', 20))
+            if not 1 <= limit <= self.max_limit:
+                raise ValueError(limit)
+        except ValueError:
+            return Response({
+                "success": False,
+                "message": "Invalid filter value",
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "success": True,
+            "data": export.client_history(request.user.id, before_id, limit),
+        })
+
+
+def has_bearer_token(request: Request, token) -> bool:
+    # compared in constant time, the time a mismatch takes must not tell how much of the token was right
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    )
+
+
+class Metrics(APIView):
+    def get(self, request: Request):
+        authorized = has_bearer_token(request, getattr(settings, 'API_METRICS_TOKEN', None))
+        if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+            return Response({
+                "success": False,
+                "message": "You do not have access to the metrics",
+            }, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class Rebalancing(APIView):
+    def check_staff(self, request: Request):
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return Response({
+                "success": False,
+                "message": "You do not have access to the rebalancing plans",
+            }, status=status.HTTP_403_FORBIDDEN)
+
+    def plan_response(self, plan: RebalancingPlan):
+        return Response({
+            "success": True,
+            "data": {
+                **plan.as_dict,
+                "moves": serialization.rebalancing_moves(plan.id),
+            }
+        })
+
+    def get(self, request: Request):
+        if denied := self.check_staff(request):
+            return denied
+        plan = RebalancingPlan.objects.order_by('-id').first()
+        if plan is None:
+            return Response({
+                "success": False,
+                "message": "No rebalancing plan has been made yet",
+            }, status=status.HTTP_404_NOT_FOUND)
+        return self.plan_response(plan)
+
+    def post(self, request: Request):
+        if denied := self.check_staff(request):
+            return denied
+        try:
+            fills = {
+                key: float(request.data[param]) if param in request.data else default
+                for key, param, default in (
+                    ('min_fill', 'minFill', rebalancing.MIN_FILL),
+                    ('max_fill', 'maxFill', rebalancing.MAX_FILL),
+                )
+            }
+            if not 0 <= fills['min_fill'] <= fills['max_fill'] <= 1:
+                raise ValueError()
+        except (TypeError, ValueError):
+            return Response({
+                "success": False,
+                "message": "Fill shares must satisfy 0 <= minFill <= maxFill <= 1",
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return self.plan_response(rebalancing.create_plan(request.user, **fills))
+
+
+class Telemetry(APIView):
+    def post(self, request: Request):
+        authorized = has_bearer_token(request, getattr(settings, 'API_TELEMETRY_TOKEN', None))
+        if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+            return Response({
+                "success": False,
+                "message": "You are not allowed to send telemetry",
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            readings = telemetry.parse(request.body, request.content_type)
+        except ValueError as e:
+            return Response({
+                "success": False,
+                "message": str(e),
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            telemetry.buffer.add(readings)
+        except telemetry.TelemetryBufferFull:
+            # writes are failing, the device keeps its readings and sends them again later
+            return Response({
+                "success": False,
+                "message": "Telemetry cannot be accepted right now, try again later",
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        return Response({
+            "success": True,
+            "data": {"accepted": len(readings)},
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class Utilization(APIView):
+    def get(self, request: Request):
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return Response({
+                "success": False,
+                "message": "You do not have access to the utilization analytics",
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        now = timezone.now()
+        try:
+            started_to = parse_aware_datetime(request.query_params['to']) if 'to' in request.query_params else now
+            started_from = (
+                parse_aware_datetime(request.query_params['from']) if 'from' in request.query_params
+                else started_to - datetime.timedelta(days=1)
+            )
+            if not started_from < started_to <= started_from + utilization.MAX_WINDOW:
+                raise ValueError()
+        except ValueError:
+            return Response({
+                "success": False,
+                "message": f"Window must be a valid from < to range of at most {utilization.MAX_WINDOW.days} days",
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "success": True,
+            "data": utilization.utilization(started_from, started_to, now),
+        })
+
+
+def parse_aware_datetime(value: str) -> datetime.datetime:
+    moment = datetime.datetime.fromisoformat(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
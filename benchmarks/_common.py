@@ -0,0 +1,40 @@
+
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# the benchmarks run as scripts from any directory, django and the api are imported from the checkout
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dacia_sandero_rent.settings')
+
+
+def setup(migrate: bool = True, temp_database: bool = True, **overrides):
+    # every run gets a database file of its own, nothing is measured against what an earlier run left behind
+    from django.conf import settings
+    if temp_database:
+        settings.DATABASES['default']['NAME'] = Path(tempfile.mkdtemp()) / 'bench.sqlite3'
+    settings.DEBUG = False
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    import django
+    django.setup()
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+
+def seed(**fleet) -> float:
+    # seconds seed_fleet took
+    from api.seeding import seed_fleet
+    started_at = time.perf_counter()
+    seed_fleet(**fleet)
+    return time.perf_counter() - started_at
+
+
+def percentile(values: list[float], percent: int) -> float:
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1] if len(values) > 1 else values[0]
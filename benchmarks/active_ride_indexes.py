@@ -0,0 +1,128 @@
+
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from _common import setup
+
+
+def seed(cursor, periods: int, clients: int, stations: int, transports: int):
+    now = datetime.now(timezone.utc)
+    cursor.execute("INSERT INTO api_transporttype (name) VALUES ('Car')")
+    cursor.execute("INSERT INTO api_transportclass (name, minimal_rating) VALUES ('Economy', 1)")
+    cursor.executemany(
+        "INSERT INTO api_transportmodel (type_id, classification_id, name, description, image) "
+        "VALUES (1, 1, ?, '', '')",
+        [(f"Model {i}",) for i in range(10)]
+    )
+    cursor.executemany(
+        "INSERT INTO api_parkingstation (address, short_name, max_cars) VALUES (?, ?, ?)",
+        [(f"Station {i}", f"S{i}", transports // stations * 2) for i in range(stations)]
+    )
+    cursor.executemany(
+        "INSERT INTO api_transport (model_id, parking_id, fuel, registry_number) VALUES (?, ?, 100, ?)",
+        [(random.randint(1, 10), random.randint(1, stations), f"R{i}") for i in range(transports)]
+    )
+    cursor.executemany(
+        "INSERT INTO api_client (password, is_superuser, username, first_name, last_name, email, is_staff, is_active, "
+        "date_joined, rating) VALUES ('', 0, ?, '', '', '', 0, 1, ?, 50)",
+        [(f"client{i}", now) for i in range(clients)]
+    )
+    cursor.execute("INSERT INTO api_plan (name, price, description, time_min) VALUES ('Hour', 300, '', 60)")
+
+    batch = 50_000
+    for offset in range(0, periods, batch):
+        rows = range(offset + 1, min(offset + batch, periods) + 1)
+        started = [now - timedelta(minutes=random.randint(60, 525_600)) for _ in rows]
+        cursor.executemany(
+            "INSERT INTO api_rentperiod (id, client_id, started_at, finished_at, plan_id, fine_overtime) "
+            "VALUES (?, ?, ?, ?, 1, 0)",
+            [(i, random.randint(1, clients), s, s + timedelta(minutes=45)) for i, s in zip(rows, started)]
+        )
+        cursor.executemany(
+            "INSERT INTO api_rentperiodcarusage (period_id, transport_id, started_at, finished_at, "
+            "starting_station_id, finishing_station_id) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (i, random.randint(1, transports), s, s + timedelta(minutes=45),
+                 random.randint(1, stations), random.randint(1, stations))
+                for i, s in zip(rows, started)
+            ]
+        )
+
+
+# the lookups of the ride methods as raw SQL: the models have moved on since 0002 and would select columns
+# that do not exist yet at 0001
+QUERIES = {
+    "active_rent_period": (
+        "SELECT id FROM api_rentperiod WHERE client_id = %s AND finished_at IS NULL LIMIT 1", 'client'
+    ),
+    "active_car_usage": (
+        "SELECT id FROM api_rentperiodcarusage WHERE period_id = %s AND finished_at IS NULL LIMIT 1", 'client'
+    ),
+    "used_by_client": (
+        "SELECT id FROM api_rentperiodcarusage WHERE transport_id = %s AND finished_at IS NULL "
+        "AND finishing_station_id IS NULL LIMIT 1", 'transport'
+    ),
+    "checkout_candidate": (
+        "SELECT id FROM api_transport WHERE model_id = %s AND parking_id = %s LIMIT 1", 'model_station'
+    ),
+}
+
+
+def measure(lookups: int, clients: int, stations: int, transports: int) -> dict[str, float]:
+    from django.db import connection
+
+    params = {
+        'client': [(random.randint(1, clients),) for _ in range(lookups)],
+        'transport': [(random.randint(1, transports),) for _ in range(lookups)],
+        'model_station': [(random.randint(1, 10), random.randint(1, stations)) for _ in range(lookups)],
+    }
+    results = {}
+    with connection.cursor() as cursor:
+        for name, (sql, kind) in QUERIES.items():
+            started_at = time.perf_counter()
+            for values in params[kind]:
+                cursor.execute(sql, values)
+                cursor.fetchone()
+            results[name] = (time.perf_counter() - started_at) / lookups * 1000
+        cursor.execute("SELECT COUNT(*) FROM api_rentperiod WHERE finished_at IS NULL")
+        assert cursor.fetchone()[0] == 0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Active-ride lookup latency before and after 0002_active_ride_indexes")
+    parser.add_argument("--periods", type=int, default=2_000_000)
+    parser.add_argument("--clients", type=int, default=5_000)
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--transports", type=int, default=5_000)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    # migrated by hand, to time the lookups on either side of the migration that adds the indexes
+    setup(migrate=False)
+    from django.core.management import call_command
+    from django.db import connection, transaction
+
+    random.seed(0)
+    call_command('migrate', 'api', '0001_initial', verbosity=0)
+    started_at = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        seed(cursor, args.periods, args.clients, args.stations, args.transports)
+    print(f"seeded {args.periods} finished periods and usages in {time.perf_counter() - started_at:.1f}s")
+
+    before = measure(args.lookups, args.clients, args.stations, args.transports)
+    call_command('migrate', 'api', '0002_active_ride_indexes', verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    after = measure(args.lookups, args.clients, args.stations, args.transports)
+
+    print(f"{'query':<22}{'before, ms':>12}{'after, ms':>12}")
+    for name in before:
+        print(f"{name:<22}{before[name]:>12.3f}{after[name]:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
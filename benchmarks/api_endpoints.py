@@ -0,0 +1,224 @@
+
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+from _common import percentile, seed, setup
+
+TELEMETRY_TOKEN = 'bench'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Endpoint:
+    def __init__(self, name: str, requests: int, prepare, call, before=None, after=None):
+        self.name = name
+        self.requests = requests
+        self.prepare = prepare
+        self.call = call
+        self.before = before
+        self.after = after
+
+
+def run_endpoint(endpoint: Endpoint, workers: int) -> dict:
+    from django.db import connection
+
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers)
+
+    # sessions are created up front, one at a time, so that only the measured requests compete for the database
+    states = [endpoint.prepare(worker_id) for worker_id in range(workers)]
+
+    def worker(worker_id: int):
+        state = states[worker_id]
+        barrier.wait()
+        for i in range(worker_id, endpoint.requests, workers):
+            if endpoint.before:
+                endpoint.before(state, i)
+            counter = QueryCounter()
+            started_at = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                response = endpoint.call(state, i)
+            elapsed = time.perf_counter() - started_at
+            if endpoint.after:
+                endpoint.after(state, i)
+            with lock:
+                latencies.append(elapsed * 1000)
+                queries.append(counter.count)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(worker_id,)) for worker_id in range(workers)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "requests": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "rps": len(latencies) / elapsed,
+        "queries": statistics.mean(queries),
+        "errors": len(errors),
+    }
+
+
+def build_endpoints(requests: int, workers: int) -> list[Endpoint]:
+    from django.test import Client as HttpClient
+
+    from api import rebalancing
+    from api.models import Client, ParkingStation, Transport
+    from api.seeding import CENTER, SEED_PASSWORD, SPREAD_DEGREES
+
+    users = list(Client.objects.order_by('id')[:workers * 2])
+    staff = Client.objects.create(username='benchmark-staff', is_staff=True)
+    stations = list(
+        ParkingStation.objects.filter(occupancy__gt=0).order_by('-occupancy').values_list('id', flat=True)[:workers]
+    )
+    models_by_station = defaultdict(list)
+    for station_id, model_id in Transport.objects.filter(parking_id__in=stations).values_list('parking_id', 'model_id'):
+        models_by_station[station_id].append(model_id)
+
+    def logged_in(user):
+        def prepare(worker_id):
+            client = HttpClient(raise_request_exception=False)
+            client.force_login(user(worker_id))
+            return client
+        return prepare
+
+    def anonymous(worker_id):
+        return HttpClient(raise_request_exception=False)
+
+    def ride(worker_id):
+        client = logged_in(lambda i: users[i])(worker_id)
+        station_id = stations[worker_id % len(stations)]
+        return client, station_id, models_by_station[station_id]
+
+    def start_ride(state, i):
+        client, station_id, model_ids = state
+        return client.post('/api/start_ride', {
+            'carId': model_ids[i % len(model_ids)], 'planId': 1, 'parkingStationId': station_id,
+        }, content_type='application/json')
+
+    def end_ride(state, i):
+        client, station_id, model_ids = state
+        return client.post('/api/end_ride', {'parkingStationId': station_id}, content_type='application/json')
+
+    rng = random.Random(0)
+    points = [
+        {'latitude': CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+         'longitude': CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES) * 2}
+        for _ in range(requests)
+    ]
+
+    transport_ids = list(Transport.objects.values_list('id', flat=True))
+    started = time.time()
+
+    def telemetry_batch(i):
+        # a gateway forwarding one reading of each of 50 transports
+        return json.dumps([
+            [rng.choice(transport_ids), started + i, rng.randint(0, 100),
+             CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+             CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES) * 2]
+            for _ in range(50)
+        ])
+
+    telemetry_batches = [telemetry_batch(i) for i in range(requests)]
+
+    def device(worker_id):
+        return HttpClient(raise_request_exception=False, headers={'Authorization': f'Bearer {TELEMETRY_TOKEN}'})
+
+    def open_stream(client, i):
+        # the stream never ends: the time to the first frame, which replays what the client missed
+        response = client.get('/api/events/stations', {'lastEventId': 0})
+        next(iter(response.streaming_content))
+        response.close()
+        return response
+
+    rebalancing.create_plan(staff)
+
+    # login and register pay for PBKDF2 and export streams the whole history, so they run fewer requests
+    return [
+        Endpoint('available_transport', requests, anonymous, lambda c, i: c.get('/api/available_transport')),
+        Endpoint('available_plans', requests, anonymous, lambda c, i: c.get('/api/available_plans')),
+        Endpoint('get_me', requests, logged_in(lambda i: users[i]), lambda c, i: c.get('/api/auth/get_me')),
+        Endpoint('login', max(workers, requests // 20), anonymous, lambda c, i: anonymous(i).post('/api/auth/login', {
+            'login': users[i % len(users)].username, 'password': SEED_PASSWORD,
+        }, content_type='application/json')),
+        Endpoint('register', max(workers, requests // 20), anonymous, lambda c, i: c.post('/api/auth/register', {
+            'email': f'benchmark{i}@example.com', 'username': f'benchmark{i}',
+            'password': SEED_PASSWORD, 'passwordCheck': SEED_PASSWORD,
+        }, content_type='application/json')),
+        Endpoint('logout', requests, anonymous, lambda c, i: c.get('/api/auth/logout')),
+        Endpoint('start_ride', requests, ride, start_ride, after=end_ride),
+        Endpoint('end_ride', requests, ride, end_ride, before=start_ride),
+        Endpoint('accounting_report', requests, logged_in(lambda i: staff),
+                 lambda c, i: c.get('/api/accounting/report', {'period': 'month'})),
+        Endpoint('export_rides', max(workers, requests // 20), logged_in(lambda i: staff),
+                 lambda c, i: consume(c.get('/api/export/rides'))),
+        Endpoint('nearest_stations', requests, anonymous, lambda c, i: c.get('/api/nearest_stations', points[i])),
+        Endpoint('events_stations', requests, anonymous, open_stream),
+        Endpoint('telemetry', requests, device,
+                 lambda c, i: c.post('/api/telemetry', telemetry_batches[i], content_type='application/json')),
+        Endpoint('rebalancing_plan', requests, logged_in(lambda i: staff), lambda c, i: c.get('/api/rebalancing/plan')),
+        Endpoint('utilization', requests, logged_in(lambda i: staff),
+                 lambda c, i: c.get('/api/analytics/utilization')),
+        Endpoint('ride_history', requests, logged_in(lambda i: users[i]), lambda c, i: c.get('/api/rides/history')),
+        Endpoint('metrics', requests, logged_in(lambda i: staff), lambda c, i: c.get('/api/metrics')),
+    ]
+
+
+def consume(response):
+    for _ in response.streaming_content:
+        pass
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process latency, throughput and query count of every api endpoint")
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--models", type=int, default=30)
+    parser.add_argument("--transports", type=int, default=10_000)
+    parser.add_argument("--clients", type=int, default=1_000)
+    parser.add_argument("--rides", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=400, help="Requests per endpoint")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent in-process clients")
+    parser.add_argument("--endpoint", action="append", dest="endpoints", help="Only run these endpoints")
+    args = parser.parse_args()
+
+    setup(API_TELEMETRY_TOKEN=TELEMETRY_TOKEN)
+    seconds = seed(stations=args.stations, models=args.models, transports=args.transports, clients=args.clients,
+                   rides=args.rides)
+    print(f"seeded {args.stations} stations, {args.transports} transports, {args.rides} rides "
+          f"in {seconds:.1f}s, {args.workers} workers\n")
+
+    print(f"{'endpoint':<20}{'requests':>9}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}"
+          f"{'req/s':>9}{'queries':>9}{'errors':>8}")
+    for endpoint in build_endpoints(args.requests, args.workers):
+        if args.endpoints and endpoint.name not in args.endpoints:
+            continue
+        result = run_endpoint(endpoint, args.workers)
+        print(f"{endpoint.name:<20}{result['requests']:>9}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+              f"{result['p99']:>10.2f}{result['rps']:>9.1f}{result['queries']:>9.1f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
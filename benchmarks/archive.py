@@ -0,0 +1,93 @@
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from _common import seed, setup
+
+
+def median_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reads over a year of rides, before and after archiving the old ones")
+    parser.add_argument("--transports", type=int, default=10_000)
+    parser.add_argument("--rides", type=int, default=500_000)
+    parser.add_argument("--older-than-days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from django.utils import timezone
+
+    from api import archive, export, utilization
+    from api.admin import CappedCountPaginator, keyset_page
+    from api.billing import fine_overdue_periods
+    from api.models import Client, ParkingStation, Plan, RentPeriod, RentPeriodCarUsage, Transport
+
+    seed(stations=500, transports=args.transports, clients=1000, rides=args.rides)
+    fine_overdue_periods(full=True)
+
+    # one rider on the road, so the active ride lookups find something
+    rider = Client.objects.order_by('id').first()
+    station = ParkingStation.objects.filter(occupancy__gt=0).first()
+    rider.start_rent_period(Plan.objects.values_list('id', flat=True).first())
+    car = rider.take_car(station.id, station.transport_set.values_list('model_id', flat=True).first())
+    now = timezone.now()
+
+    def active_ride():
+        Client.objects.get(id=rider.id).ride_state
+        Transport.objects.get(id=car.id).used_by_client
+
+    rides = RentPeriodCarUsage.objects.order_by('-id')
+    hot_rides = {}
+
+    def oldest_page_by_offset():
+        # OFFSET steps over every newer row; the capped count never even links this deep
+        list(rides[hot_rides['count'] - 100:hot_rides['count']])
+
+    def oldest_page_by_keyset():
+        # what following "Older" to the end asks for: the cursor the page before handed out
+        keyset_page(rides, 100, before=rides.order_by('id').values_list('id', flat=True).first() + 101)
+
+    def measure() -> dict:
+        hot_rides['count'] = rides.count()
+        return {name: median_ms(function, args.repeat) for name, function in reads}
+
+    reads = (
+        ("active ride lookup", active_ride),
+        ("billing run, incremental", fine_overdue_periods),
+        ("admin: capped count of rides", lambda: CappedCountPaginator(rides, 100).count),
+        ("admin: oldest page, OFFSET", oldest_page_by_offset),
+        ("admin: oldest page, keyset", oldest_page_by_keyset),
+        ("count of open periods", lambda: RentPeriod.objects.filter(finished_at__isnull=True).count()),
+        ("export: last 7 days", lambda: list(export.iter_rides(started_from=now - timedelta(days=7)))),
+        ("export: first 20k rides", lambda: list(zip(range(20_000), export.iter_rides()))),
+        ("client history, 50 rides", lambda: export.client_history(rider.id, limit=50)),
+        ("utilization: 30 days, cold", lambda: utilization.compute_buckets(
+            int((now - utilization.EPOCH).total_seconds()) // 3600 - 30 * 24,
+            int((now - utilization.EPOCH).total_seconds()) // 3600, int(now.timestamp()),
+        )),
+    )
+    before = measure()
+
+    started_at = time.perf_counter()
+    run = archive.archive_rentals(timedelta(days=args.older_than_days))
+    elapsed = time.perf_counter() - started_at
+    print(f"archived {run.archived_periods} periods and {run.archived_usages} rides in {elapsed:.1f}s "
+          f"({run.archived_usages / elapsed:,.0f} rides/s), {RentPeriodCarUsage.objects.count()} rides stay hot\n")
+
+    after = measure()
+    print(f"{'read':<32}{'before, ms':>12}{'after, ms':>12}")
+    for name, _ in reads:
+        print(f"{name:<32}{before[name]:>12.2f}{after[name]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+
+
+import argparse
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import percentile, seed, setup
+
+
+ENDPOINTS = {
+    'get_me': '/api/auth/get_me',
+    'available_transport': '/api/available_transport',
+    'available_plans': '/api/available_plans',
+}
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+    }
+
+
+def run_wsgi(path: str, cookie: str, requests: int, concurrency: int) -> dict:
+    # what a threaded WSGI server (gunicorn gthread, mod_wsgi) does: one request per worker thread
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connections
+
+    application = get_wsgi_application()
+
+    def request(_):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'bench',
+            'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_COOKIE': cookie, 'wsgi.input': io.BytesIO(),
+            'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr, 'wsgi.multithread': True,
+            'wsgi.multiprocess': False, 'wsgi.run_once': False, 'wsgi.version': (1, 0),
+        }
+        statuses = []
+        started_at = time.perf_counter()
+        response = application(environ, lambda status, headers: statuses.append(status))
+        for _ in response:
+            pass
+        response.close()
+        return (time.perf_counter() - started_at) * 1000, not statuses[0].startswith('200')
+
+    def close_connections(_):
+        connections.close_all()
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(request, range(requests)))
+        list(executor.map(close_connections, range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    return summarize([latency for latency, _ in results], sum(error for _, error in results), elapsed)
+
+
+def run_asgi(path: str, cookie: str, requests: int, concurrency: int) -> dict:
+    # what uvicorn or daphne do: every request is a coroutine on one event loop
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+
+    async def request(semaphore: asyncio.Semaphore):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'bench'), (b'cookie', cookie.encode())],
+            'server': ('bench', 80), 'client': ('127.0.0.1', 0),
+        }
+        finished = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            elif not message.get('more_body'):
+                finished.set()
+
+        async with semaphore:
+            started_at = time.perf_counter()
+            await application(scope, receive, send)
+            return (time.perf_counter() - started_at) * 1000, statuses[0] != 200
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(request(semaphore) for _ in range(requests)))
+
+    started_at = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - started_at
+    return summarize([latency for latency, _ in results], sum(error for _, error in results), elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent throughput of the read endpoints under ASGI and WSGI")
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--transports", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--concurrency", type=int, action="append", help="Concurrency levels, 1, 8 and 64 by default")
+    parser.add_argument("--endpoint", action="append", dest="endpoints", choices=list(ENDPOINTS))
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.test import Client as HttpClient
+
+    from api.models import Client
+
+    seed(stations=args.stations, transports=args.transports, clients=10, rides=args.transports)
+    http_client = HttpClient()
+    http_client.force_login(Client.objects.order_by('id').first())
+    cookie = f'{settings.SESSION_COOKIE_NAME}={http_client.cookies[settings.SESSION_COOKIE_NAME].value}'
+    print(f"seeded {args.stations} stations, {args.transports} transports\n")
+
+    print(f"{'endpoint':<22}{'server':<7}{'concurrency':>12}{'req/s':>10}{'p50, ms':>10}{'p99, ms':>10}{'errors':>8}")
+    for name in args.endpoints or ENDPOINTS:
+        for concurrency in args.concurrency or (1, 8, 64):
+            for server, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+                result = run(ENDPOINTS[name], cookie, args.requests, concurrency)
+                print(f"{name:<22}{server:<7}{concurrency:>12}{result['rps']:>10.1f}{result['p50']:>10.2f}"
+                      f"{result['p99']:>10.2f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+
+
+import argparse
+import statistics
+import time
+from unittest import mock
+
+from _common import seed, setup
+
+
+def timings_ms(function, repeat: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return statistics.median(timings), statistics.quantiles(timings, n=20)[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of auth/get_me and auth/login per session setup")
+    parser.add_argument("--clients", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--login-repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.db.models import Q
+    from django.test import Client as HttpClient, override_settings
+
+    from api import metrics
+    from api.cache import get_cache
+    from api.models import Client
+    from api.seeding import SEED_PASSWORD
+
+    seed(stations=1, models=1, transports=1, clients=args.clients)
+    user = Client.objects.order_by('-id').first()
+
+    def old_lookup(cls, login_):
+        # the unindexed lookup LoginView used before
+        return cls.objects.filter(Q(username=login_) | Q(email=login_.lower()))
+
+    setups = (
+        ("before: db sessions, ModelBackend", 'db', 'django.contrib.auth.backends.ModelBackend', True),
+        ("db sessions, cached client", 'db', 'api.auth.CachedModelBackend', False),
+        ("cached_db sessions, cached client", 'cached_db', 'api.auth.CachedModelBackend', False),
+        ("signed_cookies, cached client", 'signed_cookies', 'api.auth.CachedModelBackend', False),
+    )
+    print(f"{args.clients} clients, get_me x{args.repeat}, login by email x{args.login_repeat}\n")
+    print(f"{'setup':<38}{'get_me queries':>15}{'p50':>7}{'p95, ms':>9}{'login p50':>12}{'p95, ms':>9}")
+    for name, mode, backend, before in setups:
+        with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{mode}',
+                               AUTHENTICATION_BACKENDS=[backend]), \
+                mock.patch.object(Client, 'with_login', classmethod(old_lookup) if before else Client.with_login):
+            get_cache().clear()
+            http = HttpClient()
+            http.force_login(user)
+            assert http.get('/api/auth/get_me').json()["data"]["id"] == user.id
+            # counted by the metrics middleware, which follows the async view into its threads
+            metrics.registry.reset()
+            get_me = timings_ms(lambda: http.get('/api/auth/get_me'), args.repeat)
+            queries = metrics.registry.histograms['api_request_queries'][('get_me', 'GET')]
+
+            def log_in():
+                # the old lookup only matched emails given in lower case
+                login_ = user.email if before else user.email.upper()
+                response = HttpClient().post('/api/auth/login', {"login": login_, "password": SEED_PASSWORD},
+                                             content_type='application/json')
+                assert response.json()["success"]
+
+            login = timings_ms(log_in, args.login_repeat)
+        print(f"{name:<38}{queries.sum / queries.count:>15.0f}{get_me[0]:>7.2f}{get_me[1]:>9.2f}"
+              f"{login[0]:>12.1f}{login[1]:>9.1f}")
+
+    print(f"\n{'email lookup':<38}{'p50, ms':>12}{'p95, ms':>9}")
+    for name, queryset in (
+        ("before: username or email", lambda: old_lookup(Client, user.email).get()),
+        ("after: username or lower(email)", lambda: Client.with_login(user.email).get()),
+    ):
+        p50, p95 = timings_ms(queryset, args.repeat)
+        print(f"{name:<38}{p50:>12.3f}{p95:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import io
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from _common import seed, setup
+
+
+def photo(width: int, height: int, quality: int) -> bytes:
+    # a camera-sized JPEG: smooth gradients under blurred noise, about as hard to compress as a car photo
+    from PIL import Image, ImageFilter
+    channels = [
+        Image.linear_gradient('L').resize((width, height)),
+        Image.radial_gradient('L').resize((width, height)),
+        Image.effect_noise((width, height), 64).filter(ImageFilter.GaussianBlur(2)),
+    ]
+    texture = Image.effect_noise((width, height), 24)
+    image = Image.merge('RGB', [Image.blend(channel, texture, 0.3) for channel in channels])
+    content = io.BytesIO()
+    image.save(content, 'JPEG', quality=quality)
+    return content.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes a phone downloads for model images and the cost of resizing")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--models", type=int, default=20, help="models shown by one station listing")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup(MEDIA_ROOT=Path(tempfile.mkdtemp()))
+    from django.core.files.base import ContentFile
+    from django.db import transaction
+    from PIL import Image
+
+    from api import images
+    from api.models import TransportModel
+
+    seed(stations=1, models=1, transports=1, clients=1)
+    model = TransportModel.objects.get()
+    storage = TransportModel._meta.get_field('image').storage
+    original = photo(args.width, args.height, 90)
+
+    def save(generate_inline: bool) -> float:
+        model.image = ContentFile(original, name='photo.jpg')
+        started_at = time.perf_counter()
+        if generate_inline:
+            # what the save would cost if the request resized the image itself
+            with mock.patch.object(images, 'schedule'), transaction.atomic():
+                model.save()
+            images.generate(model.id, model.image.name)
+        else:
+            with transaction.atomic():
+                model.save()
+        return (time.perf_counter() - started_at) * 1000
+
+    def median_ms(function) -> float:
+        return statistics.median(function() for _ in range(args.repeat))
+
+    inline = median_ms(lambda: save(True))
+    images.executor.shutdown(wait=True)
+    images.executor = ThreadPoolExecutor(max_workers=images.WORKERS)
+    background = median_ms(lambda: save(False))
+    images.executor.shutdown(wait=True)
+
+    def render_ms(draft: bool) -> float:
+        def render():
+            started_at = time.perf_counter()
+            with Image.open(io.BytesIO(original)) as image:
+                if draft:
+                    image.draft('RGB', (max(images.VARIANTS.values()),) * 2)
+                image = image.copy()
+                for size in sorted(images.VARIANTS.values(), reverse=True):
+                    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            return (time.perf_counter() - started_at) * 1000
+        return median_ms(render)
+
+    model.refresh_from_db()
+    print(f"{args.width}x{args.height} JPEG upload, {len(original) / 1024:,.0f} KiB\n")
+    listing, dimensions = f"x{args.models} models, KiB", f"{args.width}x{args.height}"
+    print(f"{'image':<24}{'size':>12}{'KiB':>10}{listing:>22}")
+    print(f"{'original':<24}{dimensions:>12}{len(original) / 1024:>10.1f}{len(original) * args.models / 1024:>22,.0f}")
+    for variant, entry in sorted(model.image_variants.items(), key=lambda item: item[1]['width']):
+        dimensions = f"{entry['width']}x{entry['height']}"
+        for image_format, name in sorted(entry['files'].items()):
+            size = storage.size(name)
+            label = f"{variant} {image_format}"
+            print(f"{label:<24}{dimensions:>12}{size / 1024:>10.1f}{size * args.models / 1024:>22,.0f}")
+
+    print(f"\nadmin save with resizing in the request {inline:>8.1f} ms")
+    print(f"admin save, resized by a worker thread  {background:>8.1f} ms")
+    print(f"decode and resize, full decode          {render_ms(False):>8.1f} ms")
+    print(f"decode and resize, JPEG draft decode    {render_ms(True):>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+
+
+import argparse
+import random
+import time
+
+from _common import percentile, seed, setup
+
+
+def report(name: str, latencies: list[float]):
+    print(f"{name:<34}{len(latencies):>9}{percentile(latencies, 50):>10.3f}{percentile(latencies, 95):>10.3f}"
+          f"{percentile(latencies, 99):>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of the nearest station search")
+    parser.add_argument("--stations", type=int, default=50_000)
+    parser.add_argument("--transports", type=int, default=150_000)
+    parser.add_argument("--models", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from django.test import Client as HttpClient
+
+    from api import cache, geo
+    from api.models import TransportModel
+    from api.seeding import CENTER, SPREAD_DEGREES
+
+    seconds = seed(stations=args.stations, models=args.models, transports=args.transports, clients=1)
+    print(f"seeded {args.stations} stations, {args.transports} transports in {seconds:.1f}s")
+
+    started_at = time.perf_counter()
+    geo.refresh()
+    print(f"index of {len(geo.index)} stations loaded in {(time.perf_counter() - started_at) * 1000:.1f} ms")
+    started_at = time.perf_counter()
+    cache.warm()
+    print(f"inventory cache warmed in {time.perf_counter() - started_at:.1f}s\n")
+
+    rng = random.Random(0)
+    points = [
+        (CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+         CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES) * 2)
+        for _ in range(args.queries)
+    ]
+    model_ids = list(TransportModel.objects.values_list('id', flat=True))
+
+    print(f"{'search':<34}{'queries':>9}{'p50, ms':>10}{'p95, ms':>10}{'p99, ms':>10}")
+    latencies = []
+    for latitude, longitude in points:
+        started_at = time.perf_counter()
+        for _ in zip(range(args.limit), geo.index.iter_nearest(latitude, longitude)):
+            pass
+        latencies.append((time.perf_counter() - started_at) * 1000)
+    report(f"index only, {args.limit} nearest", latencies)
+
+    client = HttpClient()
+    for name, extra in (("any transport", lambda: {}), ("given model", lambda: {'modelId': rng.choice(model_ids)})):
+        latencies = []
+        for latitude, longitude in points:
+            params = {'latitude': latitude, 'longitude': longitude, 'limit': args.limit, **extra()}
+            started_at = time.perf_counter()
+            response = client.get('/api/nearest_stations', params)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            assert response.status_code == 200, response.content
+        report(f"endpoint, {name}", latencies)
+
+
+if __name__ == '__main__':
+    main()
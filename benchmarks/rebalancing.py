@@ -0,0 +1,42 @@
+
+
+import argparse
+import random
+import time
+
+from _common import seed, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to plan the rebalancing of an unbalanced fleet")
+    parser.add_argument("--stations", type=int, default=5_000)
+    parser.add_argument("--transports", type=int, default=300_000)
+    parser.add_argument("--models", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    setup()
+    from api import rebalancing
+    from api.models import ParkingStation
+
+    started_at = time.perf_counter()
+    seed(stations=args.stations, models=args.models, transports=args.transports, clients=1)
+    # seeding respects the capacity, shrinking it afterwards leaves the fleet both overflowing and short
+    rng = random.Random(0)
+    stations = list(ParkingStation.objects.all())
+    average = args.transports // args.stations
+    for station in stations:
+        station.max_cars = rng.randint(max(1, average // 2), average * 2)
+    ParkingStation.objects.bulk_update(stations, ['max_cars'], batch_size=5000)
+    print(f"seeded {args.stations} stations, {args.transports} transports in {time.perf_counter() - started_at:.1f}s\n")
+
+    for _ in range(args.repeat):
+        started_at = time.perf_counter()
+        plan = rebalancing.create_plan()
+        elapsed = time.perf_counter() - started_at
+        print(f"plan #{plan.id}: {plan.moves.count()} moves of {plan.moved_transports} transports, "
+              f"{plan.unresolved_overflow} unplaced, {plan.unresolved_shortage} unfilled, {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+
+
+import argparse
+import statistics
+import time
+from collections import defaultdict
+
+from _common import seed, setup
+
+
+def best_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return min(timings), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Building and rendering the station inventory payload")
+    parser.add_argument("--stations", type=int, default=5_000)
+    parser.add_argument("--transports", type=int, default=50_000)
+    parser.add_argument("--models", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    setup()
+    from django.db.models import Count
+    from rest_framework.renderers import JSONRenderer
+
+    from api.inventory import build_station_inventory
+    from api.models import ParkingStation, Plan, Transport, TransportModel
+    from api.renderers import FastJSONRenderer
+    from api import serialization
+
+    seed(stations=args.stations, models=args.models, transports=args.transports, clients=1)
+
+    def inventory_from_instances():
+        # the way the inventory was built before: model instances and their as_dict properties
+        rows = list(Transport.objects.filter(parking__isnull=False).values('parking_id', 'model_id')
+                    .annotate(count=Count('id')).order_by('parking_id', 'model_id'))
+        counts = defaultdict(list)
+        for row in rows:
+            counts[row['parking_id']].append((row['model_id'], row['count']))
+        models = TransportModel.objects.filter(id__in={row['model_id'] for row in rows}).select_related(
+            'type', 'classification'
+        )
+        models_by_id = {model.id: model.as_dict for model in models}
+        return [
+            {
+                "id": station.id, "address": station.address, "shortName": station.short_name,
+                "maxCars": station.max_cars, "occupancy": station.occupancy,
+                "latitude": station.latitude, "longitude": station.longitude,
+                "availableModels": [
+                    {**models_by_id[model_id], "count": count} for model_id, count in counts[station.id]
+                ],
+            }
+            for station in ParkingStation.objects.order_by('id')
+        ]
+
+    payload = {"success": True, "data": build_station_inventory()}
+    rendered = JSONRenderer().render(payload)
+    assert JSONRenderer().render({"success": True, "data": inventory_from_instances()}) == rendered
+    assert FastJSONRenderer().render(payload) == rendered
+    print(f"inventory of {args.stations} stations, {len(rendered) / 1e6:.1f} MB of JSON\n")
+
+    print(f"{'step':<40}{'best, ms':>10}{'median, ms':>12}")
+    for name, function in (
+        ("build: instances + as_dict", inventory_from_instances),
+        ("build: .values() rows", build_station_inventory),
+        ("render: DRF JSONRenderer", lambda: JSONRenderer().render(payload)),
+        ("render: FastJSONRenderer", lambda: FastJSONRenderer().render(payload)),
+        ("plans: as_dict + DRF JSONRenderer", lambda: JSONRenderer().render(
+            {"success": True, "data": [plan.as_dict for plan in Plan.objects.all()]})),
+        ("plans: .values() + FastJSONRenderer", lambda: FastJSONRenderer().render(
+            {"success": True, "data": [serialization.plan(row) for row in serialization.plans_queryset()]})),
+    ):
+        best, median = best_ms(function, args.repeat)
+        print(f"{name:<40}{best:>10.1f}{median:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
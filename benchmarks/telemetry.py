@@ -0,0 +1,56 @@
+
+
+import argparse
+import json
+import random
+import time
+
+from _common import seed, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry readings per second through the ingestion endpoint")
+    parser.add_argument("--transports", type=int, default=10_000)
+    parser.add_argument("--batch", type=int, default=200, help="readings per request")
+    parser.add_argument("--readings", type=int, default=200_000)
+    args = parser.parse_args()
+
+    setup(API_TELEMETRY_TOKEN='bench')
+    from django.test import Client as HttpClient
+
+    from api import telemetry
+    from api.models import TelemetryReading, Transport
+
+    seed(stations=max(1, args.transports // 10), transports=args.transports, clients=1)
+    transport_ids = list(Transport.objects.values_list('id', flat=True))
+
+    rng = random.Random(0)
+    started = time.time() - args.readings
+    bodies = {'application/json': [], 'application/x-ndjson': []}
+    for offset in range(0, args.readings, args.batch):
+        readings = [
+            [rng.choice(transport_ids), started + offset + i, rng.randint(0, 100),
+             55.75 + rng.uniform(-0.2, 0.2), 37.61 + rng.uniform(-0.4, 0.4)]
+            for i in range(args.batch)
+        ]
+        bodies['application/json'].append(json.dumps(readings))
+        bodies['application/x-ndjson'].append('\n'.join(json.dumps(dict(zip(telemetry.READING_FIELDS, reading)))
+                                                        for reading in readings))
+
+    client = HttpClient(headers={'Authorization': 'Bearer bench'})
+    for content_type, batches in bodies.items():
+        TelemetryReading.objects.all().delete()
+        Transport.objects.update(fuel_reported_at=None)
+        started_at = time.perf_counter()
+        for body in batches:
+            response = client.post('/api/telemetry', body, content_type=content_type)
+            assert response.status_code == 202, response.content
+        telemetry.buffer.flush()
+        elapsed = time.perf_counter() - started_at
+        assert TelemetryReading.objects.count() == args.readings
+        print(f"{content_type:<24}{args.readings:>9} readings, {args.batch} per request{elapsed:>8.1f}s "
+              f"{args.readings / elapsed:>10.0f} readings/s")
+
+
+if __name__ == '__main__':
+    main()
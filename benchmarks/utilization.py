@@ -0,0 +1,36 @@
+
+
+import argparse
+import time
+from datetime import timedelta
+
+from _common import seed, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold and cached utilization analytics over seeded ride history")
+    parser.add_argument("--stations", type=int, default=500)
+    parser.add_argument("--transports", type=int, default=10_000)
+    parser.add_argument("--rides", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    setup()
+    from django.utils import timezone
+
+    from api import utilization
+
+    seconds = seed(stations=args.stations, transports=args.transports, clients=1000, rides=args.rides)
+    print(f"seeded {args.rides} rides in {seconds:.1f}s\n")
+
+    now = timezone.now()
+    for name in ("cold", "cached", "cached"):
+        started_at = time.perf_counter()
+        data = utilization.utilization(now - timedelta(days=args.days), now)
+        elapsed = (time.perf_counter() - started_at) * 1000
+        print(f"{name:<8}{len(data['series']):>6} hours{sum(bucket['departures'] for bucket in data['series']):>9} "
+              f"rides{elapsed:>10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import multiprocessing
+import time
+
+from _common import seed, setup
+
+# every profile runs in a process of its own, the database settings are fixed once django is set up
+PROFILES = {
+    'sqlite: before': {'database': 'sqlite', 'tuned': False, 'conn_max_age': 0},
+    'sqlite: profile': {'database': 'sqlite', 'tuned': True, 'conn_max_age': None},
+    'postgres: per request': {'database': 'postgres', 'conn_max_age': 0},
+    'postgres: profile': {'database': 'postgres', 'conn_max_age': 60},
+}
+
+
+def configure(profile: dict, name: str):
+    from django.conf import settings
+    database = settings.DATABASES['default']
+    if profile['database'] == 'sqlite':
+        if not profile['tuned']:
+            # what settings.py had before the profiles: django's defaults
+            database['ENGINE'] = 'django.db.backends.sqlite3'
+            database['OPTIONS'] = {}
+    else:
+        import psycopg
+        with psycopg.connect(host=database['HOST'], port=database['PORT'], user=database['USER'],
+                             password=database['PASSWORD'], dbname='postgres', autocommit=True) as connection:
+            connection.execute(f'DROP DATABASE IF EXISTS {name}')
+            connection.execute(f'CREATE DATABASE {name}')
+        database['NAME'] = name
+    database['CONN_MAX_AGE'] = profile['conn_max_age']
+
+
+def run_profile(name: str, args) -> dict:
+    profile = PROFILES[name]
+    os.environ['API_DATABASE'] = profile['database']
+    configure(profile, 'bench_write_contention')
+    # sqlite gets a file of its own, postgres the database configure just made
+    setup(temp_database=profile['database'] == 'sqlite')
+    from django.db import OperationalError, close_old_connections, connection
+    from django.db.models import Count
+    from django.test import Client as HttpClient
+
+    from api.models import Client, Plan, Transport
+
+    seed(stations=args.writers * 2, models=2, transports=args.writers * 20, clients=args.writers, seed=1)
+    plan_id = Plan.objects.values_list('id', flat=True).first()
+    # every writer rents from a station of its own and returns the car there, so the fleet never runs dry
+    pairs = list(Transport.objects.filter(parking__isnull=False).values('parking_id', 'model_id')
+                 .annotate(count=Count('id')).order_by('parking_id', '-count').values_list('parking_id', 'model_id'))
+    pairs = list({station_id: (station_id, model_id) for station_id, model_id in reversed(pairs)}.values())
+    users = list(Client.objects.order_by('id')[:args.writers])
+    connection.close()
+
+    # workers are processes, like the ones of a production server: threads of one process would queue for
+    # the GIL while holding the database lock
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(args.writers + args.readers)
+    queue = context.Queue()
+
+    def request(http: HttpClient, outcomes: dict, method: str, path: str, data=None) -> str:
+        started_at = time.perf_counter()
+        try:
+            if method == 'post':
+                response = http.post(path, data, content_type='application/json')
+            else:
+                response = http.get(path)
+            outcome = 'ok' if response.status_code == 200 else 'failed'
+        except OperationalError as error:
+            outcome = 'locked' if 'locked' in str(error) else 'failed'
+        finally:
+            # what the server does once a response is sent: connections past CONN_MAX_AGE are closed
+            close_old_connections()
+        if outcome == 'ok':
+            outcomes['timings'].append((time.perf_counter() - started_at) * 1000)
+        else:
+            outcomes[outcome] += 1
+        return outcome
+
+    def writer(user, station_id: int, model_id: int):
+        http = HttpClient()
+        http.force_login(user)
+        close_old_connections()
+        outcomes = {'kind': 'write', 'rides': 0, 'locked': 0, 'failed': 0, 'timings': []}
+        barrier.wait()
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            outcome = request(http, outcomes, 'post', '/api/start_ride', {
+                'carId': model_id, 'planId': plan_id, 'parkingStationId': station_id,
+            })
+            if outcome != 'ok':
+                continue
+            # the rider still holds the car, a return that hit the lock is tried again
+            while request(http, outcomes, 'post', '/api/end_ride', {'parkingStationId': station_id}) == 'locked':
+                pass
+            outcomes['rides'] += 1
+        queue.put(outcomes)
+
+    def reader():
+        http = HttpClient()
+        outcomes = {'kind': 'read', 'rides': 0, 'locked': 0, 'failed': 0, 'timings': []}
+        barrier.wait()
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            request(http, outcomes, 'get', '/api/available_transport')
+        queue.put(outcomes)
+
+    processes = [
+        context.Process(target=writer, args=(user, *pair)) for user, pair in zip(users, pairs)
+    ] + [context.Process(target=reader) for _ in range(args.readers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    def percentiles(timings: list) -> tuple:
+        if len(timings) < 2:
+            return None, None
+        return statistics.median(timings), statistics.quantiles(timings, n=20)[-1]
+
+    def timings(kind: str) -> list[float]:
+        return [timing for result in results if result['kind'] == kind for timing in result['timings']]
+
+    return {
+        'ridesPerSecond': sum(result['rides'] for result in results) / args.seconds,
+        'write': percentiles(timings('write')),
+        'read': percentiles(timings('read')),
+        'locked': sum(result['locked'] for result in results),
+        'failed': sum(result['failed'] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent start_ride/end_ride writers against each database profile")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profile", choices=PROFILES, action="append",
+                        help="postgres profiles connect with the API_DB_* variables, to a database of their own")
+    parser.add_argument("--child", choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_profile(args.child, args)))
+        return
+
+    print(f"{args.writers} writers renting and returning, {args.readers} readers of available_transport, "
+          f"{args.seconds:g}s per profile\n")
+    print(f"{'profile':<24}{'rides/s':>9}{'write p50':>11}{'p95, ms':>9}{'read p50':>10}{'p95, ms':>9}"
+          f"{'locked':>8}{'failed':>8}")
+    for name in args.profile or [name for name in PROFILES if name.startswith('sqlite')]:
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', name, '--writers', str(args.writers),
+             '--readers', str(args.readers), '--seconds', str(args.seconds)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        cells = [f"{value:.1f}" if value is not None else "-" for value in (*result['write'], *result['read'])]
+        print(f"{name:<24}{result['ridesPerSecond']:>9.1f}{cells[0]:>11}{cells[1]:>9}{cells[2]:>10}{cells[3]:>9}"
+              f"{result['locked']:>8}{result['failed']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -28,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,6 +46,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -67,16 +75,158 @@ TEMPLATES = [
 WSGI_APPLICATION = 'dacia_sandero_rent.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# the database profile comes from the environment: API_DATABASE is "sqlite" (the default) or "postgres"
+API_DATABASE = os.environ.get('API_DATABASE', 'sqlite')
+
+
+def _conn_max_age(default):
+    # seconds a connection is reused across requests, "none" keeps it for good
+    value = os.environ.get('API_DB_CONN_MAX_AGE')
+    if value is None:
+        return default
+    return None if value.lower() == 'none' else int(value)
+
+
+if API_DATABASE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # django's sqlite backend with API_SQLITE_PRAGMAS applied to every connection and transactions that
+            # take the write lock when they begin
+            'ENGINE': 'api.backends.sqlite3',
+            'NAME': os.environ.get('API_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            # opening the file and applying the pragmas is paid once per thread instead of once per request
+            'CONN_MAX_AGE': _conn_max_age(None),
+            'OPTIONS': {
+                # seconds a writer waits for the lock before failing with "database is locked" (busy_timeout)
+                'timeout': float(os.environ.get('API_DB_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+elif API_DATABASE == 'postgres':
+    # needs psycopg. under ASGI every request runs its queries in a thread of its own, so reused connections
+    # pile up: set API_DB_CONN_MAX_AGE=0 there and pool with pgbouncer
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('API_DB_NAME', 'dacia_sandero_rent'),
+            'USER': os.environ.get('API_DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('API_DB_PASSWORD', ''),
+            'HOST': os.environ.get('API_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('API_DB_PORT', '5432'),
+            'CONN_MAX_AGE': _conn_max_age(60),
+            # a reused connection the server has dropped is replaced before the request uses it
+            'CONN_HEALTH_CHECKS': True,
+            # pgbouncer in transaction mode hands the server connection to someone else after every
+            # transaction, a server-side cursor cannot outlive it
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('API_DB_POOLER') == 'pgbouncer',
+        }
     }
+else:
+    raise ImproperlyConfigured(f'Unknown API_DATABASE {API_DATABASE!r}, expected "sqlite" or "postgres"')
+
+# WAL lets readers carry on while one connection writes, and with it synchronous=NORMAL is still safe from
+# corruption, only the last commits before a power loss may be lost
+API_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
 }
 
+# a cache every process shares, e.g. redis://localhost:6379/0 (needs redis). without it each process caches
+# in its own memory and never sees what the others drop: with several workers a station or plan changed
+# through one of them stays stale in the others for up to API_CACHE_TIMEOUT. run more than one worker
+# only with a shared cache, or lower API_CACHE_TIMEOUT to the staleness the fleet can live with
+API_CACHE_URL = os.environ.get('API_CACHE_URL')
+if API_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': API_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'dacia_sandero_rent',
+            # inventory is cached per station, the default of 300 entries would keep evicting it
+            'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+        }
+    }
+
+# seconds the inventory and plan payloads are kept, a change to them bumps their version before that
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+
+OVERTIME_FINE_PER_MINUTE = 10
+
+REFUEL_COST_PER_PERCENT = 5
+
+# scrapers may authenticate with "Authorization: Bearer <token>", staff users always can
+API_METRICS_TOKEN = None
+
+# requests slower than this are logged with their SQL, None turns the sampler off
+API_SLOW_REQUEST_MS = None
+API_SLOW_REQUEST_SAMPLES = 10
+
+# station availability events kept for resuming subscribers, and seconds between keep-alive comments
+API_EVENTS_HISTORY = 1000
+API_EVENTS_HEARTBEAT = 15
+
+# cell size of the in-memory nearest station grid, about 2 km
+API_GEO_CELL_DEGREES = 0.02
+
+# rebalancing fills stations under this share of max_cars and may take cars from stations above the other one
+REBALANCE_MIN_FILL = 0.2
+REBALANCE_MAX_FILL = 0.8
+
+# seconds a finished hour of utilization analytics stays cached
+API_UTILIZATION_CACHE_TIMEOUT = 24 * 3600
+
+# admin changelists of large tables count at most this many rows
+API_ADMIN_COUNT_LIMIT = 10_000
+
+# finished rentals move to the archive tables this many days after they end, this many periods per transaction
+API_ARCHIVE_AFTER_DAYS = 90
+API_ARCHIVE_BATCH_SIZE = 1000
+
+# transport model images get variants fitted into these boxes, in every one of the formats; worker threads
+# resize them after the save, manage.py generate_image_variants fills in older images
+API_IMAGE_VARIANTS = {'thumbnail': 240, 'medium': 960}
+API_IMAGE_FORMATS = ('webp', 'jpeg')
+API_IMAGE_WORKERS = 2
+
+# vehicles send telemetry with "Authorization: Bearer <token>"; readings are written once this many
+# have gathered or the oldest waited this many seconds. while writes fail at most API_TELEMETRY_MAX_BUFFERED
+# readings are held, beyond that new batches get 503
+API_TELEMETRY_TOKEN = None
+API_TELEMETRY_BUFFER_SIZE = 5000
+API_TELEMETRY_FLUSH_SECONDS = 1.0
+API_TELEMETRY_MAX_BUFFERED = 50_000
+
+# where sessions live: "db", "cached_db" (read from the cache, written through to the database) or
+# "signed_cookies" (kept by the browser alone, so a copied cookie stays valid until it expires, even after logout).
+# cached_db needs the shared cache: a session logged out in one process would stay valid in the memory of the others
+API_SESSION_MODE = os.environ.get('API_SESSION_MODE', 'cached_db' if API_CACHE_URL else 'db')
+if API_SESSION_MODE == 'cached_db' and not API_CACHE_URL:
+    raise ImproperlyConfigured('API_SESSION_MODE "cached_db" needs a shared cache, set API_CACHE_URL')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[API_SESSION_MODE]
+
+# seconds the authenticated client is cached between requests, saving a client drops it
+API_CLIENT_CACHE_TIMEOUT = 300
+
 
 AUTH_USER_MODEL = "api.Client"
 
+# clients are cached only in the shared cache, for the same reason: a process's own copy of a deactivated client
+# would still be let in
+AUTHENTICATION_BACKENDS = [
+    'api.auth.CachedModelBackend' if API_CACHE_URL else 'django.contrib.auth.backends.ModelBackend',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',